@@ -0,0 +1,128 @@
+"""
+ASR 跨会话动态批处理
+
+
+模块功能
+1. 收集多个会话的待识别音频, 在一个时间窗口内 (或达到最大批大小时) 合并为一批
+2. 一批音频只调用一次识别引擎, 共享一次前向计算
+3. 识别结果按提交顺序分发回各个等待的会话
+
+注意:
+    批处理只改变识别引擎的调用方式, 识别结果写回 Redis 仍由各会话的任务完成
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("asr_server.batching")
+
+
+class BatchScheduler:
+    """
+    动态批处理调度器
+
+    参数:
+        infer_fn (callable): 异步批量识别函数, 参数为 (输入列表, timings=耗时字典),
+                             返回等长的结果列表
+        window_ms (float): 收到第一条输入后等待更多输入的时间窗口 (单位: 毫秒)
+        max_batch_size (int): 单批最大输入数量, 达到后立即执行
+        max_concurrent_batches (int): 同时执行的批次数量
+
+    示例:
+        >>> batcher = BatchScheduler(inference_pool.infer, 30, 8, 2)
+        >>> task = asyncio.create_task(batcher.run())
+        >>> result = await batcher.submit(audio_input)
+    """
+
+    def __init__(self, infer_fn, window_ms, max_batch_size, max_concurrent_batches=1):
+        self.infer_fn = infer_fn
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.queue = asyncio.Queue()
+        self.batch_slots = asyncio.Semaphore(max_concurrent_batches)
+        self.batch_tasks = set()
+
+        # 统计信息
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, audio_input, timings: dict = None):
+        """
+        提交一条待识别输入, 等待所在批次完成
+
+        参数:
+            audio_input: 识别引擎可接受的输入 (文件路径或采样数组)
+            timings (dict): 可选, 写入耗时 (秒):
+                - batch_wait : 提交到所在批次开始执行
+                - pool_queue : 批次在推理工作池中的排队耗时
+                - inference  : 批次推理耗时
+                以及所在批次的大小 batch_size
+
+        返回:
+            dict: 该输入的识别结果, 如 {'key': ..., 'text': ...}
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((audio_input, future, timings, time.monotonic()))
+        return await future
+
+    async def run(self):
+        """后台批处理任务: 收集一批输入并交给识别引擎"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # 等待执行槽位, 执行中的批次越久, 下一批收集到的输入越多
+                await self.batch_slots.acquire()
+                batch = [await self.queue.get()]
+                deadline = loop.time() + self.window
+
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                task = asyncio.create_task(self._run_batch(batch))
+                self.batch_tasks.add(task)
+                task.add_done_callback(self.batch_tasks.discard)
+        finally:
+            for task in list(self.batch_tasks):
+                task.cancel()
+
+    async def _run_batch(self, batch):
+        try:
+            inputs = [item[0] for item in batch]
+            logger.info("执行 ASR 批处理, 批大小: %d", len(inputs))
+
+            batch_start = time.monotonic()
+            batch_timings = {}
+            results = await self.infer_fn(inputs, timings=batch_timings)
+            if len(results) != len(inputs):
+                raise RuntimeError(
+                    f"识别结果数量 {len(results)} 与输入数量 {len(inputs)} 不一致"
+                )
+
+            self.batches += 1
+            self.items += len(inputs)
+            for (_, future, timings, submit_time), result in zip(batch, results):
+                if timings is not None:
+                    timings.update(
+                        batch_wait=batch_start - submit_time,
+                        pool_queue=batch_timings.get("queue", 0.0),
+                        inference=batch_timings.get("inference", 0.0),
+                        batch_size=len(inputs),
+                    )
+                if not future.done():
+                    future.set_result(result)
+
+        except Exception as e:
+            for item in batch:
+                future = item[1]
+                if not future.done():
+                    future.set_exception(e)
+
+        finally:
+            self.batch_slots.release()
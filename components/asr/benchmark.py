@@ -0,0 +1,391 @@
+"""
+ASR 容量压测工具
+
+
+在本进程中按 main.py 的配置启动完整的 ASR 服务组件 (推理工作池, 批处理, 截止时间调度, 任务流消费者),
+使用一个目录下的 WAV 片段作为请求, 连接本地 Redis 压测, 输出:
+    - 整体实时率 (处理墙钟时间 / 音频总时长) 和可支撑的实时音频路数
+    - 延迟 p50/p95/p99, 拆分为排队, IO, 预处理, 推理
+    - CPU 利用率, 峰值内存 (主进程和推理子进程)
+
+压测模式:
+    task  : 直接调用 process_asr_task (不经过任务流)
+    queue : 完整队列路径, 写入任务流, 由消费者组领取, 从 ASR 输出队列取回结果
+
+到达模式:
+    closed  : --concurrency 个客户端, 每个客户端收到结果后立即发送下一条
+    poisson : 开环, 平均每秒 --rate 条 (指数分布间隔)
+    burst   : 每 --burst-interval 秒同时发送 --concurrency 条
+
+注意:
+    - 使用独立的任务流, 输出队列和消费者组 (bench:{run_id}:*), 不影响线上任务
+    - 结果可输出为 JSON (--json), 通过 --label 区分不同后端和批处理配置后对比
+
+示例:
+    python benchmark.py ./clips --mode task --concurrency 16 --requests 500
+    python benchmark.py ./clips --mode queue --arrival poisson --rate 20 --backend onnx \\
+        --label onnx-b8 --json onnx-b8.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import time
+import uuid
+
+import main
+from engine import InferencePool, percentiles
+
+BENCH_PREFIX = "bench"
+
+
+def load_clips(audio_dir: str) -> list:
+    """
+    读取目录下的 WAV 片段
+
+    返回:
+        list[tuple]: [(文件名, WAV 数据, 音频时长(秒))]
+    """
+    clips = []
+    for name in sorted(os.listdir(audio_dir)):
+        if not name.lower().endswith(".wav"):
+            continue
+        with open(os.path.join(audio_dir, name), "rb") as f:
+            data = f.read()
+        samples = main.decode_audio_input(data, main.ASR_SAMPLE_RATE)
+        if samples is None:
+            print(f"跳过无法解析的文件 (仅支持 16 位 WAV): {name}")
+            continue
+        clips.append((name, data, len(samples) / main.ASR_SAMPLE_RATE))
+    return clips
+
+
+def configure(args, run_id: str):
+    """按命令行参数覆盖 main.py 的配置, 压测使用独立的 Redis 键"""
+    main.REDIS_HOST = args.redis_host
+    main.REDIS_PORT = args.redis_port
+    main.ASR_STREAMING_ENABLED = False
+
+    main.ASR_BATCH_WINDOW_MS = args.batch_window_ms
+    main.ASR_BATCH_MAX_SIZE = args.batch_size
+    main.ASR_WORKERS = args.workers
+
+    main.ASR_INPUT_STREAM_KEY = f"{BENCH_PREFIX}:{run_id}:asr_input_stream"
+    main.ASR_OUTPUT_QUEUE_KEY = f"{BENCH_PREFIX}:{run_id}:asr_output_queue"
+    main.ASR_DEAD_LETTER_KEY = f"{BENCH_PREFIX}:{run_id}:asr_dead_letter"
+    main.ASR_CONSUMER_GROUP = f"{BENCH_PREFIX}:{run_id}"
+
+    main.inference_pool = InferencePool(
+        mode=args.worker_mode,
+        workers=args.workers,
+        torch_threads=args.threads,
+        cpu_affinity=main.ASR_WORKER_CPU_AFFINITY,
+        queue_size=main.ASR_WORKER_QUEUE_SIZE,
+        backend=args.backend,
+    )
+
+
+class Benchmark:
+    """
+    压测执行器
+
+    参数:
+        app (FastAPI): 已启动的 ASR 应用
+        clips (list): load_clips 返回的片段列表
+        mode (str): "task" 或 "queue"
+        run_id (str): 本次压测ID
+    """
+
+    def __init__(self, app, clips, mode, run_id):
+        self.app = app
+        self.clips = clips
+        self.mode = mode
+        self.run_id = run_id
+        self.records = []
+        self.errors = 0
+
+        # queue 模式: 等待结果的请求, 以及消费者记录的各阶段耗时
+        self.waiters = {}
+        self.timings = {}
+
+    def instrument(self):
+        """queue 模式下记录消费者调用 process_asr_task 返回的耗时"""
+        process_asr_task = main.process_asr_task
+
+        async def recording_task(app, session_id):
+            timings = await process_asr_task(app, session_id)
+            self.timings[session_id] = timings
+            # 没有语音的音频不推送到输出队列, 在此结束等待
+            if timings and not timings["segments"]:
+                future = self.waiters.pop(session_id, None)
+                if future and not future.done():
+                    future.set_result(None)
+            return timings
+
+        main.process_asr_task = recording_task
+
+    async def collect_results(self):
+        """queue 模式: 从输出队列取回结果"""
+        while True:
+            result = await self.app.state.redis.brpop(main.ASR_OUTPUT_QUEUE_KEY)
+            session_id = result[1].decode()
+            future = self.waiters.pop(session_id, None)
+            if future and not future.done():
+                future.set_result(None)
+
+    async def request(self, index: int):
+        """发送一条请求并记录耗时"""
+        name, data, audio_seconds = self.clips[index % len(self.clips)]
+        session_id = f"{BENCH_PREFIX}-{self.run_id}-{index}"
+        redis_conn = self.app.state.redis
+
+        try:
+            await redis_conn.hset(
+                f"asr:{session_id}",
+                mapping={"status": "False", "audio": data, "text": ""},
+            )
+            start_time = time.perf_counter()
+
+            if self.mode == "task":
+                timings = await main.process_asr_task(self.app, session_id)
+            else:
+                future = asyncio.get_running_loop().create_future()
+                self.waiters[session_id] = future
+                await redis_conn.xadd(
+                    main.ASR_INPUT_STREAM_KEY,
+                    {"session_id": session_id, "duration_ms": int(audio_seconds * 1000)},
+                )
+                await future
+                timings = self.timings.pop(session_id, None)
+
+            latency = time.perf_counter() - start_time
+            if not timings:
+                self.errors += 1
+                return
+
+            # 排队耗时 = 总延迟中除 IO, 预处理, 推理以外的部分 (调度, 凑批, 工作池排队)
+            record = dict(timings, clip=name, latency=latency)
+            record["queue"] = max(
+                0.0,
+                latency - timings["io"] - timings["preprocess"] - timings["inference"],
+            )
+            self.records.append(record)
+
+        except Exception as e:
+            self.errors += 1
+            print(f"请求失败 {session_id}: {e}")
+
+        finally:
+            await redis_conn.delete(f"asr:{session_id}")
+
+    async def run_closed(self, requests: int, concurrency: int):
+        """闭环: 固定数量的客户端连续发送"""
+        counter = iter(range(requests))
+
+        async def client():
+            for index in counter:
+                await self.request(index)
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    async def run_poisson(self, requests: int, rate: float):
+        """开环: 指数分布间隔到达"""
+        tasks = []
+        for index in range(requests):
+            tasks.append(asyncio.create_task(self.request(index)))
+            await asyncio.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks)
+
+    async def run_burst(self, requests: int, concurrency: int, interval: float):
+        """突发: 每个间隔同时发送一批"""
+        tasks = []
+        for start in range(0, requests, concurrency):
+            for index in range(start, min(requests, start + concurrency)):
+                tasks.append(asyncio.create_task(self.request(index)))
+            await asyncio.sleep(interval)
+        await asyncio.gather(*tasks)
+
+
+def cpu_seconds() -> tuple:
+    """返回 (主进程 CPU 秒数, 已退出子进程 CPU 秒数)"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def build_report(args, bench, wall_seconds, cpu_used) -> dict:
+    """汇总压测结果"""
+    records = bench.records
+    audio_seconds = sum(r["audio_seconds"] for r in records)
+
+    def series(key):
+        return percentiles([r[key] for r in records])
+
+    report = {
+        "label": args.label,
+        "config": {
+            "mode": args.mode,
+            "arrival": args.arrival,
+            "backend": args.backend,
+            "worker_mode": args.worker_mode,
+            "workers": args.workers,
+            "threads": args.threads,
+            "batch_size": args.batch_size,
+            "batch_window_ms": args.batch_window_ms,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+        },
+        "requests": len(records),
+        "errors": bench.errors,
+        "wall_seconds": round(wall_seconds, 2),
+        "audio_seconds": round(audio_seconds, 2),
+        "latency_ms": {
+            "total": series("latency"),
+            "queue": series("queue"),
+            "io": series("io"),
+            "preprocess": series("preprocess"),
+            "inference": series("inference"),
+        },
+        "mean_batch_size": round(
+            sum(r["batch_size"] for r in records) / max(1, len(records)), 2
+        ),
+        "cpu_utilization": round(cpu_used / (wall_seconds * os.cpu_count()), 3),
+        "peak_rss_mb": {
+            "main": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "workers": round(
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1
+            ),
+        },
+    }
+
+    if audio_seconds and wall_seconds:
+        # 整体实时率 < 1 表示处理速度快于实时, realtime_streams 为可同时支撑的说话路数
+        realtime_streams = audio_seconds / wall_seconds
+        report["rtf"] = round(wall_seconds / audio_seconds, 4)
+        report["realtime_streams"] = round(realtime_streams, 2)
+        report["devices_supported"] = int(realtime_streams / args.speech_ratio)
+    return report
+
+
+def print_report(report: dict):
+    print(f"\n== {report['label'] or report['config']['backend']} ==")
+    print(
+        f"请求: {report['requests']} (失败 {report['errors']}), "
+        f"墙钟: {report['wall_seconds']}s, 音频: {report['audio_seconds']}s"
+    )
+    if "rtf" in report:
+        print(
+            f"整体 RTF: {report['rtf']}, 实时路数: {report['realtime_streams']}, "
+            f"可支撑设备数: {report['devices_supported']}"
+        )
+    print(
+        f"平均批大小: {report['mean_batch_size']}, CPU 利用率: {report['cpu_utilization']}, "
+        f"峰值 RSS(MB): {report['peak_rss_mb']}"
+    )
+    print(f"{'延迟(ms)':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for stage, values in report["latency_ms"].items():
+        print(
+            f"{stage:<12}"
+            + "".join(f"{values.get(q, '-'):>10}" for q in ("p50", "p95", "p99", "max"))
+        )
+
+
+async def run(args):
+    clips = load_clips(args.audio_dir)
+    if not clips:
+        raise SystemExit("目录中没有可用的 WAV 文件")
+
+    run_id = uuid.uuid4().hex[:8]
+    configure(args, run_id)
+    app = main.app
+
+    async with main.lifespan(app):
+        # 等待模型加载和预热
+        await app.state.startup_task
+        if not app.state.ready:
+            raise SystemExit(f"ASR 服务启动失败: {app.state.startup_stage}")
+
+        bench = Benchmark(app, clips, args.mode, run_id)
+        collector = None
+        if args.mode == "queue":
+            bench.instrument()
+            collector = asyncio.create_task(bench.collect_results())
+
+        cpu_before = sum(cpu_seconds())
+        start_time = time.perf_counter()
+
+        if args.arrival == "closed":
+            await bench.run_closed(args.requests, args.concurrency)
+        elif args.arrival == "poisson":
+            await bench.run_poisson(args.requests, args.rate)
+        else:
+            await bench.run_burst(args.requests, args.concurrency, args.burst_interval)
+
+        wall_seconds = time.perf_counter() - start_time
+
+        if collector:
+            collector.cancel()
+
+        # 等待推理子进程退出, 使其 CPU 时间和内存计入 RUSAGE_CHILDREN
+        executor = main.inference_pool.executor
+        if executor:
+            executor.shutdown(wait=True)
+        cpu_used = sum(cpu_seconds()) - cpu_before
+
+        await app.state.redis.delete(
+            main.ASR_INPUT_STREAM_KEY,
+            main.ASR_OUTPUT_QUEUE_KEY,
+            main.ASR_DEAD_LETTER_KEY,
+        )
+
+    return build_report(args, bench, wall_seconds, cpu_used)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="ASR 容量压测")
+    parser.add_argument("audio_dir", help="WAV 片段目录")
+    parser.add_argument("--mode", choices=["task", "queue"], default="queue")
+    parser.add_argument(
+        "--arrival", choices=["closed", "poisson", "burst"], default="closed"
+    )
+    parser.add_argument("--requests", type=int, default=200, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发客户端数/突发大小")
+    parser.add_argument("--rate", type=float, default=10.0, help="poisson 每秒请求数")
+    parser.add_argument("--burst-interval", type=float, default=2.0, help="突发间隔 (秒)")
+
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=main.ASR_BACKEND)
+    parser.add_argument(
+        "--worker-mode", choices=["thread", "process"], default=main.ASR_WORKER_MODE
+    )
+    parser.add_argument("--workers", type=int, default=main.ASR_WORKERS)
+    parser.add_argument("--threads", type=int, default=main.ASR_WORKER_TORCH_THREADS)
+    parser.add_argument("--batch-size", type=int, default=main.ASR_BATCH_MAX_SIZE)
+    parser.add_argument(
+        "--batch-window-ms", type=float, default=main.ASR_BATCH_WINDOW_MS
+    )
+
+    parser.add_argument("--redis-host", default=main.REDIS_HOST)
+    parser.add_argument("--redis-port", type=int, default=main.REDIS_PORT)
+    parser.add_argument(
+        "--speech-ratio",
+        type=float,
+        default=0.1,
+        help="单个设备说话时间占比, 用于估算可支撑设备数",
+    )
+    parser.add_argument("--label", default="", help="结果标签, 便于对比")
+    parser.add_argument("--json", help="结果输出为 JSON 文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,181 @@
+"""
+识别后端对比工具 (torch / onnx)
+
+
+对同一批 WAV 文件分别使用各识别后端识别, 输出:
+    - 加载耗时和峰值内存 (RSS)
+    - 实时率 RTF = 推理耗时 / 音频时长 (越小越快)
+    - 字错误率 CER: 存在同名 .txt 参考文本时对比参考文本,
+      否则以第一个后端的结果为参考, 对比各后端之间的一致性
+
+每个后端在独立子进程中运行, 内存统计互不影响
+
+示例:
+    python compare_backends.py ./testset --backends torch onnx --threads 4
+    python compare_backends.py ./testset --json report.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import time
+
+# 公共模块位于 components 目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_format import decode_audio_input
+from engine import load_engine
+
+TAG_PATTERN = re.compile(r"<\|[^|]*\|>")
+IGNORED_CHARS = re.compile(r"[\s，。！？、,.!?]")
+
+
+def normalize_text(text: str) -> str:
+    """去掉 SenseVoice 标签, 空白和标点"""
+    return IGNORED_CHARS.sub("", TAG_PATTERN.sub("", text))
+
+
+def edit_distance(ref: str, hyp: str) -> int:
+    """字符级编辑距离"""
+    previous = list(range(len(hyp) + 1))
+    for i, ref_char in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_char in enumerate(hyp, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ref_char != hyp_char),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def character_error_rate(refs: list, hyps: list) -> float:
+    """计算整体字错误率"""
+    errors = total = 0
+    for ref, hyp in zip(refs, hyps):
+        ref, hyp = normalize_text(ref), normalize_text(hyp)
+        errors += edit_distance(ref, hyp)
+        total += len(ref)
+    return errors / total if total else 0.0
+
+
+def run_backend(backend: str, files: list, threads: int, repeat: int) -> dict:
+    """
+    在子进程中运行一个后端
+
+    返回:
+        dict: 识别文本和耗时统计
+    """
+    if backend == "torch":
+        import torch
+
+        torch.set_num_threads(threads)
+
+    start_time = time.perf_counter()
+    engine = load_engine(backend, threads)
+    load_time = time.perf_counter() - start_time
+
+    samples = []
+    for path in files:
+        with open(path, "rb") as f:
+            samples.append(decode_audio_input(f.read()))
+
+    # 预热, 不计入统计
+    engine.generate(input=[samples[0]], batch_size=1)
+
+    texts = []
+    infer_time = 0.0
+    for audio in samples:
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            result = engine.generate(input=[audio], batch_size=1)
+            infer_time += time.perf_counter() - start_time
+        texts.append(result[0]["text"] if result else "")
+
+    return {
+        "load_seconds": round(load_time, 2),
+        "infer_seconds": round(infer_time / repeat, 3),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "texts": texts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="识别后端对比 (torch / onnx)")
+    parser.add_argument("audio_dir", help="WAV 文件目录, 可选同名 .txt 参考文本")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--threads", type=int, default=4, help="计算线程数")
+    parser.add_argument("--repeat", type=int, default=1, help="每个文件重复识别次数")
+    parser.add_argument("--json", help="结果输出为 JSON 文件")
+    args = parser.parse_args()
+
+    files = sorted(
+        os.path.join(args.audio_dir, name)
+        for name in os.listdir(args.audio_dir)
+        if name.lower().endswith(".wav")
+    )
+    if not files:
+        parser.error("目录中没有 WAV 文件")
+
+    # 音频总时长
+    audio_seconds = 0.0
+    for path in files:
+        with open(path, "rb") as f:
+            samples = decode_audio_input(f.read())
+        if samples is None:
+            parser.error(f"无法解析音频文件 (仅支持 16 位 WAV): {path}")
+        audio_seconds += len(samples) / 16000
+
+    # 参考文本
+    refs = []
+    for path in files:
+        ref_path = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(ref_path):
+            refs = None
+            break
+        with open(ref_path, encoding="utf-8") as f:
+            refs.append(f.read().strip())
+
+    context = multiprocessing.get_context("spawn")
+    report = {"files": len(files), "audio_seconds": round(audio_seconds, 2)}
+    for backend in args.backends:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_backend, (backend, files, args.threads, args.repeat))
+        result["rtf"] = round(result["infer_seconds"] / audio_seconds, 4)
+        report[backend] = result
+
+    # 字错误率 (无参考文本时以第一个后端为参考)
+    baseline = refs or report[args.backends[0]]["texts"]
+    for backend in args.backends:
+        report[backend]["cer"] = round(
+            character_error_rate(baseline, report[backend]["texts"]), 4
+        )
+    report["cer_reference"] = "reference" if refs else args.backends[0]
+
+    print(
+        f"文件数: {report['files']}, 音频时长: {report['audio_seconds']}s, "
+        f"CER 参考: {report['cer_reference']}"
+    )
+    print(f"{'后端':<8}{'加载(s)':>10}{'推理(s)':>10}{'RTF':>10}{'CER':>10}{'峰值RSS(MB)':>14}")
+    for backend in args.backends:
+        r = report[backend]
+        print(
+            f"{backend:<8}{r['load_seconds']:>10}{r['infer_seconds']:>10}"
+            f"{r['rtf']:>10}{r['cer']:>10}{r['peak_rss_mb']:>14}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+ASR 任务流消费者 (Redis Stream 消费者组)
+
+
+模块功能
+1. 通过消费者组读取 ASR 任务流, 多个 ASR 实例共享同一个消费者组, 各自领取不同的任务
+2. 任务处理完成后 XACK 确认并 XDEL 删除, 进程崩溃时任务保留在待确认列表 (PEL) 中
+3. 定期使用 XAUTOCLAIM 接管空闲超时的待确认任务 (其他实例崩溃或卡死), 重新处理
+4. 超过最大投递次数的任务转入死信流, 不再重试
+5. 每个实例限制同时处理的任务数量, 只在有空闲名额时领取新任务
+
+任务流消息格式:
+    session_id : 会话ID, 音频数据在 asr:{session_id} 中
+
+注意:
+    - 投递语义为至少一次, 处理函数需要能够容忍重复投递
+    - 处理函数抛出异常时任务不确认, 等待空闲超时后重试
+"""
+
+import asyncio
+import logging
+import time
+
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger("asr_server.consumer")
+
+
+class StreamConsumer:
+    """
+    Redis Stream 消费者
+
+    参数:
+        redis_conn (redis.Redis): Redis 连接
+        stream_key (str): 任务流的键
+        group (str): 消费者组名称
+        consumer (str): 本实例的消费者名称, 各实例必须不同
+        handler (callable): 异步处理函数, 参数为 (entry_id, fields)
+        max_inflight (int): 本实例同时处理的最大任务数
+        claim_idle_ms (int): 待确认任务空闲超过该时间后可被接管 (单位: 毫秒)
+        claim_interval (float): 检查待确认任务的间隔 (单位: 秒)
+        max_deliveries (int): 最大投递次数, 超过后转入死信流
+        dead_letter_key (str): 死信流的键
+    """
+
+    def __init__(
+        self,
+        redis_conn,
+        stream_key,
+        group,
+        consumer,
+        handler,
+        max_inflight,
+        claim_idle_ms,
+        claim_interval,
+        max_deliveries,
+        dead_letter_key,
+    ):
+        self.redis = redis_conn
+        self.stream_key = stream_key
+        self.group = group
+        self.consumer = consumer
+        self.handler = handler
+        self.max_inflight = max_inflight
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval
+        self.max_deliveries = max_deliveries
+        self.dead_letter_key = dead_letter_key
+
+        self.inflight = 0
+        self.slot_free = asyncio.Event()
+        self.tasks = set()
+
+        # 统计信息
+        self.received = 0
+        self.acked = 0
+        self.failed = 0
+        self.reclaimed = 0
+        self.dead_lettered = 0
+
+    async def ensure_group(self):
+        """创建消费者组 (任务流不存在时一并创建), 已存在时忽略"""
+        try:
+            await self.redis.xgroup_create(
+                self.stream_key, self.group, id="0", mkstream=True
+            )
+            logger.info("创建消费者组: %s/%s", self.stream_key, self.group)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def wait_for_slot(self) -> int:
+        """等待空闲名额, 返回当前可领取的任务数量"""
+        while self.inflight >= self.max_inflight:
+            self.slot_free.clear()
+            await self.slot_free.wait()
+        return self.max_inflight - self.inflight
+
+    async def run(self):
+        """后台任务: 读取新任务"""
+        await self.ensure_group()
+        logger.info("开始消费任务流: %s, 消费者: %s", self.stream_key, self.consumer)
+        try:
+            while True:
+                count = await self.wait_for_slot()
+                try:
+                    response = await self.redis.xreadgroup(
+                        self.group,
+                        self.consumer,
+                        {self.stream_key: ">"},
+                        count=count,
+                        block=5000,
+                    )
+                except Exception as e:
+                    logger.error("读取任务流失败: %s", e)
+                    await asyncio.sleep(1)
+                    continue
+
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        self.received += 1
+                        self.start(entry_id, fields)
+        finally:
+            for task in list(self.tasks):
+                task.cancel()
+
+    async def run_reclaim(self):
+        """后台任务: 接管空闲超时的待确认任务"""
+        start_id = "0-0"
+        while True:
+            await asyncio.sleep(self.claim_interval)
+            try:
+                count = self.max_inflight - self.inflight
+                if count <= 0:
+                    continue
+
+                response = await self.redis.xautoclaim(
+                    self.stream_key,
+                    self.group,
+                    self.consumer,
+                    min_idle_time=self.claim_idle_ms,
+                    start_id=start_id,
+                    count=count,
+                )
+                start_id, entries = response[0], response[1]
+
+                for entry_id, fields in entries:
+                    if fields is None:
+                        continue
+                    self.reclaimed += 1
+
+                    if await self.delivery_count(entry_id) > self.max_deliveries:
+                        await self.dead_letter(entry_id, fields)
+                        continue
+
+                    logger.warning("接管待确认任务: %s, %s", entry_id, fields)
+                    self.start(entry_id, fields)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("接管待确认任务失败: %s", e)
+
+    def start(self, entry_id, fields):
+        """创建任务处理协程"""
+        self.inflight += 1
+        task = asyncio.create_task(self.process(entry_id, fields))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def process(self, entry_id, fields):
+        """处理单个任务, 成功后确认并删除"""
+        try:
+            await self.handler(entry_id, fields)
+            await self.redis.xack(self.stream_key, self.group, entry_id)
+            await self.redis.xdel(self.stream_key, entry_id)
+            self.acked += 1
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 不确认, 空闲超时后由任一实例接管重试
+            self.failed += 1
+            logger.error("任务处理失败, 等待重试: %s - %s", entry_id, e, exc_info=True)
+
+        finally:
+            self.inflight -= 1
+            self.slot_free.set()
+
+    async def delivery_count(self, entry_id) -> int:
+        """查询任务的投递次数"""
+        pending = await self.redis.xpending_range(
+            self.stream_key, self.group, min=entry_id, max=entry_id, count=1
+        )
+        return pending[0]["times_delivered"] if pending else 0
+
+    async def dead_letter(self, entry_id, fields):
+        """任务转入死信流, 并从任务流中确认删除"""
+        await self.redis.xadd(
+            self.dead_letter_key,
+            {
+                **fields,
+                "entry_id": entry_id,
+                "group": self.group,
+                "dead_at": int(time.time()),
+            },
+        )
+        await self.redis.xack(self.stream_key, self.group, entry_id)
+        await self.redis.xdel(self.stream_key, entry_id)
+        self.dead_lettered += 1
+        logger.error("任务超过最大投递次数, 转入死信流: %s, %s", entry_id, fields)
+
+    def stats(self) -> dict:
+        """返回消费统计信息"""
+        return {
+            "consumer": self.consumer,
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "received": self.received,
+            "acked": self.acked,
+            "failed": self.failed,
+            "reclaimed": self.reclaimed,
+            "dead_lettered": self.dead_lettered,
+        }
@@ -0,0 +1,383 @@
+"""
+ASR 识别引擎与推理工作池
+
+
+模块功能
+1. 识别引擎
+    - load_engine   : 加载当前进程的识别引擎 (同一进程只加载一次)
+    - 后端 torch    : funasr AutoModel (PyTorch)
+    - 后端 onnx     : funasr_onnx 加载 INT8 量化的 ONNX 模型, onnxruntime CPU 推理,
+                      首次加载时自动导出, 结果格式与 torch 后端一致
+    - run_inference : 批量识别, 返回识别结果和排队/推理耗时
+
+2. 推理工作池 InferencePool
+    - 固定数量的推理工作者 (线程或进程), 替代默认线程池的无限制并发调用
+    - 进程模式 (默认) 每个工作者独立设置计算线程数, 可选绑定 CPU 核心
+    - 有界任务队列, 队列满时提交方等待 (背压)
+    - 记录排队耗时和推理耗时
+
+注意:
+    - 进程模式每个进程各自加载一个识别引擎, 使用 spawn 启动子进程, 避免 fork 已初始化的 torch 运行时
+    - 线程模式共享一个识别引擎, generate 会修改引擎内部的参数 (AutoModel.kwargs), 不能并发调用,
+      因此各线程的推理串行执行; 计算线程数 (torch.set_num_threads) 是进程级设置, 只设置一次,
+      CPU 绑定只作用于调用线程, 不影响 torch 的计算线程池, 线程模式不绑定 CPU
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger("asr_server.engine")
+
+
+#######################################################################
+#    模块配置
+#######################################################################
+
+ASR_MODEL = "iic/SenseVoiceSmall"
+ASR_DEVICE = None  # None 表示自动选择 (有 GPU 时使用 cuda:0)
+
+ASR_BACKENDS = ("torch", "onnx")
+ASR_ONNX_QUANTIZE = True  # 使用 INT8 量化模型 (model_quant.onnx)
+ASR_ONNX_BATCH_SIZE = 16  # onnx 后端内部单次推理的最大音频数量
+ASR_ONNX_LANGUAGE = "auto"
+ASR_ONNX_TEXTNORM = "woitn"  # 与 torch 后端默认输出一致 (不做逆文本正则化)
+
+METRICS_WINDOW = 1000  # 统计最近多少个任务的耗时分布
+
+# 当前进程的识别引擎
+_engine = None
+_engine_lock = threading.Lock()
+
+# 串行执行识别引擎的 generate (线程模式下共享引擎, 进程模式下每个进程一个, 无竞争)
+_generate_lock = threading.Lock()
+
+
+#######################################################################
+#    识别引擎
+#######################################################################
+
+
+def select_device() -> str:
+    """返回推理设备, 未配置时有 GPU 使用 cuda:0, 否则使用 cpu"""
+    import torch
+
+    return ASR_DEVICE or ("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+def load_engine(backend="torch", threads=None):
+    """
+    加载当前进程的识别引擎, 重复调用返回同一个实例
+
+    参数:
+        backend (str): 识别后端, "torch" 或 "onnx"
+        threads (int): onnx 后端的 onnxruntime 线程数, 为空时使用全部 CPU
+
+    返回:
+        AutoModel | OnnxSenseVoice: 识别引擎, 均提供 generate(input=[...]) 接口
+    """
+    global _engine
+
+    with _engine_lock:
+        if _engine is None:
+            if backend == "onnx":
+                threads = threads or os.cpu_count()
+                logger.info("加载识别引擎: %s (onnx, %d 线程)", ASR_MODEL, threads)
+                _engine = OnnxSenseVoice(ASR_MODEL, threads)
+
+            else:
+                from funasr import AutoModel
+
+                device = select_device()
+                logger.info("加载识别引擎: %s, 设备: %s", ASR_MODEL, device)
+                _engine = AutoModel(
+                    model=ASR_MODEL,
+                    vad_kwargs={"max_silence_duration": 3000},
+                    disable_update=True,
+                    device=device,
+                    task="asr",  # 明确指定任务类型
+                )
+    return _engine
+
+
+class OnnxSenseVoice:
+    """
+    SenseVoiceSmall 的 ONNX 后端, 接口与 AutoModel.generate 保持一致
+
+    参数:
+        model_dir (str): 模型名称或本地目录, 不存在 ONNX 文件时自动导出
+        threads (int): onnxruntime 线程数
+    """
+
+    def __init__(self, model_dir, threads):
+        import numpy as np
+        from funasr_onnx import SenseVoiceSmall
+
+        class _SenseVoiceSmall(SenseVoiceSmall):
+            # 原实现的列表输入只支持文件路径, 这里支持采样数组和路径混合
+            def load_data(self, wav_content, fs=None):
+                if not isinstance(wav_content, list):
+                    return super().load_data(wav_content, fs)
+                waveforms = []
+                for item in wav_content:
+                    if isinstance(item, np.ndarray):
+                        waveforms.append(item)
+                    else:
+                        waveforms.extend(super().load_data(item, fs))
+                return waveforms
+
+        self.model = _SenseVoiceSmall(
+            model_dir,
+            batch_size=ASR_ONNX_BATCH_SIZE,
+            quantize=ASR_ONNX_QUANTIZE,
+            intra_op_num_threads=threads,
+        )
+
+    def generate(self, input, **kwargs):
+        """
+        批量识别
+
+        参数:
+            input (list): 音频输入列表 (16kHz float32 采样数组或文件路径)
+
+        返回:
+            list[dict]: 与输入等长的识别结果, 如 [{'key': '0', 'text': '<|zh|>...'}]
+        """
+        texts = self.model(
+            input, language=ASR_ONNX_LANGUAGE, textnorm=ASR_ONNX_TEXTNORM
+        )
+        return [{"key": str(i), "text": text} for i, text in enumerate(texts)]
+
+
+def run_inference(inputs: list, submit_time: float) -> tuple:
+    """
+    批量语音识别, 在推理工作者中执行
+
+    参数:
+        inputs (list): 音频输入列表 (采样数组或文件路径)
+        submit_time (float): 任务提交时间 (time.time())
+
+    返回:
+        tuple: (与输入等长的识别结果列表, 排队耗时(秒), 推理耗时(秒))
+    """
+    with _generate_lock:
+        start_time = time.time()
+        results = load_engine().generate(input=inputs, batch_size=len(inputs))
+    return results, start_time - submit_time, time.time() - start_time
+
+
+def set_torch_threads(backend, torch_threads):
+    """设置当前进程的 torch 计算线程数 (进程级设置)"""
+    if backend == "torch":
+        import torch
+
+        torch.set_num_threads(torch_threads)
+
+
+def _init_worker(backend, torch_threads, cpu_sets, counter):
+    """
+    推理工作进程初始化: 设置计算线程数和 CPU 亲和性, 加载识别引擎
+
+    参数:
+        backend (str): 识别后端
+        torch_threads (int): 计算线程数 (torch 或 onnxruntime)
+        cpu_sets (list): 各工作者绑定的 CPU 列表, 为空时不绑定
+        counter: 工作者编号计数器 (进程间共享的 Value)
+    """
+    set_torch_threads(backend, torch_threads)
+
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+
+    # 在加载引擎 (创建计算线程) 之前绑定, 之后创建的线程继承进程的 CPU 亲和性
+    if cpu_sets:
+        cpus = cpu_sets[index % len(cpu_sets)]
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError) as e:
+            logger.warning("推理工作者 %d 绑定 CPU %s 失败: %s", index, cpus, e)
+
+    load_engine(backend, torch_threads)
+
+
+def split_cpu_sets(workers: int) -> list:
+    """
+    将当前进程可用的 CPU 平均分配给各工作者
+
+    参数:
+        workers (int): 工作者数量
+
+    返回:
+        list[list[int]]: 各工作者的 CPU 列表
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(cpus) // workers)
+    return [
+        [cpus[(i * per_worker + j) % len(cpus)] for j in range(per_worker)]
+        for i in range(workers)
+    ]
+
+
+#######################################################################
+#    推理工作池
+#######################################################################
+
+
+class InferencePool:
+    """
+    推理工作池
+
+    参数:
+        mode (str): 工作者类型, "process" 或 "thread" (共享一个识别引擎, 推理串行执行, 不绑定 CPU)
+        workers (int): 工作者数量
+        torch_threads (int): 每个工作者的计算线程数 (torch 或 onnxruntime)
+        cpu_affinity: CPU 绑定方式, None 不绑定, "auto" 平均分配, 或每个工作者的 CPU 列表
+        queue_size (int): 等待执行的任务上限, 超出时提交方等待
+        backend (str): 识别后端, "torch" 或 "onnx"
+
+    示例:
+        >>> pool = InferencePool("process", 2, 2, "auto", 16, backend="onnx")
+        >>> pool.start()
+        >>> results = await pool.infer([samples])
+    """
+
+    def __init__(
+        self, mode, workers, torch_threads, cpu_affinity, queue_size, backend="torch"
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"不支持的推理工作者类型: {mode}")
+        if backend not in ASR_BACKENDS:
+            raise ValueError(f"不支持的识别后端: {backend}")
+
+        self.mode = mode
+        self.backend = backend
+        self.workers = workers
+        self.torch_threads = torch_threads
+        self.cpu_affinity = cpu_affinity
+        self.queue_size = queue_size
+        self.executor = None
+        self.slots = None
+
+        # 统计信息
+        self.pending = 0  # 已提交未完成的任务数 (排队中和执行中)
+        self.jobs = 0
+        self.items = 0
+        self.failures = 0
+        self.queue_times = deque(maxlen=METRICS_WINDOW)
+        self.infer_times = deque(maxlen=METRICS_WINDOW)
+
+    def start(self):
+        """创建工作者, 线程模式在主进程加载识别引擎"""
+        if self.cpu_affinity == "auto":
+            cpu_sets = split_cpu_sets(self.workers)
+        else:
+            cpu_sets = self.cpu_affinity or []
+
+        if self.mode == "thread":
+            if cpu_sets:
+                logger.warning("线程模式不绑定 CPU, 忽略 CPU 绑定配置: %s", cpu_sets)
+                cpu_sets = []
+            if self.workers > 1:
+                logger.warning(
+                    "线程模式共享一个识别引擎, %d 个工作者的推理串行执行", self.workers
+                )
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="asr-infer"
+            )
+            set_torch_threads(self.backend, self.torch_threads)
+            load_engine(self.backend, self.torch_threads)
+        else:
+            context = multiprocessing.get_context("spawn")
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(
+                    self.backend,
+                    self.torch_threads,
+                    cpu_sets,
+                    context.Value("i", 0),
+                ),
+            )
+
+        self.slots = asyncio.Semaphore(self.workers + self.queue_size)
+        logger.info(
+            "推理工作池已启动: 后端 %s, 模式 %s, 工作者 %d, 计算线程 %d, CPU 绑定 %s",
+            self.backend,
+            self.mode,
+            self.workers,
+            self.torch_threads,
+            cpu_sets or "无",
+        )
+
+    async def infer(self, inputs: list, timings: dict = None) -> list:
+        """
+        提交一批输入并等待识别结果
+
+        参数:
+            inputs (list): 音频输入列表
+            timings (dict): 可选, 写入本批次的排队耗时 queue 和推理耗时 inference (秒)
+
+        返回:
+            list[dict]: 与输入等长的识别结果列表
+        """
+        submit_time = time.time()
+        self.pending += 1
+        try:
+            async with self.slots:
+                loop = asyncio.get_running_loop()
+                results, queue_time, infer_time = await loop.run_in_executor(
+                    self.executor, run_inference, inputs, submit_time
+                )
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.pending -= 1
+
+        self.jobs += 1
+        self.items += len(inputs)
+        self.queue_times.append(queue_time)
+        self.infer_times.append(infer_time)
+        if timings is not None:
+            timings.update(queue=queue_time, inference=infer_time)
+        return results
+
+    def stats(self) -> dict:
+        """返回工作池统计信息, 耗时单位为毫秒"""
+        return {
+            "backend": self.backend,
+            "mode": self.mode,
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "pending": self.pending,
+            "jobs": self.jobs,
+            "items": self.items,
+            "failures": self.failures,
+            "queue_ms": percentiles(self.queue_times),
+            "infer_ms": percentiles(self.infer_times),
+        }
+
+    def shutdown(self):
+        """关闭工作者, 不等待未开始的任务"""
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+def percentiles(samples) -> dict:
+    """计算耗时样本 (秒) 的 p50/p95/p99/max, 单位毫秒"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": pick(1.0)}
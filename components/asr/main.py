@@ -1,12 +1,26 @@
 import asyncio
+import functools
 from contextlib import asynccontextmanager
-from funasr import AutoModel
 import os
-import logging
+import sys
 import redis.asyncio as redis
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
+import socket
 import tempfile
-import torch
+import time
+import numpy as np
+
+# 公共模块位于 components 目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_format import decode_audio_input, is_pcm_record, pcm_record_to_wav
+
+from batching import BatchScheduler
+from consumer import StreamConsumer
+from scheduler import DeadlineScheduler
+from segment import split_on_pauses, stitch_texts, trim_silence
+from engine import InferencePool, select_device
+from streaming import StreamingRecognizer, load_streaming_engine
 
 # 示例
 # 识别结果: [{'key': 'test', 'text': '<|zh|><|NEUTRAL|><|BGM|><|woitn|>上一期的武林外传在大家的努力之下冲上了全战第一这个场面我真的从来没见过所以之后这一个月我就跟打了鸡血一样去做后院场景更新的承诺那么这期视频就要是我已经做到了同样是以大门视角把后院分为上'}]
@@ -17,35 +31,10 @@ import torch
 #    配置日志
 #######################################################################
 
-# 配置日志记录
-
-logger = logging.getLogger("asr_server")
-logger.setLevel(logging.INFO)
-
-# 日志目录
-current_dir = os.getcwd()
-log_file_path = os.path.join(current_dir, "storage/logs")
-log_dir = os.path.expanduser(log_file_path)
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file_path = os.path.join(log_dir, "asr_server.log")
-
-# 创建文件处理器
-file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
-file_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
-
-# 创建控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
+from log import setup_logger
 
-# 添加处理器
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# 配置日志记录 (异步写入, 见 components/log.py)
+logger = setup_logger("asr_server")
 
 # 关闭日志（需要时取消注释）
 # logger.setLevel(logging.CRITICAL)
@@ -56,18 +45,55 @@ logger.addHandler(console_handler)
 #######################################################################
 UVICORN_HOST = "192.168.0.111"
 UVICORN_PORT = 8004  # FastAPI服务监听端口
+UVICORN_RELOAD = False  # 开发时可开启, 每次重载都会重新加载模型
 
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
-ASR_INPUT_QUEUE_KEY = "asr_input_queue"
 ASR_OUTPUT_QUEUE_KEY = "asr_output_queue"
 
-asr_engine = AutoModel(
-    model="iic/SenseVoiceSmall",
-    vad_kwargs={"max_silence_duration": 3000},
-    disable_update=True,
-    device="cuda:0" if torch.cuda.is_available() else "cpu",
-    task="asr",  # 明确指定任务类型
+# ASR 任务流 (消费者组, 多个 ASR 实例共享)
+ASR_INPUT_STREAM_KEY = "asr_input_stream"
+ASR_CONSUMER_GROUP = "asr_workers"
+ASR_CONSUMER_NAME = f"{socket.gethostname()}-{os.getpid()}"  # 各实例唯一
+ASR_MAX_INFLIGHT = 64  # 本实例已领取未确认的最大任务数 (执行中和本地排队中)
+ASR_CLAIM_IDLE_MS = 60000  # 待确认任务空闲超过该时间视为处理者已崩溃 (单位: 毫秒)
+ASR_CLAIM_INTERVAL = 10  # 检查待确认任务的间隔 (单位: 秒)
+ASR_MAX_DELIVERIES = 3  # 最大投递次数, 超过后转入死信流
+ASR_DEAD_LETTER_KEY = "asr_dead_letter"
+
+# 截止时间调度: 截止时间 = 入队时间 + 基础值 + 音频时长 * 系数, 截止时间早的任务优先执行
+ASR_DISPATCH_CONCURRENCY = 16  # 同时执行的任务数, 超出的已领取任务在本地按截止时间排队
+ASR_DEADLINE_BASE_MS = 1000  # 截止时间基础值 (单位: 毫秒)
+ASR_DEADLINE_PER_AUDIO_MS = 0.5  # 每毫秒音频增加的截止时间
+
+ASR_SAMPLE_RATE = 16000  # 识别引擎输入采样率, 内存输入需先重采样到该采样率
+
+# 跨会话动态批处理
+ASR_BATCH_WINDOW_MS = 30  # 收到第一条音频后等待凑批的时间窗口 (单位: 毫秒)
+ASR_BATCH_MAX_SIZE = 8  # 单批最大音频数量
+
+# 识别后端: "torch" (PyTorch) 或 "onnx" (INT8 量化 ONNX, 适用于无 GPU 的 CPU 服务器)
+ASR_BACKEND = "torch"
+
+# 推理工作池
+ASR_WORKER_MODE = "process"  # 推理工作者类型: "process" 或 "thread" (共享一个引擎, 推理串行执行)
+ASR_WORKERS = 2  # 推理工作者数量, 即同时执行的批次数量
+ASR_WORKER_TORCH_THREADS = 2  # 每个推理工作者的计算线程数 (torch 或 onnxruntime)
+ASR_WORKER_CPU_AFFINITY = None  # CPU 绑定: None 不绑定, "auto" 平均分配, 或 [[0, 1], [2, 3]]
+ASR_WORKER_QUEUE_SIZE = 16  # 等待执行的批次上限, 超出时提交方等待
+
+# 流式识别 (需要 audio_io 同时开启 ASR_STREAMING_ENABLED)
+ASR_STREAMING_ENABLED = False
+ASR_STREAM_INPUT_KEY = "asr_stream_input"  # audio_io 发布音频分块的流
+ASR_STREAM_WORKERS = 1  # 流式识别推理线程数量
+
+inference_pool = InferencePool(
+    mode=ASR_WORKER_MODE,
+    workers=ASR_WORKERS,
+    torch_threads=ASR_WORKER_TORCH_THREADS,
+    cpu_affinity=ASR_WORKER_CPU_AFFINITY,
+    queue_size=ASR_WORKER_QUEUE_SIZE,
+    backend=ASR_BACKEND,
 )
 
 
@@ -104,29 +130,45 @@ async def process_asr_task(app: FastAPI, session_id: str):
         session_id: 会话唯一ID, 用于关联音频数据和识别结果
 
     返回:
-        None
+        dict | None: 各阶段耗时 (单位: 秒), ASR 条目无效 (已删除) 时返回 None
+            - io         : Redis 读写和临时文件写入
+            - preprocess : 音频解码, 静音裁剪和切分
+            - batch_wait : 等待凑批 (多段时取最大值, 下同)
+            - pool_queue : 批次在推理工作池中排队
+            - inference  : 批次推理
+            - total      : 总耗时
+            以及音频时长 audio_seconds, 分段数 segments, 最大批大小 batch_size
+
+    异常:
+        Exception: 识别或 Redis 失败, ASR 条目保留, 任务等待重试
 
     处理流程:
         1. 从 Redis 获取指定 session_id 的音频数据
         2. 检查数据有效性 (状态, 音频内容)
-        3. 创建临时文件保存音频数据
-        4. 调用语音识别引擎进行识别
-        5. 更新识别结果到Redis
-        6. 推送任务完成通知
-        7. 清理临时资源
+        3. 在内存中解码音频, 无法解析时才创建临时文件
+        4. 裁剪首尾静音, 长音频在停顿处切分
+        5. 各段提交到批处理调度器, 与其他会话的音频合并识别, 按顺序拼接结果
+        6. 更新识别结果到Redis
+        7. 推送任务完成通知
+        8. 清理临时资源
 
     注意:
-        - 音频文件处理时保证音频文件资源释放
+        - 临时文件仅作为回退路径, 使用时保证资源释放
+        - 只有永久性问题 (音频缺失或为空, 全部为静音) 删除 ASR 条目并正常返回;
+          识别或 Redis 失败时保留 ASR 条目并抛出异常, 由任务流消费者重试或转入死信流
+        - 音频全部为静音时删除 ASR 条目, 不推送到输出队列 (返回的 segments 为 0)
 
     """
     logger.info("开始处理 ASR 任务, session_id: %s", session_id)
     tmp_path = None
+    start_time = time.perf_counter()
 
     try:
         redis_conn = app.state.redis
 
         # 获取ASR条目数据
         asr_data = await redis_conn.hgetall(f"asr:{session_id}")
+        io_time = time.perf_counter() - start_time
         if not asr_data:
             logger.error("ASR 数据不存在, session_id: %s", session_id)
 
@@ -143,6 +185,7 @@ async def process_asr_task(app: FastAPI, session_id: str):
                 return
             logger.info("ASR 状态已为 True, 直接推送到输出队列 %s", session_id)
             await redis_conn.lpush(ASR_OUTPUT_QUEUE_KEY, session_id)
+            return
 
         # 读取音频字节数据
         audio_bytes = asr_data.get(b"audio", b"")
@@ -155,33 +198,83 @@ async def process_asr_task(app: FastAPI, session_id: str):
             await redis_conn.delete(f"asr:{session_id}")
             return
 
-        # 创建临时文件 (使用异步执行)
-        loop = asyncio.get_event_loop()
-
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-            tmp_path = temp_file.name
-            await loop.run_in_executor(None, temp_file.write, audio_bytes)
-
-        # 异步执行语音识别
-        result = await loop.run_in_executor(None, asr_engine.generate, tmp_path)
-        text = result[0]["text"] if result else ""
-
-        # 更新识别结果到 Redis
-        await redis_conn.hset(
-            f"asr:{session_id}",
-            mapping={"text": text, "status": "True"},
+        # 在内存中解码为采样数组, 不经过磁盘
+        preprocess_start = time.perf_counter()
+        audio_input = decode_audio_input(audio_bytes, ASR_SAMPLE_RATE)
+        audio_seconds = 0.0
+        tmp_file_time = 0.0
+
+        if audio_input is None:
+            # 回退: 写入临时文件, 由识别引擎读取
+            logger.warning("音频无法在内存中解析, 回退到临时文件: %s", session_id)
+            if is_pcm_record(audio_bytes):
+                audio_bytes = pcm_record_to_wav(audio_bytes)
+
+            loop = asyncio.get_event_loop()
+            tmp_file_start = time.perf_counter()
+            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
+                tmp_path = temp_file.name
+                await loop.run_in_executor(None, temp_file.write, audio_bytes)
+            segments = [tmp_path]
+            tmp_file_time = time.perf_counter() - tmp_file_start
+
+        else:
+            audio_seconds = len(audio_input) / ASR_SAMPLE_RATE
+
+            # 裁剪首尾静音, 长音频在停顿处切分
+            segments = split_on_pauses(
+                trim_silence(audio_input, ASR_SAMPLE_RATE), ASR_SAMPLE_RATE
+            )
+            if not len(segments[0]):
+                logger.info("ASR 音频中没有语音, 跳过识别: %s", session_id)
+                segments = []
+        preprocess_time = time.perf_counter() - preprocess_start - tmp_file_time
+
+        # 各段同时提交批处理调度器, 合并到同一批次或由多个推理工作者并行识别
+        segment_timings = [{} for _ in segments]
+        results = await asyncio.gather(
+            *(
+                app.state.asr_batcher.submit(segment, timings)
+                for segment, timings in zip(segments, segment_timings)
+            )
         )
+        text = stitch_texts([result.get("text", "") for result in results if result])
+
+        write_start = time.perf_counter()
+        if segments:
+            # 更新识别结果到 Redis
+            await redis_conn.hset(
+                f"asr:{session_id}",
+                mapping={"text": text, "status": "True"},
+            )
+
+            # 推送至输出队列
+            await redis_conn.lpush(ASR_OUTPUT_QUEUE_KEY, session_id)
+            logger.info(f"ASR任务完成: {session_id}")
+        else:
+            # 没有语音时不产生识别结果, 与音频为空的条目一样删除, 不推送到输出队列
+            await redis_conn.delete(f"asr:{session_id}")
 
-        # 推送至输出队列
-        await redis_conn.lpush(ASR_OUTPUT_QUEUE_KEY, session_id)
-        logger.info(f"ASR任务完成: {session_id}")
+        end_time = time.perf_counter()
+        timings = {
+            "io": io_time + tmp_file_time + end_time - write_start,
+            "preprocess": preprocess_time,
+            "total": end_time - start_time,
+            "audio_seconds": audio_seconds,
+            "segments": len(segments),
+        }
+        for key in ("batch_wait", "pool_queue", "inference", "batch_size"):
+            timings[key] = max((t.get(key, 0) for t in segment_timings), default=0)
+        return timings
 
     except asyncio.CancelledError:
         logger.warning("ASR 任务被取消: %s", session_id)
         raise
     except Exception as e:
-        logger.error("ASR 任务失败 : %s - %s", session_id, str(e), exc_info=True)
-        await redis_conn.delete(f"asr:{session_id}")
+        # 识别或 Redis 的临时故障: 保留 ASR 条目, 异常交给任务流消费者, 任务不确认,
+        # 空闲超时后重试, 超过最大投递次数转入死信流
+        logger.error("ASR 任务失败 : %s - %s", session_id, str(e))
+        raise
     finally:
         # 清理临时文件
         if tmp_path:
@@ -193,24 +286,130 @@ async def process_asr_task(app: FastAPI, session_id: str):
 #######################################################################
 
 
-# 新增 Redis 监听任务
-async def redis_listener(app: FastAPI):
-    """后台监听 Redis 任务队列"""
-    while True:
-        try:
-            result = await app.state.redis.brpop(ASR_INPUT_QUEUE_KEY, timeout=0)
+async def handle_asr_entry(entry_id, fields):
+    """任务流消息处理函数, 返回后消息被确认"""
+    session_id = fields.get(b"session_id", b"").decode()
+    if not session_id:
+        logger.error("ASR 任务消息缺少 session_id: %s", entry_id)
+        return
 
-            if result:
-                _, session_id = result
-                str_session_id = session_id.decode()
-                logger.info(
-                    f"监听 ASR 输入队列 , 收到新的任务, session_id: {str_session_id}"
-                )
-                asyncio.create_task(process_asr_task(app, str_session_id))
+    # 入队时间取自消息ID (Redis 服务器写入时间, 毫秒), 音频时长由 DAO 写入
+    enqueue_ts = int(entry_id.split(b"-")[0])
+    duration_ms = int(fields.get(b"duration_ms", b"0") or 0)
 
-        except Exception as e:
-            logger.error(f"Redis listener error: {str(e)}")
-            await asyncio.sleep(1)
+    logger.info(
+        "收到 ASR 任务: %s, session_id: %s, 音频时长: %d ms",
+        entry_id,
+        session_id,
+        duration_ms,
+    )
+    async with app.state.scheduler.slot(enqueue_ts, duration_ms):
+        await process_asr_task(app, session_id)
+
+
+def synthetic_clip(seconds: float = 1.0) -> np.ndarray:
+    """生成用于预热的合成音频 (低幅度噪声叠加正弦波), 16kHz float32"""
+    t = np.arange(int(ASR_SAMPLE_RATE * seconds)) / ASR_SAMPLE_RATE
+    noise = np.random.default_rng(0).normal(0, 0.01, len(t))
+    return (0.1 * np.sin(2 * np.pi * 220 * t) + noise).astype(np.float32)
+
+
+async def startup(app: FastAPI):
+    """
+    后台启动任务: 加载模型, 预热, 然后开始消费 Redis 队列
+
+    处理流程:
+        1. 启动推理工作池 (加载识别引擎)
+        2. 每个推理工作者执行一次合成音频识别, 完成延迟初始化
+        3. 加载并预热流式识别引擎 (可选)
+        4. 创建批处理任务和任务流消费者
+        5. 标记服务就绪
+
+    注意:
+        - 在 lifespan 之外执行, 加载期间 /ready 返回 503, 接口仍可访问
+        - 就绪前不消费任务流, 任务留在 Redis 中等待
+    """
+    loop = asyncio.get_running_loop()
+    start_time = time.monotonic()
+
+    try:
+        # 加载识别引擎
+        app.state.startup_stage = "loading"
+        await loop.run_in_executor(None, inference_pool.start)
+
+        # 预热: 每个推理工作者各执行一次
+        app.state.startup_stage = "warming"
+        clip = synthetic_clip()
+        await asyncio.gather(
+            *(inference_pool.infer([clip]) for _ in range(ASR_WORKERS))
+        )
+
+        # 流式识别引擎
+        if ASR_STREAMING_ENABLED:
+            stream_engine = await loop.run_in_executor(
+                None, load_streaming_engine, select_device()
+            )
+            app.state.streaming = StreamingRecognizer(
+                redis_conn=app.state.redis,
+                engine=stream_engine,
+                decode_fn=functools.partial(
+                    decode_audio_input, sample_rate=ASR_SAMPLE_RATE
+                ),
+                input_key=ASR_STREAM_INPUT_KEY,
+                output_queue_key=ASR_OUTPUT_QUEUE_KEY,
+                workers=ASR_STREAM_WORKERS,
+            )
+            await loop.run_in_executor(
+                app.state.streaming.executor,
+                app.state.streaming.infer_chunk,
+                {},
+                clip,
+                True,
+            )
+
+        # 创建批处理任务, 同时执行的批次数量与推理工作者数量一致
+        app.state.asr_batcher = BatchScheduler(
+            inference_pool.infer, ASR_BATCH_WINDOW_MS, ASR_BATCH_MAX_SIZE, ASR_WORKERS
+        )
+        app.state.background_tasks.append(
+            asyncio.create_task(app.state.asr_batcher.run())
+        )
+
+        if app.state.streaming:
+            app.state.background_tasks.append(
+                asyncio.create_task(app.state.streaming.run())
+            )
+
+        # 模型就绪后才开始消费任务流, 已领取的任务按截止时间调度执行
+        app.state.scheduler = DeadlineScheduler(
+            ASR_DISPATCH_CONCURRENCY, ASR_DEADLINE_BASE_MS, ASR_DEADLINE_PER_AUDIO_MS
+        )
+        app.state.consumer = StreamConsumer(
+            redis_conn=app.state.redis,
+            stream_key=ASR_INPUT_STREAM_KEY,
+            group=ASR_CONSUMER_GROUP,
+            consumer=ASR_CONSUMER_NAME,
+            handler=handle_asr_entry,
+            max_inflight=ASR_MAX_INFLIGHT,
+            claim_idle_ms=ASR_CLAIM_IDLE_MS,
+            claim_interval=ASR_CLAIM_INTERVAL,
+            max_deliveries=ASR_MAX_DELIVERIES,
+            dead_letter_key=ASR_DEAD_LETTER_KEY,
+        )
+        app.state.background_tasks.append(asyncio.create_task(app.state.consumer.run()))
+        app.state.background_tasks.append(
+            asyncio.create_task(app.state.consumer.run_reclaim())
+        )
+
+        app.state.startup_stage = "ready"
+        app.state.ready = True
+        logger.info("ASR 服务就绪, 启动耗时 %.2f 秒", time.monotonic() - start_time)
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        app.state.startup_stage = "failed"
+        logger.error("ASR 服务启动失败: %s", e, exc_info=True)
 
 
 # 生命周期函数
@@ -223,12 +422,20 @@ async def lifespan(app: FastAPI):
         )
     )
 
+    app.state.ready = False
+    app.state.startup_stage = "starting"
+    app.state.asr_batcher = None
+    app.state.streaming = None
+    app.state.consumer = None
+    app.state.scheduler = None
+    app.state.background_tasks = []
+
     try:
         await app.state.redis.ping()
         logger.info("Redis 连接成功")
 
-        # 创建后台任务
-        app.state.redis_listener = asyncio.create_task(redis_listener(app))
+        # 后台加载模型, 不阻塞服务启动
+        app.state.startup_task = asyncio.create_task(startup(app))
 
     except Exception as e:
         logger.error("无法连接到 Redis 服务器: %s", e)
@@ -236,20 +443,56 @@ async def lifespan(app: FastAPI):
 
     yield
 
+    app.state.ready = False
+    for task in [app.state.startup_task, *reversed(app.state.background_tasks)]:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error("后台任务异常终止: %s", e)
+    logger.info("ASR 后台任务已取消")
+
     await app.state.redis.aclose()
-    app.state.redis_listener.cancel()
-    try:
-        await app.state.redis_listener
-    except asyncio.CancelledError:
-        logger.info("Redis listener 已取消")
-    except Exception as e:
-        logger.error("Redis listener 异常终止: %s", e)
+    inference_pool.shutdown()
 
 
 # 初始化 APP
 app = FastAPI(lifespan=lifespan)
 
 
+@app.get("/ready")
+async def get_ready():
+    """就绪检查, 模型加载和预热完成前返回 503"""
+    content = {"ready": app.state.ready, "stage": app.state.startup_stage}
+    return JSONResponse(content, status_code=200 if app.state.ready else 503)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """获取批处理和推理工作池统计信息"""
+    try:
+        batcher = app.state.asr_batcher
+        return {
+            "ready": app.state.ready,
+            "batcher": {
+                "batches": batcher.batches,
+                "items": batcher.items,
+                "waiting": batcher.queue.qsize(),
+            }
+            if batcher
+            else None,
+            "consumer": app.state.consumer.stats() if app.state.consumer else None,
+            "scheduler": app.state.scheduler.stats() if app.state.scheduler else None,
+            "inference_pool": inference_pool.stats(),
+            "streaming": app.state.streaming.stats() if app.state.streaming else None,
+        }
+    except Exception as e:
+        logger.error("获取统计信息失败: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/asr")
 async def create_tts_item(session_id: str, text: str):
     pass
@@ -262,6 +505,6 @@ if __name__ == "__main__":
         "main:app",
         host=UVICORN_HOST,
         port=UVICORN_PORT,
-        reload=True,
+        reload=UVICORN_RELOAD,
         reload_dirs=[os.path.dirname(__file__)],
     )
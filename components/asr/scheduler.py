@@ -0,0 +1,138 @@
+"""
+ASR 任务截止时间调度 (EDF)
+
+
+模块功能
+1. 为每个任务计算截止时间:
+    截止时间 = 入队时间 + ASR_DEADLINE_BASE_MS + 音频时长 * ASR_DEADLINE_PER_AUDIO_MS
+    - 短音频 (常见的语音指令) 截止时间早, 优先执行
+    - 截止时间固定不变, 后到的短任务截止时间会越来越晚, 长任务不会被无限推迟 (老化)
+2. 同时执行的任务数有上限, 空出名额时优先放行截止时间最早的任务
+3. 按音频时长分桶统计排队耗时和超出截止时间的任务数
+
+示例:
+    >>> scheduler = DeadlineScheduler(concurrency=16, base_ms=1000, per_audio_ms=0.5)
+    >>> async with scheduler.slot(enqueue_ts_ms, duration_ms):
+    ...     await process_asr_task(app, session_id)
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from engine import METRICS_WINDOW, percentiles
+
+# 排队耗时统计的音频时长分桶上限 (单位: 毫秒)
+DURATION_BUCKETS = (2000, 5000, 10000, 30000)
+
+
+def duration_bucket(duration_ms: int) -> str:
+    """返回音频时长所在的分桶名称, 如 "<=2s", ">30s" """
+    for limit in DURATION_BUCKETS:
+        if duration_ms <= limit:
+            return f"<={limit // 1000}s"
+    return f">{DURATION_BUCKETS[-1] // 1000}s"
+
+
+class DeadlineScheduler:
+    """
+    按截止时间放行任务的调度器
+
+    参数:
+        concurrency (int): 同时执行的任务上限
+        base_ms (float): 截止时间基础值 (单位: 毫秒)
+        per_audio_ms (float): 每毫秒音频增加的截止时间
+    """
+
+    def __init__(self, concurrency, base_ms, per_audio_ms):
+        self.concurrency = concurrency
+        self.base_ms = base_ms
+        self.per_audio_ms = per_audio_ms
+
+        self.heap = []  # (截止时间, 序号, future)
+        self.counter = itertools.count()
+        self.running = 0
+
+        # 统计信息
+        self.waits = {}  # {分桶: deque(排队耗时 秒)}
+        self.missed = {}  # {分桶: 放行时已超过截止时间的任务数}
+
+    def deadline(self, enqueue_ts: int, duration_ms: int) -> float:
+        """计算任务截止时间 (毫秒时间戳)"""
+        return enqueue_ts + self.base_ms + duration_ms * self.per_audio_ms
+
+    @asynccontextmanager
+    async def slot(self, enqueue_ts: int, duration_ms: int):
+        """
+        等待执行名额, 退出时释放
+
+        参数:
+            enqueue_ts (int): 任务入队时间 (毫秒时间戳)
+            duration_ms (int): 音频时长 (单位: 毫秒), 未知时为 0
+        """
+        deadline = self.deadline(enqueue_ts, duration_ms)
+        await self.acquire(deadline)
+        self.record(enqueue_ts, duration_ms, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, deadline: float):
+        """按截止时间排队等待执行名额"""
+        if self.running < self.concurrency and not self.heap:
+            self.running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.heap, (deadline, next(self.counter), future))
+        self.dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 名额已分配但等待方被取消, 归还名额
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """释放名额"""
+        self.running -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        """有空闲名额时放行截止时间最早的等待任务"""
+        while self.running < self.concurrency and self.heap:
+            _, _, future = heapq.heappop(self.heap)
+            if future.cancelled():
+                continue
+            self.running += 1
+            future.set_result(None)
+
+    def record(self, enqueue_ts: int, duration_ms: int, deadline: float):
+        """记录排队耗时 (入队到放行)"""
+        now_ms = time.time() * 1000
+        bucket = duration_bucket(duration_ms)
+        self.waits.setdefault(bucket, deque(maxlen=METRICS_WINDOW)).append(
+            max(0.0, now_ms - enqueue_ts) / 1000
+        )
+        if now_ms > deadline:
+            self.missed[bucket] = self.missed.get(bucket, 0) + 1
+
+    def stats(self) -> dict:
+        """返回调度统计信息, 排队耗时单位为毫秒"""
+        return {
+            "running": self.running,
+            "waiting": len(self.heap),
+            "wait_ms": {
+                bucket: {
+                    "count": len(waits),
+                    "missed_deadline": self.missed.get(bucket, 0),
+                    **percentiles(waits),
+                }
+                for bucket, waits in self.waits.items()
+            },
+        }
@@ -0,0 +1,132 @@
+"""
+音频静音裁剪与长音频分段
+
+
+模块功能
+1. trim_silence    : 按帧能量 (向量化计算) 裁剪首尾静音, 保留少量边界
+2. split_on_pauses : 超过最大时长的音频在句内停顿处切分, 各段可并行或合并为一批识别
+3. stitch_texts    : 按顺序拼接各段识别结果, 只保留第一段的 SenseVoice 标签
+
+说话判断:
+    帧能量 (dB) 高于 max(SEGMENT_FLOOR_DB, 噪声底 + SEGMENT_MARGIN_DB) 视为语音,
+    噪声底取帧能量的 10% 分位数, 适应不同设备的底噪
+"""
+
+import re
+
+import numpy as np
+
+#######################################################################
+#    模块配置
+#######################################################################
+
+SEGMENT_FRAME_MS = 20  # 能量计算帧长 (单位: 毫秒)
+SEGMENT_FLOOR_DB = -50  # 语音能量下限 (相对满幅, 单位: dB)
+SEGMENT_MARGIN_DB = 10  # 语音能量需高于噪声底的幅度 (单位: dB)
+SEGMENT_PAD_MS = 200  # 裁剪时在语音首尾保留的边界 (单位: 毫秒)
+
+SEGMENT_MAX_MS = 8000  # 超过该时长的音频切分 (单位: 毫秒)
+SEGMENT_MIN_MS = 2000  # 切分后每段最短时长 (单位: 毫秒)
+SEGMENT_MIN_PAUSE_MS = 200  # 可作为切分点的最短停顿 (单位: 毫秒)
+
+TAG_PREFIX = re.compile(r"^(?:<\|[^|]*\|>)+")
+
+
+def speech_mask(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    计算每帧是否为语音
+
+    参数:
+        samples (np.ndarray): 单声道 float32 采样 (范围 -1~1)
+        sample_rate (int): 采样率
+
+    返回:
+        np.ndarray: 布尔数组, 每个元素对应一帧
+    """
+    frame = int(sample_rate * SEGMENT_FRAME_MS / 1000)
+    frames = len(samples) // frame
+    if frames == 0:
+        return np.zeros(0, dtype=bool)
+
+    power = np.mean(np.square(samples[: frames * frame].reshape(frames, frame)), axis=1)
+    energy_db = 10 * np.log10(power + 1e-10)
+    threshold = max(SEGMENT_FLOOR_DB, np.percentile(energy_db, 10) + SEGMENT_MARGIN_DB)
+    return energy_db > threshold
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    裁剪首尾静音
+
+    返回:
+        np.ndarray: 裁剪后的采样 (视图, 不复制), 没有语音时返回空数组
+    """
+    mask = speech_mask(samples, sample_rate)
+    speech = np.flatnonzero(mask)
+    if len(speech) == 0:
+        return samples[:0]
+
+    frame = int(sample_rate * SEGMENT_FRAME_MS / 1000)
+    pad = int(sample_rate * SEGMENT_PAD_MS / 1000)
+    start = max(0, speech[0] * frame - pad)
+    end = min(len(samples), (speech[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def split_on_pauses(samples: np.ndarray, sample_rate: int) -> list:
+    """
+    在句内停顿处切分长音频
+
+    参数:
+        samples (np.ndarray): 单声道 float32 采样 (通常已裁剪首尾静音)
+        sample_rate (int): 采样率
+
+    返回:
+        list[np.ndarray]: 按时间顺序排列的分段, 不超过最大时长时只有一段
+
+    注意:
+        每段在 [SEGMENT_MIN_MS, SEGMENT_MAX_MS] 范围内选择最靠后的停顿中点切分,
+        范围内没有停顿时在最大时长处直接切分
+    """
+    max_len = int(sample_rate * SEGMENT_MAX_MS / 1000)
+    if len(samples) <= max_len:
+        return [samples]
+
+    frame = int(sample_rate * SEGMENT_FRAME_MS / 1000)
+    mask = speech_mask(samples, sample_rate)
+
+    # 找出所有连续静音帧区间, 取足够长的停顿中点作为候选切分点
+    padded = np.concatenate(([True], mask, [True])).astype(np.int8)
+    edges = np.diff(padded)
+    pause_starts = np.flatnonzero(edges == -1)
+    pause_ends = np.flatnonzero(edges == 1)
+    long_pauses = (pause_ends - pause_starts) * SEGMENT_FRAME_MS >= SEGMENT_MIN_PAUSE_MS
+    cut_points = ((pause_starts + pause_ends) // 2)[long_pauses] * frame
+
+    min_len = int(sample_rate * SEGMENT_MIN_MS / 1000)
+    segments = []
+    start = 0
+    while len(samples) - start > max_len:
+        candidates = cut_points[
+            (cut_points >= start + min_len) & (cut_points <= start + max_len)
+        ]
+        end = int(candidates[-1]) if len(candidates) else start + max_len
+        segments.append(samples[start:end])
+        start = end
+    segments.append(samples[start:])
+    return segments
+
+
+def stitch_texts(texts: list) -> str:
+    """
+    按顺序拼接各段识别结果
+
+    参数:
+        texts (list[str]): 各段识别文本, 如 '<|zh|><|NEUTRAL|><|Speech|><|woitn|>你好'
+
+    返回:
+        str: 拼接后的文本, 保留第一段的标签, 去掉后续各段的标签
+    """
+    if not texts:
+        return ""
+    return texts[0] + "".join(TAG_PREFIX.sub("", text) for text in texts[1:])
@@ -0,0 +1,253 @@
+"""
+流式语音识别
+
+
+模块功能
+1. 读取 audio_io 发布的音频分块流 (ASR_STREAM_INPUT_KEY), 每条消息包含:
+    - session_id : 会话ID
+    - seq        : 分块序号
+    - final      : "1" 表示语音端点 (一句话结束)
+    - audio      : 原始 PCM 记录
+
+2. 使用在线模型 (paraformer-zh-streaming) 逐块增量识别, 每个会话保存独立的模型缓存
+
+3. 识别结果发布到会话的结果流 asr_partial:{session_id}:
+    - type=partial : 当前句子的中间结果 (累计文本)
+    - type=final   : 端点处的最终结果
+   最终结果同时写入 asr:{session_id} 并推送到 ASR 输出队列, 与整句识别的下游接口一致
+
+注意:
+    - 同一会话的分块按到达顺序串行识别, 不同会话之间并行
+    - 会话状态只保存在本进程中, 流式模式只能运行一个 ASR 服务实例
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("asr_server.streaming")
+
+
+#######################################################################
+#    模块配置
+#######################################################################
+
+ASR_STREAM_MODEL = "paraformer-zh-streaming"
+ASR_STREAM_CHUNK_SIZE = [0, 10, 5]  # 600ms 分块, 300ms 前瞻
+ASR_STREAM_ENCODER_LOOK_BACK = 4  # 编码器自注意力回看的分块数
+ASR_STREAM_DECODER_LOOK_BACK = 1  # 解码器交叉注意力回看的分块数
+
+ASR_PARTIAL_KEY_PREFIX = "asr_partial"  # 会话结果流 asr_partial:{session_id}
+ASR_PARTIAL_MAXLEN = 200  # 会话结果流最大长度
+ASR_PARTIAL_EXPIRE = 300  # 会话结果流过期时间 (单位: 秒)
+
+ASR_STREAM_SESSION_TIMEOUT = 30  # 会话超过该时间没有新分块则丢弃状态 (单位: 秒)
+
+
+#######################################################################
+#    流式识别引擎
+#######################################################################
+
+
+def load_streaming_engine(device):
+    """
+    加载在线识别模型
+
+    参数:
+        device (str): 推理设备
+
+    返回:
+        AutoModel: 在线识别模型
+    """
+    from funasr import AutoModel
+
+    logger.info("加载流式识别引擎: %s, 设备: %s", ASR_STREAM_MODEL, device)
+    return AutoModel(model=ASR_STREAM_MODEL, disable_update=True, device=device)
+
+
+class StreamSession:
+    """单个会话的流式识别状态"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.cache = {}  # 在线模型缓存
+        self.text = ""  # 当前句子累计文本
+        self.seq = 0  # 已发布的结果序号
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.last_active = time.monotonic()
+
+
+class StreamingRecognizer:
+    """
+    流式识别服务
+
+    参数:
+        redis_conn (redis.Redis): Redis 连接
+        engine: 在线识别模型
+        decode_fn (callable): 将 PCM 记录解码为 16kHz float32 数组的函数
+        input_key (str): 音频分块流的键
+        output_queue_key (str): 最终结果推送的 ASR 输出队列
+        workers (int): 推理线程数量
+    """
+
+    def __init__(
+        self, redis_conn, engine, decode_fn, input_key, output_queue_key, workers
+    ):
+        self.redis = redis_conn
+        self.engine = engine
+        self.decode_fn = decode_fn
+        self.input_key = input_key
+        self.output_queue_key = output_queue_key
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="asr-stream"
+        )
+        self.sessions = {}
+
+        # 统计信息
+        self.chunks = 0
+        self.finals = 0
+
+    async def run(self):
+        """后台任务: 读取音频分块流并分发到各会话"""
+        last_id = "$"
+        try:
+            while True:
+                try:
+                    response = await self.redis.xread(
+                        {self.input_key: last_id}, count=100, block=1000
+                    )
+                except Exception as e:
+                    logger.error("读取音频分块流失败: %s", e)
+                    await asyncio.sleep(1)
+                    continue
+
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        last_id = entry_id
+                        self.dispatch(fields)
+
+                self.expire_sessions()
+        finally:
+            for session in self.sessions.values():
+                session.task.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def dispatch(self, fields):
+        """将分块放入会话队列, 会话首个分块时创建处理任务"""
+        session_id = fields.get(b"session_id", b"").decode()
+        if not session_id:
+            return
+
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = StreamSession(session_id)
+            session.task = asyncio.create_task(self.session_worker(session))
+            self.sessions[session_id] = session
+
+        session.last_active = time.monotonic()
+        session.queue.put_nowait(
+            (fields.get(b"audio", b""), fields.get(b"final") == b"1")
+        )
+
+    def expire_sessions(self):
+        """丢弃长时间没有新分块的会话状态 (设备断开等情况)"""
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if (
+                now - session.last_active > ASR_STREAM_SESSION_TIMEOUT
+                and session.queue.empty()
+            ):
+                logger.info("流式会话超时, 丢弃状态: %s", session_id)
+                session.task.cancel()
+                del self.sessions[session_id]
+
+    async def session_worker(self, session):
+        """按顺序识别单个会话的分块"""
+        loop = asyncio.get_running_loop()
+        while True:
+            audio, final = await session.queue.get()
+            try:
+                samples = self.decode_fn(audio) if audio else None
+                text = await loop.run_in_executor(
+                    self.executor, self.infer_chunk, session.cache, samples, final
+                )
+                self.chunks += 1
+                session.text += text
+
+                if final:
+                    await self.publish_final(session)
+                    session.cache = {}
+                    session.text = ""
+                elif text:
+                    await self.publish(session, "partial")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(
+                    "流式识别失败: %s - %s", session.session_id, e, exc_info=True
+                )
+                session.cache = {}
+                session.text = ""
+
+    def infer_chunk(self, cache, samples, final) -> str:
+        """
+        识别一个分块, 在推理线程中执行
+
+        参数:
+            cache (dict): 会话的模型缓存, 由模型原地更新
+            samples (np.ndarray | None): 16kHz float32 采样, 端点消息可以为空
+            final (bool): 是否为句子最后一个分块
+
+        返回:
+            str: 本分块新增的文本
+        """
+        if samples is None:
+            if not final:
+                return ""
+            import numpy as np
+
+            samples = np.zeros(0, dtype=np.float32)
+
+        result = self.engine.generate(
+            input=samples,
+            cache=cache,
+            is_final=final,
+            chunk_size=ASR_STREAM_CHUNK_SIZE,
+            encoder_chunk_look_back=ASR_STREAM_ENCODER_LOOK_BACK,
+            decoder_chunk_look_back=ASR_STREAM_DECODER_LOOK_BACK,
+        )
+        return result[0]["text"] if result else ""
+
+    async def publish(self, session, result_type):
+        """发布结果到会话结果流"""
+        key = f"{ASR_PARTIAL_KEY_PREFIX}:{session.session_id}"
+        session.seq += 1
+        await self.redis.xadd(
+            key,
+            {"type": result_type, "seq": session.seq, "text": session.text},
+            maxlen=ASR_PARTIAL_MAXLEN,
+            approximate=True,
+        )
+        await self.redis.expire(key, ASR_PARTIAL_EXPIRE)
+
+    async def publish_final(self, session):
+        """发布最终结果, 写入 ASR 条目并推送到输出队列"""
+        await self.publish(session, "final")
+        await self.redis.hset(
+            f"asr:{session.session_id}",
+            mapping={"text": session.text, "status": "True", "audio": b""},
+        )
+        await self.redis.lpush(self.output_queue_key, session.session_id)
+        self.finals += 1
+        logger.info("流式识别完成: %s", session.session_id)
+
+    def stats(self) -> dict:
+        """返回流式识别统计信息"""
+        return {
+            "sessions": len(self.sessions),
+            "chunks": self.chunks,
+            "finals": self.finals,
+        }
@@ -0,0 +1,252 @@
+"""
+服务间音频数据格式
+
+模块功能
+1. Opus 帧序列打包/解包
+    - 每帧格式: [帧长度(2字节, 大端)][Opus 帧数据]
+    - 用于 TTS 预编码的下行音频, audio_io 解包后直接加密发送
+
+2. 原始 PCM 记录
+    - 格式: [16字节固定头][PCM 数据]
+    - 头部 (小端): 魔数 "RPCM"(4) 版本(1) 样本格式(1) 通道数(2) 采样率(4) 帧数(4)
+    - 用于服务间音频传递 (上行 audio_io->ASR, 下行 TTS->audio_io), 替代 WAV 容器
+    - 消费方可通过 pcm_to_numpy 零拷贝读取为 NumPy 数组
+
+3. 识别输入解码
+    - decode_audio_input: 原始 PCM 记录或 16 位 WAV 在内存中解码为单声道 float32 采样数组,
+      用于 ASR 识别引擎 (ASR 服务和离线工具共用, 不依赖服务模块)
+"""
+
+import struct
+import wave
+from io import BytesIO
+
+
+#######################################################################
+#    Opus 帧序列
+#######################################################################
+
+OPUS_FRAME_HEADER = struct.Struct(">H")
+
+
+def pack_opus_frames(frames) -> bytes:
+    """
+    将 Opus 帧列表打包为字节串
+
+    参数:
+        frames (list[bytes]): Opus 帧列表, 单帧不超过 65535 字节
+
+    返回:
+        bytes: 打包后的数据
+    """
+    parts = []
+    for frame in frames:
+        parts.append(OPUS_FRAME_HEADER.pack(len(frame)))
+        parts.append(frame)
+    return b"".join(parts)
+
+
+def unpack_opus_frames(data: bytes) -> list:
+    """
+    将 pack_opus_frames 打包的数据解包为 Opus 帧列表
+
+    参数:
+        data (bytes): 打包后的数据
+
+    返回:
+        list[bytes]: Opus 帧列表
+
+    异常:
+        ValueError: 数据被截断
+    """
+    frames = []
+    view = memoryview(data)
+    offset = 0
+    while offset < len(view):
+        if offset + OPUS_FRAME_HEADER.size > len(view):
+            raise ValueError("Opus 帧数据被截断")
+        (length,) = OPUS_FRAME_HEADER.unpack_from(view, offset)
+        offset += OPUS_FRAME_HEADER.size
+        if offset + length > len(view):
+            raise ValueError("Opus 帧数据被截断")
+        frames.append(bytes(view[offset : offset + length]))
+        offset += length
+    return frames
+
+
+#######################################################################
+#    原始 PCM 记录
+#######################################################################
+
+PCM_MAGIC = b"RPCM"
+PCM_VERSION = 1
+PCM_HEADER = struct.Struct("<4sBBHII")
+PCM_HEADER_SIZE = PCM_HEADER.size
+
+# 样本格式
+PCM_S16LE = 1  # 16位有符号整数
+PCM_F32LE = 2  # 32位浮点
+
+PCM_SAMPLE_WIDTH = {PCM_S16LE: 2, PCM_F32LE: 4}
+PCM_NUMPY_DTYPE = {PCM_S16LE: "<i2", PCM_F32LE: "<f4"}
+
+
+def pack_pcm(
+    pcm_data: bytes, sample_rate: int, channels: int, sample_format: int = PCM_S16LE
+) -> bytes:
+    """
+    将 PCM 数据打包为原始 PCM 记录
+
+    参数:
+        pcm_data (bytes): 交错存储的 PCM 数据
+        sample_rate (int): 采样率
+        channels (int): 通道数
+        sample_format (int): 样本格式, PCM_S16LE 或 PCM_F32LE
+
+    返回:
+        bytes: 原始 PCM 记录
+    """
+    frame_bytes = PCM_SAMPLE_WIDTH[sample_format] * channels
+    if len(pcm_data) % frame_bytes:
+        raise ValueError("PCM 数据长度不是完整帧的整数倍")
+
+    header = PCM_HEADER.pack(
+        PCM_MAGIC,
+        PCM_VERSION,
+        sample_format,
+        channels,
+        sample_rate,
+        len(pcm_data) // frame_bytes,
+    )
+    return header + pcm_data
+
+
+def is_pcm_record(data: bytes) -> bool:
+    """判断数据是否为原始 PCM 记录"""
+    return len(data) >= PCM_HEADER_SIZE and data[:4] == PCM_MAGIC
+
+
+def unpack_pcm(data: bytes) -> tuple[int, int, int, memoryview]:
+    """
+    解析原始 PCM 记录
+
+    参数:
+        data (bytes): 原始 PCM 记录
+
+    返回:
+        tuple: (采样率, 通道数, 样本格式, PCM 数据的 memoryview)
+
+    异常:
+        ValueError: 头部无效或数据长度与帧数不一致
+    """
+    if not is_pcm_record(data):
+        raise ValueError("不是原始 PCM 记录")
+
+    _, version, sample_format, channels, sample_rate, frame_count = (
+        PCM_HEADER.unpack_from(data)
+    )
+    if version != PCM_VERSION or sample_format not in PCM_SAMPLE_WIDTH:
+        raise ValueError(f"不支持的 PCM 记录: 版本 {version}, 样本格式 {sample_format}")
+
+    payload = memoryview(data)[PCM_HEADER_SIZE:]
+    if len(payload) != frame_count * channels * PCM_SAMPLE_WIDTH[sample_format]:
+        raise ValueError("PCM 数据长度与头部帧数不一致")
+
+    return sample_rate, channels, sample_format, payload
+
+
+def pcm_duration_ms(data: bytes) -> int:
+    """返回原始 PCM 记录的音频时长 (单位: 毫秒)"""
+    sample_rate, channels, sample_format, payload = unpack_pcm(data)
+    frame_bytes = channels * PCM_SAMPLE_WIDTH[sample_format]
+    return len(payload) * 1000 // (frame_bytes * sample_rate)
+
+
+def pcm_to_numpy(data: bytes):
+    """
+    将原始 PCM 记录零拷贝读取为 NumPy 数组
+
+    参数:
+        data (bytes): 原始 PCM 记录
+
+    返回:
+        tuple: (采样率, 形状为 (帧数, 通道数) 的只读数组)
+    """
+    import numpy as np
+
+    sample_rate, channels, sample_format, payload = unpack_pcm(data)
+    samples = np.frombuffer(payload, dtype=PCM_NUMPY_DTYPE[sample_format])
+    return sample_rate, samples.reshape(-1, channels)
+
+
+def pcm_record_to_wav(data: bytes) -> bytes:
+    """将 16 位原始 PCM 记录转为 WAV, 仅用于必须读取文件的外部工具"""
+    sample_rate, channels, sample_format, payload = unpack_pcm(data)
+    if sample_format != PCM_S16LE:
+        raise ValueError("仅支持 16 位 PCM 转 WAV")
+
+    with BytesIO() as wav_buffer:
+        with wave.open(wav_buffer, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(payload)
+        return wav_buffer.getvalue()
+
+
+#######################################################################
+#    识别输入
+#######################################################################
+
+
+def decode_audio_input(audio_bytes: bytes, sample_rate: int = 16000):
+    """
+    在内存中将上传的音频解码为识别引擎输入
+
+    参数:
+        audio_bytes (bytes): 原始 PCM 记录或 16 位 WAV 数据
+        sample_rate (int): 识别引擎输入采样率
+
+    返回:
+        np.ndarray | None: 单声道 float32 采样数组 (范围 -1~1),
+                           无法在内存中解析时返回 None, 由调用方回退到临时文件
+
+    注意:
+        - 多声道取平均值合并为单声道
+        - 采样率不一致时使用线性插值重采样
+    """
+    import numpy as np
+
+    try:
+        if is_pcm_record(audio_bytes):
+            source_rate, samples = pcm_to_numpy(audio_bytes)
+        elif audio_bytes[:4] == b"RIFF":
+            with wave.open(BytesIO(audio_bytes), "rb") as wav:
+                if wav.getsampwidth() != 2:
+                    return None
+                source_rate = wav.getframerate()
+                samples = np.frombuffer(
+                    wav.readframes(wav.getnframes()), dtype="<i2"
+                ).reshape(-1, wav.getnchannels())
+        else:
+            return None
+    except (ValueError, EOFError, wave.Error):
+        return None
+
+    # 整数样本归一化到 -1~1, 与识别引擎读取 WAV 文件的结果一致
+    if samples.dtype.kind == "i":
+        samples = samples.astype(np.float32) / 32768.0
+
+    # 合并为单声道
+    samples = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+
+    # 重采样
+    if source_rate != sample_rate and len(samples):
+        target_length = int(len(samples) * sample_rate / source_rate)
+        samples = np.interp(
+            np.arange(target_length) * (source_rate / sample_rate),
+            np.arange(len(samples)),
+            samples,
+        )
+
+    return np.ascontiguousarray(samples, dtype=np.float32)
@@ -0,0 +1,443 @@
+"""
+上行音频抓包模块 (Ogg Opus)
+
+
+模块功能
+1. 将设备上行的 Opus 数据包 (已解密, 未解码) 直接封装为 Ogg Opus 文件
+    - 不做任何解码, 每个数据包的开销仅为一次列表追加
+    - 文件可用常见播放器直接播放, 也可通过 read_ogg_opus_packets 回放到压测工具
+
+2. 写入管理
+   - 事件循环只负责缓存数据包, 由后台任务定时批量交给单独的写线程落盘
+   - 按文件大小轮转
+   - 按目录总大小执行磁盘配额, 超出时删除最旧的抓包文件
+
+主要组件：
+- OggOpusWriter  : Ogg 分页与 Opus 头写入
+- SessionCapture : 单个会话的抓包状态
+- CaptureManager : 会话抓包的开启/关闭, 抽样, 批量写入, 轮转和配额
+"""
+
+import asyncio
+import logging
+import os
+import random
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("audio_io.capture")
+
+
+#######################################################################
+#    Ogg 封装
+#######################################################################
+
+# Ogg 页面 CRC (多项式 0x04C11DB7, 非反射, 初值 0)
+_CRC_TABLE = []
+for _i in range(256):
+    _crc = _i << 24
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ 0x04C11DB7) if _crc & 0x80000000 else (_crc << 1)
+    _CRC_TABLE.append(_crc & 0xFFFFFFFF)
+
+
+def ogg_crc32(data: bytes) -> int:
+    """计算 Ogg 页面校验和"""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_TABLE[((crc >> 24) ^ byte) & 0xFF]
+    return crc
+
+
+def opus_packet_samples(packet: bytes) -> int:
+    """
+    根据 TOC 字节计算 Opus 数据包包含的样本数 (按 48kHz 计)
+
+    参数:
+        packet (bytes): Opus 数据包
+
+    返回:
+        int: 48kHz 下的样本数, 数据包无效时返回 0
+    """
+    if not packet:
+        return 0
+
+    toc = packet[0]
+    config = toc >> 3
+    if config < 12:  # SILK: 10/20/40/60 ms
+        frame_samples = (480, 960, 1920, 2880)[config & 0x03]
+    elif config < 16:  # Hybrid: 10/20 ms
+        frame_samples = (480, 960)[config & 0x01]
+    else:  # CELT: 2.5/5/10/20 ms
+        frame_samples = (120, 240, 480, 960)[config & 0x03]
+
+    count_code = toc & 0x03
+    if count_code == 0:
+        frame_count = 1
+    elif count_code in (1, 2):
+        frame_count = 2
+    else:
+        if len(packet) < 2:
+            return 0
+        frame_count = packet[1] & 0x3F
+
+    return frame_samples * frame_count
+
+
+class OggOpusWriter:
+    """
+    Ogg Opus 文件写入器
+
+    参数:
+        path (str): 输出文件路径
+        sample_rate (int): 原始输入采样率, 写入 OpusHead
+        channels (int): 音频通道数
+        comments (dict): 写入 OpusTags 的附加注释, 如 session_id
+
+    注意:
+        非线程安全, 同一个写入器只能在一个线程中使用
+    """
+
+    def __init__(self, path, sample_rate, channels, comments=None):
+        self.path = path
+        self.serial = random.getrandbits(32)
+        self.page_sequence = 0
+        self.granule = 0
+        self.bytes_written = 0
+        self.file = open(path, "wb")
+
+        # OpusHead: 版本, 通道数, pre-skip, 输入采样率, 输出增益, 映射族
+        opus_head = b"OpusHead" + struct.pack(
+            "<BBHIhB", 1, channels, 0, sample_rate, 0, 0
+        )
+        self._write_page([opus_head], header_type=0x02, granule=0)
+
+        vendor = b"agentServer audio_io capture"
+        user_comments = [
+            f"{key}={value}".encode("utf-8") for key, value in (comments or {}).items()
+        ]
+        opus_tags = b"OpusTags" + struct.pack("<I", len(vendor)) + vendor
+        opus_tags += struct.pack("<I", len(user_comments))
+        for comment in user_comments:
+            opus_tags += struct.pack("<I", len(comment)) + comment
+        self._write_page([opus_tags], header_type=0x00, granule=0)
+
+    def _write_page(self, packets, header_type, granule):
+        """将若干完整数据包写成一个 Ogg 页面"""
+        lacing = bytearray()
+        for packet in packets:
+            length = len(packet)
+            lacing.extend(b"\xff" * (length // 255))
+            lacing.append(length % 255)
+
+        header = struct.pack(
+            "<4sBBqIIIB",
+            b"OggS",
+            0,
+            header_type,
+            granule,
+            self.serial,
+            self.page_sequence,
+            0,
+            len(lacing),
+        )
+        page = bytearray(header + lacing + b"".join(packets))
+        struct.pack_into("<I", page, 22, ogg_crc32(page))
+
+        self.file.write(page)
+        self.page_sequence += 1
+        self.bytes_written += len(page)
+
+    def write_packets(self, packets):
+        """
+        批量写入 Opus 数据包, 每个页面最多 255 个分段
+
+        参数:
+            packets (list[bytes]): Opus 数据包列表
+        """
+        page_packets = []
+        page_segments = 0
+        for packet in packets:
+            segments = len(packet) // 255 + 1
+            if segments > 255:
+                # 单包超过一个页面容量, 上行语音帧不会出现, 直接丢弃
+                logger.warning("Opus 数据包过大, 丢弃: %d bytes", len(packet))
+                continue
+            if page_segments + segments > 255:
+                self._write_page(page_packets, header_type=0x00, granule=self.granule)
+                page_packets = []
+                page_segments = 0
+
+            page_packets.append(packet)
+            page_segments += segments
+            self.granule += opus_packet_samples(packet)
+
+        if page_packets:
+            self._write_page(page_packets, header_type=0x00, granule=self.granule)
+
+    def close(self):
+        """写入结束页面并关闭文件"""
+        if self.file.closed:
+            return
+        self._write_page([], header_type=0x04, granule=self.granule)
+        self.file.close()
+
+
+def read_ogg_opus_packets(path):
+    """
+    读取 Ogg Opus 抓包文件, 按顺序返回 Opus 数据包 (跳过 OpusHead / OpusTags)
+
+    参数:
+        path (str): 抓包文件路径
+
+    返回:
+        generator: 逐个产出 Opus 数据包 (bytes)
+
+    示例:
+        >>> for packet in read_ogg_opus_packets("capture.ogg"):
+        ...     transport.sendto(encrypt_audio_data(key, nonce, packet, sequence))
+    """
+    packet_index = 0
+    partial = b""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(27)
+            if len(header) < 27:
+                return
+            if header[:4] != b"OggS":
+                raise ValueError(f"无效的 Ogg 页面: {path}")
+
+            segment_count = header[26]
+            lacing = f.read(segment_count)
+            data = f.read(sum(lacing))
+
+            offset = 0
+            for value in lacing:
+                partial += data[offset : offset + value]
+                offset += value
+                if value < 255:
+                    if packet_index >= 2:
+                        yield partial
+                    packet_index += 1
+                    partial = b""
+
+
+#######################################################################
+#    会话抓包管理
+#######################################################################
+
+
+class SessionCapture:
+    """
+    单个会话的抓包状态
+
+    参数:
+        session_id (str): 会话ID
+        sample_rate (int): 上行音频采样率
+        channels (int): 音频通道数
+    """
+
+    def __init__(self, session_id, sample_rate, channels):
+        self.session_id = session_id
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # pending, packets, files 由 lock 保护:
+        # thread 模式下音频工作线程追加数据包, 事件循环取出, 写线程更新统计
+        self.lock = threading.Lock()
+        self.pending = []  # 待写入的 Opus 数据包, 最后一次取出后为 None
+        self.closing = False
+        self.writer = None  # 仅在写线程中访问
+        self.file_index = 0
+        self.packets = 0
+        self.files = []
+
+    def write(self, packet):
+        """缓存一个 Opus 数据包, 不做拷贝以外的任何处理 (可在任意线程调用)"""
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(packet)
+
+    def take_pending(self):
+        """
+        取出待写入的数据包
+
+        注意:
+            会话已关闭时为最后一次取出, 之后的写入直接丢弃
+        """
+        with self.lock:
+            packets = self.pending or []
+            self.pending = None if self.closing else []
+        return packets
+
+
+class CaptureManager:
+    """
+    上行音频抓包管理器
+
+    参数:
+        capture_dir (str): 抓包文件目录
+        sample_ratio (float): 新建会话时自动开启抓包的概率 (0 表示只手动开启)
+        max_file_bytes (int): 单个文件的最大字节数, 超出后轮转
+        disk_quota_bytes (int): 抓包目录的最大总字节数, 超出后删除最旧文件
+        flush_interval (float): 批量写入间隔 (单位: 秒)
+    """
+
+    def __init__(
+        self, capture_dir, sample_ratio, max_file_bytes, disk_quota_bytes, flush_interval
+    ):
+        self.capture_dir = capture_dir
+        self.sample_ratio = sample_ratio
+        self.max_file_bytes = max_file_bytes
+        self.disk_quota_bytes = disk_quota_bytes
+        self.flush_interval = flush_interval
+        self.captures = {}
+        self.retired = []  # 已关闭但仍有数据待写入的会话
+        # 单线程写入, 保证同一文件的写入顺序
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+
+        os.makedirs(self.capture_dir, exist_ok=True)
+
+    def start(self, session_id, sample_rate, channels):
+        """开启指定会话的抓包"""
+        capture = self.captures.get(session_id)
+        if capture:
+            return capture
+
+        capture = SessionCapture(session_id, sample_rate, channels)
+        self.captures[session_id] = capture
+        logger.info(f"开启上行音频抓包, session_id: {session_id}")
+        return capture
+
+    def maybe_start(self, session_id, sample_rate, channels):
+        """按抽样比例决定是否开启抓包"""
+        if self.sample_ratio > 0 and random.random() < self.sample_ratio:
+            self.start(session_id, sample_rate, channels)
+
+    def stop(self, session_id):
+        """关闭指定会话的抓包, 剩余数据在下一次批量写入时落盘"""
+        capture = self.captures.pop(session_id, None)
+        if capture:
+            capture.closing = True
+            self.retired.append(capture)
+            logger.info(f"关闭上行音频抓包, session_id: {session_id}")
+
+    def write(self, session_id, packet):
+        """写入一个上行 Opus 数据包 (会话未开启抓包时直接返回)"""
+        capture = self.captures.get(session_id)
+        if capture is not None:
+            capture.write(packet)
+
+    def status(self):
+        """获取当前抓包状态"""
+        result = []
+        for capture in list(self.captures.values()):
+            with capture.lock:
+                result.append(
+                    {
+                        "session_id": capture.session_id,
+                        "packets": capture.packets,
+                        "files": list(capture.files),
+                    }
+                )
+        return result
+
+    async def run(self):
+        """后台批量写入任务"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush(loop)
+            except Exception as e:
+                logger.error(f"抓包写入失败: {str(e)}", exc_info=True)
+
+    async def flush(self, loop=None):
+        """把所有会话缓存的数据包交给写线程, 并清理已关闭的会话"""
+        loop = loop or asyncio.get_running_loop()
+
+        retired, self.retired = self.retired, []
+
+        batch = []
+        for capture in list(self.captures.values()) + retired:
+            packets = capture.take_pending()
+            if packets or capture.closing:
+                batch.append((capture, packets))
+
+        if batch:
+            await loop.run_in_executor(self.executor, self._write_batch, batch)
+
+    async def close(self):
+        """关闭所有抓包并写完剩余数据"""
+        for session_id in list(self.captures):
+            self.stop(session_id)
+        await self.flush()
+        self.executor.shutdown(wait=True)
+
+    #######################################################################
+    #    以下方法仅在写线程中执行
+    #######################################################################
+
+    def _write_batch(self, batch):
+        for capture, packets in batch:
+            if packets:
+                if capture.writer is None:
+                    self._open_writer(capture)
+                capture.writer.write_packets(packets)
+                with capture.lock:
+                    capture.packets += len(packets)
+
+                if capture.writer.bytes_written >= self.max_file_bytes:
+                    capture.writer.close()
+                    capture.writer = None
+
+            if capture.closing and capture.writer is not None:
+                capture.writer.close()
+                capture.writer = None
+
+        self._enforce_quota()
+
+    def _open_writer(self, capture):
+        file_name = "{}_{}_{:03d}.ogg".format(
+            capture.session_id,
+            time.strftime("%Y%m%d-%H%M%S"),
+            capture.file_index,
+        )
+        path = os.path.join(self.capture_dir, file_name)
+        capture.writer = OggOpusWriter(
+            path,
+            capture.sample_rate,
+            capture.channels,
+            comments={"session_id": capture.session_id},
+        )
+        capture.file_index += 1
+        with capture.lock:
+            capture.files.append(file_name)
+
+    def _enforce_quota(self):
+        """超出磁盘配额时删除最旧的已关闭文件"""
+        open_paths = {
+            capture.writer.path
+            for capture in list(self.captures.values())
+            if capture.writer is not None
+        }
+
+        files = []
+        total = 0
+        with os.scandir(self.capture_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".ogg"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+                    total += stat.st_size
+
+        files.sort()
+        for _, path, size in files:
+            if total <= self.disk_quota_bytes:
+                break
+            if path in open_paths:
+                continue
+            os.unlink(path)
+            total -= size
+            logger.info(f"抓包目录超出配额, 删除旧文件: {path}")
@@ -14,12 +14,17 @@
 主要组件：
 - UdpProtocol    : UDP协议实现,处理数据接收/发送生命周期
 - UDP线程池管理   : 管理多个并发的UDP会话通道
-- 音频发送        : TTS队列->PCM->Opus->AES加密->网络传输
-- 音频接收        : 网络传输->AES解密->Opus解码->PCM->ASR队列
+- 音频发送        : TTS队列->Opus帧(TTS预编码, 或 PCM->Opus)->AES加密->网络传输
+                    按会话语音队列的序号顺序播放, 分句流式合成时第一句就绪即开始发送
+- 音频接收        : 网络传输->AES解密->Opus解码->PCM记录->ASR队列
+- 流式识别        : 说话过程中按固定时长发布音频分块到 ASR 流 (可选)
+- 上行抓包        : AES解密后的Opus数据包->Ogg Opus文件 (可选, 见 capture.py)
+- 音频工作线程池  : 事件循环只做收包和协议头校验, 解密/解码/VAD 交给工作线程 (可选)
 """
 
 from contextlib import asynccontextmanager
 import os
+import sys
 import logging
 
 from fastapi import FastAPI, HTTPException, Query
@@ -35,6 +40,10 @@ import asyncio
 import redis.asyncio as redis
 import webrtcvad
 
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import wave
 from io import BytesIO
 
@@ -42,39 +51,36 @@ import aiohttp
 
 from pydantic import BaseModel, Field
 
+from capture import CaptureManager
+
+# 公共模块位于 components 目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_format import is_pcm_record, pack_pcm, unpack_opus_frames, unpack_pcm
+from utterance import (
+    STATE_DONE,
+    STATE_FAILED,
+    STATE_PLAYING,
+    STATE_QUEUED,
+    STATE_READY,
+    STATE_SYNTHESIZING,
+    index_key,
+    parse_utterance_id,
+    record_key,
+    remove_utterance,
+    transition,
+)
+
 #######################################################################
 #    配置日志
 #######################################################################
 
-# 配置日志记录
-
-logger = logging.getLogger("audio_io")
-logger.setLevel(logging.INFO)
-
-# 日志目录
-current_dir = os.getcwd()
-log_file_path = os.path.join(current_dir, "storage/logs")
-log_dir = os.path.expanduser(log_file_path)
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file_path = os.path.join(log_dir, "audio_io.log")
-
-# 创建文件处理器
-file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
-file_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
+from log import get_hot_logger, setup_logger
 
-# 创建控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
+# 配置日志记录 (异步写入, 见 components/log.py)
+logger = setup_logger("audio_io")
 
-# 添加处理器
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# 热路径日志 (每个数据包都会执行), 抽样并限流
+hot_logger = get_hot_logger(logger)
 
 # 关闭日志（需要时取消注释）
 # logger.setLevel(logging.CRITICAL)
@@ -91,6 +97,14 @@ UDP_PORT = 5000  # UDP服务默认监听端口
 
 udp_pool = {}
 
+# 上行音频处理模式
+#   inline: 在事件循环中完成解密, 解码和VAD (默认)
+#   thread: 事件循环只做收包和协议头校验, 其余工作按会话顺序交给工作线程池
+AUDIO_WORKER_MODE = "inline"
+AUDIO_WORKER_THREADS = 4  # 工作线程数量
+AUDIO_WORKER_QUEUE_SIZE = 50  # 每个会话最多排队的音频帧, 超出后丢弃新帧
+AUDIO_WORKER_BATCH = 16  # 单次调度最多处理的帧数, 处理完后让出线程保证会话间公平
+
 
 # DAO 服务地址
 DAO_ASR_URL = "http://192.168.0.111:8005/asr"
@@ -101,26 +115,72 @@ DAO_SESSION_URL = "http://192.168.0.111:8005/sessions"
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
 
+# 会话过期时间, 与 DAO 的 SESSION_EXPIRE_TIME 一致 (单位: 秒)
+SESSION_EXPIRE_TIME = 300
+
 # REDIS TTS队列
 TTS_OUTPUT_QUEUE_KEY = "tts_output_queue"
+TTS_STREAM_BLOCK_MS = 1000  # 读取 TTS 会话音频流的阻塞时间 (单位: 毫秒)
+TTS_STREAM_TIMEOUT = 30  # 等待下一句音频的最长时间, 超时放弃该会话音频流 (单位: 秒)
+
+# 会话语音队列播放 (见 components/utterance.py): 每个会话一个播放协程, 按序号顺序播放
+TTS_UTTERANCE_TIMEOUT = 30  # 队首语音等待合成的最长时间, 超时跳过, 避免阻塞后续语音 (单位: 秒)
+TTS_PLAYER_IDLE_TIMEOUT = 60  # 会话语音队列为空时播放协程的保留时间 (单位: 秒)
+
+tts_players = {}  # {session_id: (唤醒事件, 播放协程)}
+
+# 流式识别: 说话过程中发布音频分块, 端点时发布最后一块, 不再提交整句 ASR 条目
+# 需要 ASR 服务同时开启 ASR_STREAMING_ENABLED
+ASR_STREAMING_ENABLED = False
+ASR_STREAM_INPUT_KEY = "asr_stream_input"  # 音频分块流
+ASR_STREAM_CHUNK_MS = 600  # 分块时长 (单位: 毫秒), 与流式模型的分块大小一致
+ASR_STREAM_MAXLEN = 10000  # 音频分块流最大长度
+
+# 上行音频抓包 (Ogg Opus, 不解码)
+CAPTURE_DIR = os.path.join(os.getcwd(), "storage/capture")  # 抓包文件目录
+CAPTURE_SAMPLE_RATIO = 0.0  # 新建会话自动抓包的比例, 0 表示只通过接口手动开启
+CAPTURE_MAX_FILE_BYTES = 8 * 1024 * 1024  # 单个抓包文件上限, 超出后轮转
+CAPTURE_DISK_QUOTA_BYTES = 512 * 1024 * 1024  # 抓包目录总大小上限
+CAPTURE_FLUSH_INTERVAL = 1.0  # 批量写入间隔 (单位: 秒)
+
+capture_manager = CaptureManager(
+    capture_dir=CAPTURE_DIR,
+    sample_ratio=CAPTURE_SAMPLE_RATIO,
+    max_file_bytes=CAPTURE_MAX_FILE_BYTES,
+    disk_quota_bytes=CAPTURE_DISK_QUOTA_BYTES,
+    flush_interval=CAPTURE_FLUSH_INTERVAL,
+)
 #######################################################################
 #    API 函数
 #######################################################################
 
 
-async def submit_to_asr_queue(session_id: str, audio_data: bytes):
-    """通过DAO接口创建ASR条目"""
+async def submit_to_asr_queue(session_id: str, audio_data: bytes, duration_ms: int):
+    """
+    通过DAO接口创建ASR条目
+
+    参数:
+        session_id (str): 会话ID
+        audio_data (bytes): 原始PCM记录
+        duration_ms (int): 音频时长 (单位: 毫秒), 供 ASR 服务按截止时间调度
+    """
     try:
         async with aiohttp.ClientSession() as session:
             form_data = aiohttp.FormData()
             form_data.add_field(
                 "audio",
                 audio_data,
-                content_type="audio/wav",
-                filename=f"{session_id}.wav",
+                content_type="application/octet-stream",
+                filename=f"{session_id}.pcm",
             )
+            params = {
+                "session_id": session_id,
+                "status": "False",
+                "text": "",
+                "duration_ms": duration_ms,
+            }
             async with session.post(
-                DAO_ASR_URL, data=form_data, params={"session_id": session_id}
+                DAO_ASR_URL, data=form_data, params=params
             ) as response:
                 if response.status == 200:
                     logger.info(f"ASR条目创建成功 session:{session_id}")
@@ -131,6 +191,36 @@ async def submit_to_asr_queue(session_id: str, audio_data: bytes):
         logger.error(f"创建ASR条目异常: {str(e)}")
 
 
+async def publish_asr_chunk(udp_protocol, audio_data: bytes, final: bool):
+    """
+    发布音频分块到 ASR 流式识别
+
+    参数:
+        udp_protocol (UdpProtocol): 会话的UDP协议对象
+        audio_data (bytes): 原始PCM记录
+        final (bool): 是否为句子最后一个分块
+
+    注意:
+        同一会话的分块通过 stream_lock 保证按调度顺序写入
+    """
+    async with udp_protocol.stream_lock:
+        try:
+            udp_protocol.stream_seq += 1
+            await app.state.redis.xadd(
+                ASR_STREAM_INPUT_KEY,
+                {
+                    "session_id": udp_protocol.session_id,
+                    "seq": udp_protocol.stream_seq,
+                    "final": "1" if final else "0",
+                    "audio": audio_data,
+                },
+                maxlen=ASR_STREAM_MAXLEN,
+                approximate=True,
+            )
+        except Exception as e:
+            logger.error(f"发布音频分块失败 session:{udp_protocol.session_id}: {e}")
+
+
 async def create_session(
     session_id: str,
     client_id: str,
@@ -218,34 +308,26 @@ def encrypt_audio_data(key, nonce, audio_data, udp_sequence):
     return new_nonce + encryptor_audio
 
 
-# 数据解密函数
-def decrypt_audio_data(key, received_data, udp_sequence):
+# 协议头校验函数
+def check_audio_header(received_data, udp_sequence):
     """
-    解密接收的音频数据包并验证协议完整性
+    校验接收数据包的协议头, 不做解密
 
     参数:
-        key (bytes): 16字节AES解密密钥
         received_data (bytes): 接收的完整数据包
         udp_sequence (int): 当前预期序列号
 
     返回:
-        tuple: (解密后的音频数据, 实际接收序列号)
-
-    处理流程:
-        1. 验证数据包基础完整性
-        2. 解析协议头信息
-        3. 验证序列号连续性
-        4. 执行AES-CTR解密
-        5. 返回解密结果与验证后的序列号
+        tuple: (nonce, 加密的音频数据, 实际接收序列号), 校验失败时均为 None
     """
     if len(received_data) < 16:  # 至少包含 nonce
         logger.error("Received packet size is too small")
-        return None, None
+        return None, None, None
     nonce = received_data[:16]
     # 检查 header ， 值应该为 0x01
     if nonce[0] == 0x01:
         logger.error("Received packet type is incoorect")
-        return None, None
+        return None, None, None
 
     # 提取 size 并转换回主机字节序
     size_bytes = nonce[2:4]
@@ -257,18 +339,50 @@ def decrypt_audio_data(key, received_data, udp_sequence):
     # 检验 received_sequence 是否为当前sequence 加 1
     if received_sequence != udp_sequence + 1:
         logger.error(f"Received sequence {received_sequence}")
-        return None, None
+        return None, None, None
 
     encrypted_audio = received_data[16 : 16 + size]
     if len(encrypted_audio) != size:
         logger.error("Actual encrypted audio size does not match the header size")
-        return None, None
+        return None, None, None
+
+    return nonce, encrypted_audio, received_sequence
 
+
+def aes_ctr_decrypt(key, nonce, encrypted_audio):
+    """使用AES-CTR模式解密音频数据"""
     cipher = Cipher(algorithms.AES(key), modes.CTR(nonce), backend=default_backend())
     decryptor = cipher.decryptor()
-    decrypted_audio = decryptor.update(encrypted_audio) + decryptor.finalize()
+    return decryptor.update(encrypted_audio) + decryptor.finalize()
 
-    return decrypted_audio, received_sequence
+
+# 数据解密函数
+def decrypt_audio_data(key, received_data, udp_sequence):
+    """
+    解密接收的音频数据包并验证协议完整性
+
+    参数:
+        key (bytes): 16字节AES解密密钥
+        received_data (bytes): 接收的完整数据包
+        udp_sequence (int): 当前预期序列号
+
+    返回:
+        tuple: (解密后的音频数据, 实际接收序列号)
+
+    处理流程:
+        1. 验证数据包基础完整性
+        2. 解析协议头信息
+        3. 验证序列号连续性
+        4. 执行AES-CTR解密
+        5. 返回解密结果与验证后的序列号
+    """
+    nonce, encrypted_audio, received_sequence = check_audio_header(
+        received_data, udp_sequence
+    )
+    if nonce is None:
+        return None, None
+
+    return aes_ctr_decrypt(key, nonce, encrypted_audio), received_sequence
 
 
 #######################################################################
@@ -285,7 +399,7 @@ def encode_audio(opus_encoder, input_frame_size, channels, sample_rate, data):
         input_frame_size (int): 音频帧时长 (单位: 毫秒)
         channels (int): 音频通道数量 (1-单声道, 2-立体声)
         sample_rate (int): 音频采样率 (如: 16000, 48000)
-        data (bytes): 要编码的原始PCM数据, 16位有符号格式
+        data (bytes | memoryview): 要编码的原始PCM数据, 16位有符号格式
 
     返回:
         list: 包含多个Opus编码帧的列表, 每个帧为bytes类型
@@ -304,18 +418,18 @@ def encode_audio(opus_encoder, input_frame_size, channels, sample_rate, data):
     frame_bytes = frame_samples * channels * 2
 
     total_frames = (len(data) + frame_bytes - 1) // frame_bytes
-    logger.info(
+    hot_logger.info(
         "Begin Opus encode | Total frames: %d | Frame size: %d bytes",
         total_frames,
         frame_bytes,
     )
 
     for i in range(0, len(data), frame_bytes):
-        chunk = data[i : i + frame_bytes]
+        chunk = bytes(data[i : i + frame_bytes])
         # 填充最后一帧
         if len(chunk) < frame_bytes:
             padding_size = frame_bytes - len(chunk)
-            logger.debug("填充最后一帧, 添加 %d 字节", padding_size)
+            hot_logger.debug("填充最后一帧, 添加 %d 字节", padding_size)
             chunk += b"\x00" * padding_size
 
         # 编码时使用样本数作为帧大小参数
@@ -325,21 +439,8 @@ def encode_audio(opus_encoder, input_frame_size, channels, sample_rate, data):
     return opus_frames
 
 
-def pcm_to_wav(sample_rate, channels, audio_data):
-    """将PCM数据转为WAV格式"""
-    with BytesIO() as wav_buffer:
-        with wave.open(wav_buffer, "wb") as wav:
-            wav.setnchannels(channels)
-            wav.setsampwidth(
-                2
-            )  # 16位PCM , 目前不支持修改 TODO: 通过和设备协议,可设置PCM位宽
-            wav.setframerate(sample_rate)
-            wav.writeframes(audio_data)
-    return wav_buffer.getvalue()
-
-
 def wav_to_pcm(wav_data: bytes) -> tuple[int, int, bytes]:
-    """从WAV数据中提取PCM音频参数和原始参数"""
+    """从WAV数据中提取PCM音频参数和原始参数 (兼容旧版本TTS写入的WAV)"""
     with BytesIO(wav_data) as wav_buffer:
         with wave.open(wav_buffer) as wav:
             if wav.getsamplewidth() != 2:
@@ -355,6 +456,24 @@ def wav_to_pcm(wav_data: bytes) -> tuple[int, int, bytes]:
     return sample_rate, channels, pcm_data
 
 
+def schedule_coroutine(loop, coro):
+    """
+    在指定事件循环中调度协程, 可在事件循环线程或音频工作线程中调用
+
+    参数:
+        loop (asyncio.AbstractEventLoop): 目标事件循环
+        coro (coroutine): 需要调度的协程
+    """
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+
+    if running_loop is loop:
+        return loop.create_task(coro)
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
 def audio_vad(udp_protocol, session_id, data):
     """
     语言活动检测 (VAD) 处理函数
@@ -368,6 +487,7 @@ def audio_vad(udp_protocol, session_id, data):
             - speech_count (int): 连续语音帧计数器
             - slience_count (int): 连续静音帧计数器
             - audio_buffer (list): 音频数据缓冲区
+            - stream_buffer (list): 流式识别分块缓冲区
 
         session_id (str): 当前会话的唯一标识
         data (bytes): PCM数据
@@ -380,9 +500,11 @@ def audio_vad(udp_protocol, session_id, data):
         - 检测到静音: 累加静音计数器, 若之前有语音则缓存尾音
     4. 【静音超时处理】:
         a. 短静音 (>1秒):
-            - 将缓冲区的音频转为WAV格式
+            - 将缓冲区的音频打包为原始PCM记录
             - 异步提交到ASR服务
             - 重置缓冲区和计数器
+        流式识别模式下, 说话过程中每 ASR_STREAM_CHUNK_MS 发布一个分块,
+        短静音时发布最后一个分块代替提交整句
         b. 长静音 (>10秒):
             - 记录超时日志
             - 异步关闭UDP通道
@@ -412,21 +534,53 @@ def audio_vad(udp_protocol, session_id, data):
             if udp_protocol.speech_count > 0:  # 缓冲尾音
                 udp_protocol.audio_buffer.append(frame)
 
+        # 流式识别: 缓冲满一个分块时发布
+        if ASR_STREAMING_ENABLED and udp_protocol.speech_count > 0:
+            udp_protocol.stream_buffer.append(frame)
+            if len(udp_protocol.stream_buffer) * frame_duration >= ASR_STREAM_CHUNK_MS:
+                chunk = pack_pcm(
+                    b"".join(udp_protocol.stream_buffer),
+                    sample_rate=sample_rate,
+                    channels=udp_protocol.channels,
+                )
+                schedule_coroutine(
+                    udp_protocol.loop, publish_asr_chunk(udp_protocol, chunk, False)
+                )
+                udp_protocol.stream_buffer = []
+
         # 检测 1秒 静音 ( 假设帧时长30ms, 约33帧为1秒)
         if udp_protocol.slience_count * frame_duration >= 1000:
-            if udp_protocol.audio_buffer:
-                # 打包 WAV 并上传 ASR
-                wav_data = pcm_to_wav(
+            if udp_protocol.audio_buffer and ASR_STREAMING_ENABLED:
+                # 流式识别: 发布最后一个分块, 由 ASR 服务输出最终结果
+                chunk = pack_pcm(
+                    b"".join(udp_protocol.stream_buffer),
+                    sample_rate=sample_rate,
+                    channels=udp_protocol.channels,
+                )
+                schedule_coroutine(
+                    udp_protocol.loop, publish_asr_chunk(udp_protocol, chunk, True)
+                )
+                udp_protocol.stream_buffer = []
+                udp_protocol.audio_buffer = []
+                udp_protocol.speech_count = 0
+
+            elif udp_protocol.audio_buffer:
+                # 打包 PCM 记录并上传 ASR
+                # 16位PCM , 目前不支持修改 TODO: 通过和设备协议,可设置PCM位宽
+                pcm_record = pack_pcm(
+                    b"".join(udp_protocol.audio_buffer),
                     sample_rate=sample_rate,
-                    channels=udp_pool[session_id]["channels"],
-                    audio_data=b"".join(udp_protocol.audio_buffer),
+                    channels=udp_protocol.channels,
                 )
 
                 # 异步提交到 ASR 队列
-                asyncio.create_task(
+                schedule_coroutine(
+                    udp_protocol.loop,
                     submit_to_asr_queue(
-                        session_id=udp_protocol.session_id, audio_data=wav_data
-                    )
+                        session_id=udp_protocol.session_id,
+                        audio_data=pcm_record,
+                        duration_ms=len(udp_protocol.audio_buffer) * frame_duration,
+                    ),
                 )
 
                 # 重置缓冲区
@@ -440,7 +594,7 @@ def audio_vad(udp_protocol, session_id, data):
             # 发送结束帧
 
             # 关闭通道
-            asyncio.create_task(delete_udp_channel(session_id))
+            schedule_coroutine(udp_protocol.loop, delete_udp_channel(session_id))
             return
 
 
@@ -449,14 +603,157 @@ def audio_vad(udp_protocol, session_id, data):
 #######################################################################
 
 
+# 处理接收的音频数据包
+def process_audio_packet(udp_protocol, key, nonce, encrypted_audio, sequence):
+    """
+    解密, 抓包, Opus 解码并进入接收回调
+
+    参数:
+        udp_protocol (UdpProtocol): 会话的UDP协议对象
+        key (bytes): 16字节AES解密密钥
+        nonce (bytes): 数据包的 nonce
+        encrypted_audio (bytes): 加密的 Opus 数据
+        sequence (int): 数据包序列号
+
+    注意:
+        thread 模式下在音频工作线程中执行, 同一会话的数据包保证按顺序处理
+    """
+    decrypted_audio = aes_ctr_decrypt(key, nonce, encrypted_audio)
+
+    # 抓包 (仅缓存已解密的 Opus 数据包, 不解码)
+    capture_manager.write(udp_protocol.session_id, decrypted_audio)
+
+    # opus 解码
+    try:
+        pcm_decode_data = udp_protocol.opus_decoder.decode(
+            decrypted_audio, udp_protocol.max_frame_samples
+        )
+    except Exception as e:
+        logger.error(
+            f"failed to decode audio for session {udp_protocol.session_id}: {e}"
+        )
+        pcm_decode_data = None
+
+    # 进入接收回调函数
+    if pcm_decode_data:
+        udp_protocol.on_received(udp_protocol, sequence, pcm_decode_data)
+
+
+class AudioWorkerPool:
+    """
+    上行音频工作线程池
+
+    每个会话有一个有界队列, 同一时刻最多只有一个工作线程处理该会话的队列,
+    保证帧顺序和会话内 VAD/解码器状态的线程安全
+
+    参数:
+        max_workers (int): 工作线程数量
+        queue_size (int): 每个会话队列的最大帧数
+        batch (int): 单次调度最多处理的帧数
+    """
+
+    def __init__(self, max_workers, queue_size, batch):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="audio_worker"
+        )
+        self.queue_size = queue_size
+        self.batch = batch
+        self.dropped_frames = 0
+
+    def submit(self, udp_protocol, job):
+        """
+        提交一个待处理的音频帧 (在事件循环中调用)
+
+        返回:
+            bool: 队列已满时返回 False, 该帧被丢弃
+        """
+        with udp_protocol.worker_lock:
+            if len(udp_protocol.worker_queue) >= self.queue_size:
+                udp_protocol.dropped_frames += 1
+                self.dropped_frames += 1
+                return False
+
+            udp_protocol.worker_queue.append(job)
+            if udp_protocol.worker_scheduled:
+                return True
+            udp_protocol.worker_scheduled = True
+
+        self.executor.submit(self._drain, udp_protocol)
+        return True
+
+    def _drain(self, udp_protocol):
+        """在工作线程中按顺序处理会话队列"""
+        for _ in range(self.batch):
+            with udp_protocol.worker_lock:
+                if not udp_protocol.worker_queue or udp_protocol.closed:
+                    udp_protocol.worker_queue.clear()
+                    udp_protocol.worker_scheduled = False
+                    return
+                job = udp_protocol.worker_queue.popleft()
+
+            try:
+                process_audio_packet(udp_protocol, *job)
+            except Exception as e:
+                logger.error(
+                    f"audio worker failed for session {udp_protocol.session_id}: {e}",
+                    exc_info=True,
+                )
+
+        # 队列中仍有数据, 重新排队, 让其他会话也能获得工作线程
+        self.executor.submit(self._drain, udp_protocol)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+audio_worker_pool = (
+    AudioWorkerPool(AUDIO_WORKER_THREADS, AUDIO_WORKER_QUEUE_SIZE, AUDIO_WORKER_BATCH)
+    if AUDIO_WORKER_MODE == "thread"
+    else None
+)
+
+
 # 接收音频数据
 def audio_receive_callback(udp_protocol, sequence, data):
-    logger.info(
-        f"Received audio data for session {udp_protocol.session_id}, sequence: {sequence}, data length: {len(data)}"
+    hot_logger.info(
+        "Received audio data for session %s, sequence: %d, data length: %d",
+        udp_protocol.session_id,
+        sequence,
+        len(data),
     )
     audio_vad(udp_protocol, udp_protocol.session_id, data)
 
 
+# 发送 Opus 帧
+async def send_opus_frames(session_id, opus_frames):
+    """
+    将已编码的 Opus 帧逐帧加密后通过会话的UDP通道发送
+
+    参数:
+        session_id (str): 要发送的会话ID
+        opus_frames (list[bytes]): Opus 帧列表
+    """
+    if session_id not in udp_pool:
+        logger.error(f"session {session_id} not found in UDP pool")
+        return
+
+    session_data = udp_pool[session_id]
+    transport = session_data["transport"]
+    key = session_data["key"]
+    nonce = session_data["nonce"]
+    sequence = session_data.get("send_sequence", 0)
+
+    for frame in opus_frames:
+        # 加密封包
+        encrypted_data = encrypt_audio_data(key, nonce, frame, sequence)
+        sequence += 1
+
+        # 发送
+        transport.sendto(encrypted_data)
+
+    session_data["send_sequence"] = sequence
+
+
 # 发送音频数据
 async def send_audio_data(session_id, audio_data):
     """
@@ -483,29 +780,18 @@ async def send_audio_data(session_id, audio_data):
         logger.error(f"session {session_id} not found in UDP pool")
         return
 
-    transport = udp_pool[session_id]["transport"]
-    protocol = udp_pool[session_id]["protocol"]
-    key = udp_pool[session_id]["key"]
-    nonce = udp_pool[session_id]["nonce"]
     opus = udp_pool[session_id]["opus_encoder"]
     channels = udp_pool[session_id]["channels"]
     sample_rate = udp_pool[session_id]["input_sample_rate"]
     frame_duration = udp_pool[session_id]["frame_duration"]
 
-    # input frame size
-
     # opus 编码
     opus_encoded_frames = encode_audio(
         opus, frame_duration, channels, sample_rate, audio_data
     )
 
-    # 加密封包
-    encrypted_data = encrypt_audio_data(
-        key, nonce, opus_encoded_frames, protocol.sequence
-    )
-
-    # 发送
-    transport.sendto(encrypted_data)
+    # 加密并发送
+    await send_opus_frames(session_id, opus_encoded_frames)
 
 
 #######################################################################
@@ -539,6 +825,18 @@ class UdpProtocol(asyncio.DatagramProtocol):
         self.opus_encoder = opuslib_next.Encoder(
             input_sample_rate, channels, opuslib_next.APPLICATION_VOIP
         )
+        # 初始化 opus 解码器, 按 Opus 最大帧长 120ms 预留解码空间
+        self.opus_decoder = opuslib_next.Decoder(input_sample_rate, channels)
+        self.max_frame_samples = int(input_sample_rate * 120 / 1000)
+        self.channels = channels
+
+        # 工作线程模式下的会话队列
+        self.loop = None
+        self.closed = False
+        self.worker_queue = deque()
+        self.worker_lock = threading.Lock()
+        self.worker_scheduled = False
+        self.dropped_frames = 0
 
         # 初始化VAD检测
         self.vad = webrtcvad.Vad()
@@ -550,46 +848,52 @@ class UdpProtocol(asyncio.DatagramProtocol):
         self.slience_count = 0
         self.audio_buffer = []
 
+        # 流式识别
+        self.stream_buffer = []
+        self.stream_seq = 0
+        self.stream_lock = asyncio.Lock()
+
     def connection_made(self, transport):
         self.transport = transport
+        self.loop = asyncio.get_running_loop()
         logger.info(f"UDP channel created for session {self.session_id}")
 
     def datagram_received(self, data, addr):
         """
         处理接收到的UDP数据
         处理流程:
-        1. 数据包解密验证
-        2. 序列号连续性检查
+        1. 协议头和序列号连续性检查
+        2. 数据包解密
         3. Opus音频解码
         4. 调用回调函数
 
+        注意:
+            thread 模式下事件循环只执行第 1 步, 其余步骤交给音频工作线程池
+
         参数:
             data(bytes): 原始加密的音频数据包
             addr: 来源地址 (host, port)元组
         """
-        logger.info(
-            f"Received {len(data)} bytes from {addr} for session {self.session_id}"
+        hot_logger.info(
+            "Received %d bytes from %s for session %s", len(data), addr, self.session_id
         )
         key = udp_pool[self.session_id]["key"]
 
-        # 解密音频数据
-        decrypted_audio, received_sequence = decrypt_audio_data(key, data, self.sequence)
-        if decrypted_audio is None:
+        # 校验协议头
+        nonce, encrypted_audio, received_sequence = check_audio_header(
+            data, self.sequence
+        )
+        if nonce is None:
             return
 
         # 更新当前 sequence
         udp_pool[self.session_id]["sequence"] = received_sequence
 
-        # opus 解码
-        try:
-            pcm_decode_data = self.opus_encoder.decode(decrypted_audio)
-        except Exception as e:
-            logger.error(f"failed to decode audio for session {self.session_id}: {e}")
-            pcm_decode_data = None
-
-        # 进入接收回调函数
-        if pcm_decode_data:
-            self.on_received(self, received_sequence, pcm_decode_data)
+        job = (key, nonce, encrypted_audio, received_sequence)
+        if audio_worker_pool is not None:
+            audio_worker_pool.submit(self, job)
+        else:
+            process_audio_packet(self, *job)
 
     def error_received(self, exc):
         logger.error(f"Error received for session {self.session_id}: {exc}")
@@ -597,6 +901,8 @@ class UdpProtocol(asyncio.DatagramProtocol):
 
     def connection_lost(self, exc):
         logger.error(f"Connection closed for session {self.session_id}")
+        self.closed = True
+        capture_manager.stop(self.session_id)
         if self.session_id in udp_pool:
             del udp_pool[self.session_id]
         return super().connection_lost(exc)
@@ -670,6 +976,9 @@ async def create_udp_channel(session_id, input_sample_rate, channels, frame_dura
         "frame_duration": frame_duration,
     }
 
+    # 按抽样比例开启上行抓包
+    capture_manager.maybe_start(session_id, input_sample_rate, channels)
+
     return {
         "message": f"UDP channel created for session {session_id}",
         "udp_address": sockname[0],
@@ -699,6 +1008,7 @@ async def delete_udp_channel(session_id):
         transport = udp_pool[session_id]["transport"]
         transport.close()
         del udp_pool[session_id]
+        capture_manager.stop(session_id)
 
         logger.info(f"UDP channel for session {session_id} has been deleted.")
     else:
@@ -712,58 +1022,261 @@ async def delete_udp_channel(session_id):
 #######################################################################
 
 
-async def process_tts_audio(app: FastAPI, session_id: str):
+def opus_params_match(session_id: str, tts_data: dict) -> bool:
+    """检查TTS预编码 Opus 帧的参数是否与会话UDP通道一致"""
+    session_data = udp_pool[session_id]
+    try:
+        return (
+            int(tts_data.get(b"opus_sample_rate", b"0")) == session_data["input_sample_rate"]
+            and int(tts_data.get(b"opus_channels", b"0")) == session_data["channels"]
+            and int(tts_data.get(b"opus_frame_duration", b"0"))
+            == session_data["frame_duration"]
+        )
+    except ValueError:
+        return False
+
+
+async def send_tts_audio(session_id: str, tts_data: dict) -> bool:
     """
-    从Redis获取指定会话的TTS音频数据, 通过UDP通道发送到客户端
+    发送一段TTS音频
 
     参数:
-        app (FastAPI): FastAPI应用实例
-        session_id (str): 需要处理的会话唯一ID
+        session_id (str): 会话ID
+        tts_data (dict): 音频数据, 包含 opus (及 opus 参数) 或 audio 字段
 
     返回:
-        None
+        bool: 是否已发送
 
-    处理流程:
-        1. 从Redis获取TTS音频数据
-        2. 验证音频数据完整性
-        3. 通过UDP通道发送音频数据
-        4. 清理Redis中的临时数据
+    注意:
+        - 优先使用TTS预编码的 Opus 帧 (参数与通道一致时), 只需加密发送
+        - 否则回退到 PCM 记录 (兼容 WAV): 解析为 PCM 后重新编码
+    """
+    # 优先发送预编码的 Opus 帧
+    opus_bytes = tts_data.get(b"opus")
+    if opus_bytes and opus_params_match(session_id, tts_data):
+        await send_opus_frames(session_id, unpack_opus_frames(opus_bytes))
+        return True
+
+    # 获取音频数据
+    audio_bytes = tts_data.get(b"audio")
+    if not audio_bytes:
+        logger.error("音频数据为空, session_id: %s", session_id)
+        return False
+
+    # 解析 PCM 记录 (兼容旧版本的 WAV)
+    if is_pcm_record(audio_bytes):
+        sample_rate, channels, _, pcm_data = unpack_pcm(audio_bytes)
+    else:
+        sample_rate, channels, pcm_data = wav_to_pcm(audio_bytes)
+
+    # 采样率或通道数不一致时编码出的音频会变调, 直接丢弃
+    session_data = udp_pool[session_id]
+    if (
+        sample_rate != session_data["input_sample_rate"]
+        or channels != session_data["channels"]
+    ):
+        logger.error(
+            "TTS音频参数与UDP通道不一致, session_id: %s, 音频: %dHz/%d, 通道: %dHz/%d",
+            session_id,
+            sample_rate,
+            channels,
+            session_data["input_sample_rate"],
+            session_data["channels"],
+        )
+        return False
+
+    # 编码并发送加密音频
+    await send_audio_data(session_id, pcm_data)
+    return True
+
+
+async def process_tts_stream(app: FastAPI, session_id: str, tts_data: dict):
+    """
+    逐句读取TTS会话音频流并发送, 每句就绪后立即发送, 不等待整段合成完成
+
+    参数:
+        app (FastAPI): FastAPI应用实例
+        session_id (str): 会话ID
+        tts_data (dict): 语音记录, 包含音频流的键和 opus 参数
 
+    注意:
+        收到结束标记, 会话UDP通道关闭, 或超过 TTS_STREAM_TIMEOUT 未收到新的分句时结束,
+        结束后删除音频流
     """
-    logger.info("开始处理TTS音频输出任务, session_id: %s", session_id)
+    redis_conn = app.state.redis
+    stream_key = tts_data[b"stream"]
+    last_id = "0"
+    last_time = asyncio.get_running_loop().time()
 
     try:
-        redis_conn = app.state.redis
+        while True:
+            response = await redis_conn.xread(
+                {stream_key: last_id}, block=TTS_STREAM_BLOCK_MS
+            )
+            if not response:
+                if asyncio.get_running_loop().time() - last_time > TTS_STREAM_TIMEOUT:
+                    logger.error("等待TTS分句音频超时, session_id: %s", session_id)
+                    return
+                continue
+
+            last_time = asyncio.get_running_loop().time()
+            for entry_id, fields in response[0][1]:
+                last_id = entry_id
+
+                end = fields.get(b"end")
+                if end:
+                    if end == b"error":
+                        logger.error(
+                            "TTS合成失败, session_id: %s - %s",
+                            session_id,
+                            fields.get(b"error", b"").decode(),
+                        )
+                    return
+
+                if session_id not in udp_pool:
+                    logger.error("UDP通道已关闭, session_id: %s", session_id)
+                    return
+
+                # 分句消息不携带 opus 参数, 使用语音记录中的参数
+                if await send_tts_audio(session_id, {**tts_data, **fields}):
+                    logger.info(
+                        "已发送TTS分句音频, session_id: %s, 分句: %s",
+                        session_id,
+                        fields.get(b"index", b"").decode(),
+                    )
 
-        # 获取TTS音频数据
-        tts_data = await redis_conn.hgetall(f"tts:{session_id}")
-        if not tts_data:
-            logger.error("TTS音频数据不存在, session_id: %s", session_id)
-            return
+    finally:
+        await redis_conn.delete(stream_key)
 
-        # 获取音频数据
-        audio_bytes = tts_data.get(b"audio")
-        if not audio_bytes:
-            logger.error("音频数据为空, session_id: %s", session_id)
-            return
 
-        # 转换 WAV 为 PCM
-        sample_rate, channels, pcm_data = wav_to_pcm(audio_bytes)
+async def process_tts_audio(app: FastAPI, session_id: str, seq: int, tts_data: dict):
+    """
+    播放一条语音, 通过UDP通道发送到客户端
+
+    参数:
+        app (FastAPI): FastAPI应用实例
+        session_id (str): 会话ID
+        seq (int): 语音序号
+        tts_data (dict): 语音记录
+
+    处理流程:
+        1. 状态改为 playing (已被其他播放方处理时跳过)
+        2. 通过UDP通道发送音频数据
+            - 分句流式合成: 逐句读取语音音频流发送
+            - 整段合成: 发送语音记录中的音频
+        3. 状态改为 done, 删除语音记录
+    """
+    redis_conn = app.state.redis
+    if not await transition(
+        redis_conn, session_id, seq, (STATE_SYNTHESIZING, STATE_READY), STATE_PLAYING
+    ):
+        return
+
+    try:
+        if tts_data.get(b"stream"):
+            await process_tts_stream(app, session_id, tts_data)
+            logger.info(f"TTS分句音频发送结束, 语音: {session_id}:{seq}")
+        elif await send_tts_audio(session_id, tts_data):
+            logger.info(f"已发送TTS音频数据到客户端, 语音: {session_id}:{seq}")
+
+    except Exception as e:
+        logger.error("处理TTS音频失败 %s:%s - %s", session_id, seq, str(e), exc_info=True)
+
+    finally:
+        await transition(redis_conn, session_id, seq, (STATE_PLAYING,), STATE_DONE)
+        await remove_utterance(redis_conn, session_id, seq)
+
+
+async def tts_session_player(app: FastAPI, session_id: str, wake: asyncio.Event):
+    """
+    按序号顺序播放会话语音队列
+
+    参数:
+        app (FastAPI): FastAPI应用实例
+        session_id (str): 会话ID
+        wake (asyncio.Event): TTS 输出队列收到该会话的通知时触发
+
+    注意:
+        - 只播放队首 (序号最小) 的语音, 后续语音可以同时在 TTS 服务中合成, 播放顺序不变
+        - 队首语音尚未合成 (queued, 或整段合成中) 时等待, 成为队首后超过 TTS_UTTERANCE_TIMEOUT
+          仍不可播放时标记为 failed 并跳过 (排在长语音之后等待的时间不计入)
+        - 会话UDP通道已关闭时丢弃剩余语音
+        - 队列为空超过 TTS_PLAYER_IDLE_TIMEOUT 后退出
+    """
+    redis_conn = app.state.redis
+    loop = asyncio.get_running_loop()
+    head_seq, head_since = None, 0.0  # 当前队首语音及其成为队首的时间
+
+    try:
+        while True:
+            wake.clear()
+            head = await redis_conn.zrange(index_key(session_id), 0, 0)
+            if not head:
+                try:
+                    await asyncio.wait_for(wake.wait(), TTS_PLAYER_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    return
+                continue
+
+            seq = int(head[0])
+            if seq != head_seq:
+                head_seq, head_since = seq, loop.time()
+            tts_data = await redis_conn.hgetall(record_key(session_id, seq))
+            state = tts_data.get(b"state", b"").decode()
+
+            if state in ("", STATE_DONE, STATE_FAILED):
+                if state == STATE_FAILED:
+                    logger.error("TTS合成失败, 跳过语音: %s:%s", session_id, seq)
+                await remove_utterance(redis_conn, session_id, seq)
+                continue
 
-        # 发送加密音频
-        await send_audio_data(session_id, pcm_data)
+            if session_id not in udp_pool:
+                logger.error("UDP通道不存在, 丢弃语音: %s:%s", session_id, seq)
+                await remove_utterance(redis_conn, session_id, seq)
+                continue
 
-        # 通过对应的UDP通道发送消息
-        if session_id in udp_pool:
-            await send_audio_data(session_id, audio_bytes)
-            logger.info(f"已发送TTS音频数据到客户端, session_id: {session_id}")
+            playable = state == STATE_READY or (
+                state == STATE_SYNTHESIZING and tts_data.get(b"stream")
+            )
+            if not playable:
+                # 等待 TTS 服务合成, 从成为队首开始计时, 超时跳过
+                if loop.time() - head_since > TTS_UTTERANCE_TIMEOUT:
+                    logger.error("等待TTS合成超时, 跳过语音: %s:%s", session_id, seq)
+                    await transition(
+                        redis_conn,
+                        session_id,
+                        seq,
+                        (STATE_QUEUED, STATE_SYNTHESIZING),
+                        STATE_FAILED,
+                    )
+                    continue
+                try:
+                    await asyncio.wait_for(wake.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
 
-        await redis_conn.delete(f"tts:{session_id}")
+            await process_tts_audio(app, session_id, seq, tts_data)
 
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        logger.error("处理TTS音频失败 %s - %s", session_id, str(e), exc_info=True)
-        if tts_data:
-            await redis_conn.delete(f"tts:{session_id}")
+        logger.error("会话语音队列播放异常 %s - %s", session_id, str(e), exc_info=True)
+
+    finally:
+        tts_players.pop(session_id, None)
+
+
+def wake_tts_player(app: FastAPI, session_id: str):
+    """唤醒会话的播放协程, 不存在时创建"""
+    player = tts_players.get(session_id)
+    if player is None:
+        wake = asyncio.Event()
+        task = asyncio.create_task(tts_session_player(app, session_id, wake))
+        tts_players[session_id] = (wake, task)
+    else:
+        wake = player[0]
+    wake.set()
 
 
 #######################################################################
@@ -790,10 +1303,10 @@ async def redis_listener(app: FastAPI):
         try:
             result = await app.state.redis.brpop(TTS_OUTPUT_QUEUE_KEY)
             if result:
-                _, session_id = result
-                str_session_id = session_id.decode()
-                logger.info(f"监听到 TTS 输出队列, session_id: {str_session_id}")
-                asyncio.create_task(process_tts_audio(app, str_session_id))
+                _, value = result
+                session_id, seq = parse_utterance_id(value)
+                logger.info(f"监听到 TTS 输出队列, 语音: {session_id}:{seq}")
+                wake_tts_player(app, session_id)
 
         except Exception as e:
             logger.error(f"Redis listener error: {str(e)}")
@@ -818,8 +1331,27 @@ async def lifespan(app: FastAPI):
         logger.error("无法连接到 Redis 服务器 %s", e)
         raise
 
+    # 创建抓包批量写入任务
+    app.state.capture_task = asyncio.create_task(capture_manager.run())
+
     yield
 
+    app.state.capture_task.cancel()
+    try:
+        await app.state.capture_task
+    except asyncio.CancelledError:
+        pass
+    await capture_manager.close()
+
+    if audio_worker_pool is not None:
+        audio_worker_pool.shutdown()
+
+    # 停止会话语音播放协程, 未播放的语音保留在 Redis 中直到过期
+    players = [task for _, task in tts_players.values()]
+    for task in players:
+        task.cancel()
+    await asyncio.gather(*players, return_exceptions=True)
+
     await app.state.redis.close()
     app.state.redis_listener.cancel()
     try:
@@ -843,7 +1375,27 @@ async def api_create_udp_channel(audio_base: AudioChannelBase):
             audio_base.channels,
             audio_base.frame_duration,
         )
-        logger.info("UDP通道创建成功: session_id: {audio_base.session_id}")
+
+        # 记录会话音频参数, TTS 按此参数预编码下行 Opus 帧
+        # 会话可能尚未由 DAO 创建或已过期, 同时设置过期时间, 避免残留不过期的会话
+        try:
+            async with app.state.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(
+                    f"session:{audio_base.session_id}",
+                    mapping={
+                        "audio_sample": audio_base.input_sample_rate,
+                        "audio_channel": audio_base.channels,
+                        "frame_duration": audio_base.frame_duration,
+                    },
+                )
+                pipe.expire(f"session:{audio_base.session_id}", SESSION_EXPIRE_TIME)
+                await pipe.execute()
+        except Exception:
+            # 请求失败, 关闭已创建的UDP通道
+            await delete_udp_channel(audio_base.session_id)
+            raise
+
+        logger.info(f"UDP通道创建成功: session_id: {audio_base.session_id}")
         return result
 
     except Exception as e:
@@ -883,6 +1435,7 @@ async def api_get_udp_pool(session_id: str = Query(..., description="要查询
                 "channels": session_data["channels"],
                 "frame_duration": session_data["frame_duration"],
                 "last_sequence": session_data.get("sequence", 0),
+                "dropped_frames": session_data["protocol"].dropped_frames,
                 "nonce": session_data["nonce"].hex(),
                 "key": session_data["key"].hex(),
             }
@@ -911,6 +1464,32 @@ async def api_get_udp_pool(session_id: str = Query(..., description="要查询
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/capture/{session_id}")
+async def api_start_capture(session_id: str):
+    """开启指定会话的上行音频抓包"""
+    if session_id not in udp_pool:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+
+    session_data = udp_pool[session_id]
+    capture_manager.start(
+        session_id, session_data["input_sample_rate"], session_data["channels"]
+    )
+    return {"message": f"Capture started for session {session_id}"}
+
+
+@app.delete("/capture/{session_id}")
+async def api_stop_capture(session_id: str):
+    """关闭指定会话的上行音频抓包"""
+    capture_manager.stop(session_id)
+    return {"message": f"Capture stopped for session {session_id}"}
+
+
+@app.get("/capture")
+async def api_get_capture():
+    """获取当前抓包状态"""
+    return {"captures": capture_manager.status(), "capture_dir": CAPTURE_DIR}
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import struct
+import tempfile
+import unittest
+
+from capture import CaptureManager, OggOpusWriter, ogg_crc32, read_ogg_opus_packets
+
+
+# 20ms CELT 单帧 TOC (config 31), 48kHz 下 960 个样本
+CELT_20MS_TOC = bytes([31 << 3])
+
+
+class TestOggOpusWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "test.ogg")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_packets_round_trip(self):
+        # 包含长度为 255 整数倍的数据包, 验证分段处理
+        packets = [CELT_20MS_TOC + bytes([i % 256]) * (i * 7) for i in range(300)]
+        packets.append(CELT_20MS_TOC + b"\x01" * 509)
+
+        writer = OggOpusWriter(self.path, 16000, 1, comments={"session_id": "s1"})
+        writer.write_packets(packets[:150])
+        writer.write_packets(packets[150:])
+        writer.close()
+
+        self.assertEqual(list(read_ogg_opus_packets(self.path)), packets)
+        self.assertEqual(writer.granule, 960 * len(packets))
+
+    def test_page_crc(self):
+        writer = OggOpusWriter(self.path, 16000, 1)
+        writer.close()
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        # 第一个页面为 OpusHead, 校验和清零后重新计算应一致
+        page_size = 27 + data[26] + sum(data[27 : 27 + data[26]])
+        page = bytearray(data[:page_size])
+        (crc,) = struct.unpack_from("<I", page, 22)
+        struct.pack_into("<I", page, 22, 0)
+        self.assertEqual(ogg_crc32(page), crc)
+        self.assertEqual(page[28:36], b"OpusHead")
+
+
+class TestCaptureManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_rotation_and_quota(self):
+        manager = CaptureManager(
+            capture_dir=self.tmp_dir.name,
+            sample_ratio=0,
+            max_file_bytes=4096,
+            disk_quota_bytes=10000,
+            flush_interval=0.01,
+        )
+
+        async def run():
+            manager.start("s1", 16000, 1)
+            for _ in range(20):
+                for _ in range(20):
+                    manager.write("s1", CELT_20MS_TOC + b"\x00" * 100)
+                await manager.flush()
+            await manager.close()
+
+        asyncio.run(run())
+
+        files = os.listdir(self.tmp_dir.name)
+        total = sum(os.path.getsize(os.path.join(self.tmp_dir.name, f)) for f in files)
+        self.assertGreater(len(files), 1)
+        self.assertLessEqual(total, 10000)
+
+    def test_write_without_capture(self):
+        manager = CaptureManager(self.tmp_dir.name, 0, 4096, 10000, 0.01)
+        manager.write("unknown", CELT_20MS_TOC)
+
+        asyncio.run(manager.close())
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@ import asyncio
 import uuid
 import logging
 import os
+import sys
 import json
 import redis.asyncio as redis
 from fastapi import FastAPI, File, HTTPException, Depends, Query, Response, UploadFile
@@ -14,35 +15,25 @@ import secrets
 #  配置日志
 #####################
 
-# 配置日志记录
-
-logger = logging.getLogger("dao")
-logger.setLevel(logging.INFO)
-
-# 日志目录
-current_dir = os.getcwd()
-log_file_path = os.path.join(current_dir, "storage/logs")
-log_dir = os.path.expanduser(log_file_path)
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir, exist_ok=True)
-
-log_file_path = os.path.join(log_dir, "dao.log")
-
-# 创建文件处理器
-file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
-file_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
-
-# 创建控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+# 公共模块位于 components 目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_format import is_pcm_record, pcm_duration_ms
+from log import setup_logger
+from utterance import (
+    EXTERNAL_TRANSITIONS,
+    STATE_QUEUED,
+    STATE_READY,
+    enqueue_utterance,
+    index_key,
+    list_utterances,
+    record_key,
+    remove_utterance,
+    transition,
+    utterance_id,
 )
 
-# 添加处理器
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# 配置日志记录 (异步写入, 见 components/log.py)
+logger = setup_logger("dao")
 
 # 关闭日志（需要时取消注释）
 # logger.setLevel(logging.CRITICAL)
@@ -63,7 +54,7 @@ TTS_INPUT_QUEUE_KEY = "tts_input_queue"
 TTS_OUTPUT_QUEUE_KEY = "tts_output_queue"
 TTS_SESSION_QUEUE = "tts_queue"
 ASR_SESSION_QUEUE = "asr_queue"
-ASR_INPUT_QUEUE_KEY = "asr_input_queue"
+ASR_INPUT_STREAM_KEY = "asr_input_stream"  # ASR 任务流, 由 ASR 服务通过消费者组消费
 ASR_OUTPUT_QUEUE_KEY = "asr_output_queue"
 
 
@@ -438,52 +429,101 @@ class TTSBase(BaseModel):
 
 
 class TTSDao:
+    """
+    TTS 会话语音队列 (键和状态见 components/utterance.py)
+
+    每次创建条目都追加一条新的语音 (新序号), 不会覆盖同一会话中尚未播放的语音
+    """
+
     def __init__(self, redis_conn: redis.Redis):
         self.redis = redis_conn
 
     async def create_tts_item(
         self, session_id: str, status: str, audio: bytes, text: str
-    ):
-        """创建新的TTS条目"""
-
-        # 将 session_id 存入队列 (使用Redis列表)
-        await self.redis.lpush(TTS_INPUT_QUEUE_KEY, session_id)
-
-        # 存储tts数据到hash
-        await self.redis.hset(
-            f"tts:{session_id}",
-            mapping={
-                "status": status,  # 还未生成音频
-                "audio": audio,  # 音频数据
-                "text": text,  # 文本内容
-            },
+    ) -> int:
+        """
+        追加一条语音到会话队列
+
+        已带音频 (status 为 True) 时直接进入 ready 状态并通知 audio_io 播放,
+        否则为 queued 状态, 通知 TTS 服务合成
+
+        返回:
+            int: 语音序号
+        """
+        if status == "True" and audio:
+            return await enqueue_utterance(
+                self.redis, session_id, text, TTS_OUTPUT_QUEUE_KEY, STATE_READY, audio
+            )
+        return await enqueue_utterance(
+            self.redis, session_id, text, TTS_INPUT_QUEUE_KEY, STATE_QUEUED
         )
 
     async def update_tts_item(
-        self, session_id: str, status: str, audio: bytes, text: str
-    ):
-        await self.redis.hset(
-            f"tts:{session_id}",
-            mapping={
-                "status": status,
-                "audio": audio,
-                "text": text,
-            },
-        )
-
-    async def get_tts_item(self, session_id: str) -> dict:
-        """获取完整的TTS条目数据"""
-        data = await self.redis.hgetall(f"tts:{session_id}")
+        self, session_id: str, seq: int, state: str, audio: bytes, text: str
+    ) -> bool:
+        """
+        更新语音的状态, 音频和文本
+
+        参数:
+            state (str): 新状态, 只能是 EXTERNAL_TRANSITIONS 中的状态 (ready, failed)
+
+        返回:
+            bool: 当前状态不允许修改为 state 时 (如已在播放) 返回 False, 不修改
+
+        异常:
+            ValueError: 不允许外部设置的状态
+
+        注意:
+            状态通过 transition 与音频和文本原子修改; 改为 ready 时通知 audio_io 播放
+        """
+        if state not in EXTERNAL_TRANSITIONS:
+            raise ValueError(f"不允许设置的语音状态: {state}")
+
+        if not await transition(
+            self.redis,
+            session_id,
+            seq,
+            EXTERNAL_TRANSITIONS[state],
+            state,
+            fields={"audio": audio, "text": text},
+        ):
+            return False
+
+        if state == STATE_READY:
+            await self.redis.lpush(TTS_OUTPUT_QUEUE_KEY, utterance_id(session_id, seq))
+        return True
+
+    async def get_tts_item(self, session_id: str, seq: int) -> dict:
+        """获取单条语音数据"""
+        data = await self.redis.hgetall(record_key(session_id, seq))
+        if not data:
+            return {}
         return {
             "session_id": session_id,
-            "status": data.get(b"status", b"False").decode(),
+            "seq": seq,
+            "state": data.get(b"state", b"").decode(),
             "text": data.get(b"text", b"").decode(),
             "audio": data.get(b"audio", b""),
         }
 
+    async def get_tts_items(self, session_id: str) -> list:
+        """按播放顺序获取会话队列中的所有语音"""
+        items = []
+        for seq in await list_utterances(self.redis, session_id):
+            item = await self.get_tts_item(session_id, seq)
+            if item:
+                items.append(item)
+        return items
+
+    async def delete_tts_items(self, session_id: str):
+        """清空会话语音队列"""
+        for seq in await list_utterances(self.redis, session_id):
+            await remove_utterance(self.redis, session_id, seq)
+        await self.redis.delete(index_key(session_id))
+
     async def tts_exists(self, session_id: str) -> bool:
-        """检查TTS条目是否存在"""
-        return await self.redis.exists(f"tts:{session_id}") == 1
+        """检查会话语音队列是否存在"""
+        return await self.redis.exists(index_key(session_id)) == 1
 
     async def is_input_queue_empty(self) -> bool:
         """检查TTS队列是否为空"""
@@ -523,7 +563,8 @@ async def create_tts_item(
         # 读取文件内容
         audio_bytes = await audio.read()
 
-        await dao.create_tts_item(session_id, status, audio_bytes, text)
+        seq = await dao.create_tts_item(session_id, status, audio_bytes, text)
+        return {"session_id": session_id, "seq": seq}
 
     except redis.RedisError as e:
         logger.error(f"Redis操作失败: {str(e)}")
@@ -542,7 +583,8 @@ async def create_tts_item(
 @app.put("/tts")
 async def update_tts_item(
     session_id: str = Query(..., description="会话ID"),
-    status: str = Query(..., description="条目状态"),
+    seq: int = Query(..., description="语音序号"),
+    status: str = Query(..., description="语音状态: ready (提供音频) 或 failed"),
     audio: UploadFile = File(..., description="音频文件"),
     text: str = Query(..., description="文本数据"),
     dao: TTSDao = Depends(get_tts_dao),
@@ -556,7 +598,13 @@ async def update_tts_item(
         # 读取文件内容
         audio_bytes = await audio.read()
 
-        await dao.update_tts_item(session_id, status, audio_bytes, text)
+        if not await dao.get_tts_item(session_id, seq):
+            raise HTTPException(status_code=404, detail="TTS条目不存在")
+        if not await dao.update_tts_item(session_id, seq, status, audio_bytes, text):
+            raise HTTPException(status_code=409, detail="TTS条目当前状态不允许修改")
+
+    except HTTPException:
+        raise
 
     except redis.RedisError as e:
         logger.error(f"Redis操作失败: {str(e)}")
@@ -575,24 +623,28 @@ async def update_tts_item(
 @app.get("/tts")
 async def get_tts_item(
     session_id: str | None = Query(
-        None, description="可选的会话ID, 为空时查询所有TTS条目"
+        None, description="可选的会话ID, 为空时查询所有会话的TTS条目"
     ),
+    seq: int | None = Query(None, description="可选的语音序号, 为空时查询会话队列"),
     dao: TTSDao = Depends(get_tts_dao),
 ):
     try:
-        if session_id:
-            # 查询单个条目
-            tts_data = await dao.get_tts_item(session_id)
+        if session_id and seq is not None:
+            # 查询单条语音
+            tts_data = await dao.get_tts_item(session_id, seq)
             if not tts_data:
                 raise HTTPException(status_code=404, detail="TTS条目不存在")
             return tts_data
+        elif session_id:
+            # 查询会话语音队列
+            if not await dao.tts_exists(session_id):
+                raise HTTPException(status_code=404, detail="TTS条目不存在")
+            return await dao.get_tts_items(session_id)
         else:
             all_tts = []
-            async for key in dao.redis.scan_iter(match="tts:*"):
+            async for key in dao.redis.scan_iter(match=index_key("*")):
                 _, sid = key.decode().split(":", 1)
-                tts_item = await dao.get_tts_item(sid)
-                if tts_item:
-                    all_tts.append(tts_item)
+                all_tts.extend(await dao.get_tts_items(sid))
             return all_tts
     except redis.RedisError as e:
         logger.error(f"Redis操作失败: {str(e)}")
@@ -610,13 +662,13 @@ async def get_tts_item(
 # 删除 TTS 条目
 @app.delete("/tts")
 async def delete_tts_item(
-    session_id: str = Query(..., description="可选的会话ID, 为空时查询所有TTS条目"),
+    session_id: str = Query(..., description="会话ID, 清空该会话的语音队列"),
     dao: TTSDao = Depends(get_tts_dao),
 ):
     try:
         if not await dao.tts_exists(session_id):
             raise HTTPException(status_code=404, detail="TTS条目不存在")
-        await dao.redis.delete(f"tts:{session_id}")
+        await dao.delete_tts_items(session_id)
 
     except redis.RedisError as e:
         logger.error(f"Redis操作失败: {str(e)}")
@@ -667,7 +719,7 @@ async def check_tts_queue_empty(
 async def tts_queue_operation(
     queue_type: str | None = Query(None, description="队列类型"),
     session_id: str | None = Query(
-        None, description="会话ID (存在时为push, 不存在时为pop)"
+        None, description="语音ID {session_id}:{seq} (存在时为push, 不存在时为pop)"
     ),
     dao: TTSDao = Depends(get_tts_dao),
 ):
@@ -724,10 +776,13 @@ class ASRDao:
         self.redis = redis_conn
 
     async def create_asr_item(
-        self, session_id: str, status: str, audio: bytes, text: str
+        self, session_id: str, status: str, audio: bytes, text: str, duration_ms: int = 0
     ):
-        """创建新的ASR条目"""
-        await self.redis.lpush(ASR_INPUT_QUEUE_KEY, session_id)
+        """
+        创建新的ASR条目, 写入数据后再发布任务, 保证 ASR 服务读取时数据已存在
+
+        任务消息携带音频时长, 供 ASR 服务按截止时间调度 (入队时间即消息ID)
+        """
         await self.redis.hset(
             f"asr:{session_id}",
             mapping={
@@ -736,6 +791,10 @@ class ASRDao:
                 "text": text,
             },
         )
+        await self.redis.xadd(
+            ASR_INPUT_STREAM_KEY,
+            {"session_id": session_id, "duration_ms": duration_ms},
+        )
 
     async def update_asr_item(
         self, session_id: str, status: str, audio: bytes, text: str
@@ -760,8 +819,8 @@ class ASRDao:
         }
 
     async def is_input_queue_empty(self) -> bool:
-        """检查ASR输入队列是否为空"""
-        length = await self.redis.llen(ASR_INPUT_QUEUE_KEY)
+        """检查ASR任务流是否为空 (已确认的任务会被删除, 剩余为未处理和处理中的任务)"""
+        length = await self.redis.xlen(ASR_INPUT_STREAM_KEY)
         return length == 0
 
     async def is_output_queue_empty(self) -> bool:
@@ -788,6 +847,7 @@ async def create_asr_item(
     status: str = Query(..., description="条目状态"),
     audio: UploadFile = File(..., description="音频文件"),
     text: str = Query(..., description="文本数据"),
+    duration_ms: int = Query(0, description="音频时长 (毫秒), 为 0 时从 PCM 记录头部计算"),
     dao: ASRDao = Depends(get_asr_dao),
 ):
     try:
@@ -799,7 +859,10 @@ async def create_asr_item(
         # 读取文件内容
         audio_bytes = await audio.read()
 
-        await dao.create_asr_item(session_id, status, audio_bytes, text)
+        if not duration_ms and is_pcm_record(audio_bytes):
+            duration_ms = pcm_duration_ms(audio_bytes)
+
+        await dao.create_asr_item(session_id, status, audio_bytes, text, duration_ms)
 
     except redis.RedisError as e:
         logger.error(f"Redis操作失败: {str(e)}")
@@ -951,16 +1014,25 @@ async def asr_queue_operation(
                 status_code=404, detail="无效的队列类型, 仅支持input/output"
             )
 
-        # 选择目标队列键 (注意修正原 ASR 队列方法的拼写错误)
-        target_queue = (
-            ASR_INPUT_QUEUE_KEY if queue_type == "input" else ASR_OUTPUT_QUEUE_KEY
-        )
+        # 输入为任务流, 由 ASR 服务的消费者组消费
+        if queue_type == "input":
+            if session_id:  # push
+                await dao.redis.xadd(ASR_INPUT_STREAM_KEY, {"session_id": session_id})
+                return
+
+            # pop: 取出最早的任务 (仅用于手动运维, 可能与 ASR 服务同时处理)
+            entries = await dao.redis.xrange(ASR_INPUT_STREAM_KEY, count=1)
+            if not entries:
+                raise HTTPException(status_code=404, detail=f"{queue_type}队列无数据")
+            entry_id, fields = entries[0]
+            await dao.redis.xdel(ASR_INPUT_STREAM_KEY, entry_id)
+            return fields[b"session_id"].decode()
 
         if session_id:  # push
-            await dao.redis.lpush(target_queue, session_id)
+            await dao.redis.lpush(ASR_OUTPUT_QUEUE_KEY, session_id)
 
         else:  # pop
-            session_id = await dao.redis.rpop(target_queue)
+            session_id = await dao.redis.rpop(ASR_OUTPUT_QUEUE_KEY)
             if not session_id:
                 raise HTTPException(status_code=404, detail=f"{queue_type}队列无数据")
             return session_id.decode()
@@ -0,0 +1,237 @@
+"""
+公共日志模块
+
+
+模块功能
+1. 异步日志
+    - 业务代码只把日志记录放入内存队列 (QueueHandler), 由后台线程 (QueueListener) 写文件和控制台
+    - 事件循环不会阻塞在磁盘 IO 上, 队列满时丢弃日志而不是阻塞
+    - 调用线程只合并消息参数 (getMessage) 并把异常转为文本, 时间, 级别等格式化和 JSON 输出在后台线程中完成
+
+2. 热路径日志
+    - RateLimitFilter : 按 logger 限制每秒日志条数 (令牌桶)
+    - SampleFilter    : 每 N 条只保留 1 条
+    - get_hot_logger  : 创建带限流和抽样的子 logger, 用于每个数据包都会执行的代码
+
+3. 可选 JSON 格式输出
+
+示例:
+    >>> logger = setup_logger("audio_io")
+    >>> hot_logger = get_hot_logger(logger)
+    >>> hot_logger.info("Received %d bytes", len(data))
+"""
+
+import atexit
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+#######################################################################
+#    模块配置
+#######################################################################
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_JSON = False  # 是否输出 JSON 格式日志
+LOG_QUEUE_SIZE = 10000  # 日志队列长度, 队列满时丢弃新日志
+
+HOT_LOG_RATE = 10  # 热路径日志每秒最多条数
+HOT_LOG_BURST = 20  # 热路径日志突发上限
+HOT_LOG_SAMPLE = 100  # 热路径日志每 N 条保留 1 条
+
+# 已启动的日志监听器 {logger名称: QueueListener}
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+#######################################################################
+#    格式化和过滤器
+#######################################################################
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON 格式日志, 每条日志一行"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # 经过 DroppingQueueHandler 的记录, 异常已转为文本
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    令牌桶限流过滤器
+
+    参数:
+        rate (float): 每秒补充的日志条数
+        burst (int): 令牌桶容量
+
+    注意:
+        被限流的条数会附加在下一条通过的日志后面
+    """
+
+    def __init__(self, rate, burst):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_time = time.monotonic()
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+
+            if self.tokens < 1:
+                self.suppressed += 1
+                return False
+
+            self.tokens -= 1
+            if self.suppressed:
+                record.msg = f"{record.msg} (已限流 {self.suppressed} 条)"
+                self.suppressed = 0
+            return True
+
+
+class SampleFilter(logging.Filter):
+    """
+    抽样过滤器, 每 sample 条日志保留 1 条
+
+    参数:
+        sample (int): 抽样间隔, 1 表示全部保留
+    """
+
+    def __init__(self, sample):
+        super().__init__()
+        self.sample = max(1, sample)
+        self.counter = itertools.count()  # next() 在多线程下是原子的
+
+    def filter(self, record):
+        return next(self.counter) % self.sample == 0
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    队列满时丢弃日志的 QueueHandler
+
+    注意:
+        - 入队前在调用线程中合并消息参数并把异常转为文本 (与 QueueHandler.prepare 相同),
+          参数对象和 traceback 不会被后台线程引用, 之后被修改也不影响日志内容
+        - 其余格式化 (时间, 级别, JSON) 由 QueueListener 的后台线程完成
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 复制记录, 不影响同一 logger 上的其他 handler
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+#######################################################################
+#    logger 创建
+#######################################################################
+
+
+def setup_logger(name, level=logging.INFO, json_format=LOG_JSON):
+    """
+    创建异步写入的模块 logger, 日志文件位于 当前目录/storage/logs/{name}.log
+
+    参数:
+        name (str): logger 名称, 同时作为日志文件名
+        level (int): 日志级别
+        json_format (bool): 是否输出 JSON 格式
+
+    返回:
+        logging.Logger: 配置好的 logger, 重复调用返回同一个 logger
+    """
+    logger = logging.getLogger(name)
+
+    with _listeners_lock:
+        if name in _listeners:
+            return logger
+
+        logger.setLevel(level)
+
+        # 日志目录
+        log_dir = os.path.join(os.getcwd(), "storage/logs")
+        os.makedirs(log_dir, exist_ok=True)
+        log_file_path = os.path.join(log_dir, f"{name}.log")
+
+        formatter = JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT)
+
+        # 创建文件处理器
+        file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+
+        # 创建控制台处理器
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+
+        # 业务线程只写队列, 由后台线程写文件和控制台
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        logger.addHandler(DroppingQueueHandler(log_queue))
+
+        listener = logging.handlers.QueueListener(
+            log_queue, file_handler, console_handler, respect_handler_level=True
+        )
+        listener.start()
+        atexit.register(listener.stop)
+        _listeners[name] = listener
+
+    return logger
+
+
+def get_hot_logger(
+    logger, suffix="hot", rate=HOT_LOG_RATE, burst=HOT_LOG_BURST, sample=HOT_LOG_SAMPLE
+):
+    """
+    获取热路径子 logger, 先抽样再限流, 输出到父 logger 的处理器
+
+    参数:
+        logger (logging.Logger): 父 logger
+        suffix (str): 子 logger 名称后缀
+        rate (float): 每秒最多条数
+        burst (int): 突发上限
+        sample (int): 每 N 条保留 1 条
+
+    返回:
+        logging.Logger: 子 logger
+    """
+    hot_logger = logger.getChild(suffix)
+    if not hot_logger.filters:
+        hot_logger.addFilter(SampleFilter(sample))
+        hot_logger.addFilter(RateLimitFilter(rate, burst))
+    return hot_logger
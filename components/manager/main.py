@@ -8,7 +8,6 @@ from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI
 import ssl
 import json
-import logging
 import aiohttp
 import uuid
 from pydantic import BaseModel
@@ -23,35 +22,12 @@ if sys.platform.startswith("win"):
 #    配置日志
 #######################################################################
 
-# 配置日志记录
+# 公共模块位于 components 目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from log import setup_logger
 
-logger = logging.getLogger("manager")
-logger.setLevel(logging.INFO)
-
-# 日志目录
-current_dir = os.getcwd()
-log_file_path = os.path.join(current_dir, "storage/logs")
-log_dir = os.path.expanduser(log_file_path)
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file_path = os.path.join(log_dir, "manager.log")
-
-# 创建文件处理器
-file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
-file_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
-
-# 创建控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
-
-# 添加处理器
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# 配置日志记录 (异步写入, 见 components/log.py)
+logger = setup_logger("manager")
 
 # 关闭日志（需要时取消注释）
 # logger.setLevel(logging.CRITICAL)
@@ -686,14 +662,14 @@ async def manager_send(
 
 async def listen(mqtt_client):
     async for message in mqtt_client.messages:
-        print(message.payload)
+        logger.debug("MQTT 消息: %s", message.payload)
 
         try:
             payload = json.loads(message.payload.decode())
 
             # 获取 设备ID
             client_id = str(message.topic).split("/")[1]  # 修改这里
-            logger.info(f"接收到来自 {client_id} 的消息")
+            logger.info("接收到来自 %s 的消息", client_id)
 
             # 根据消息类型分发处理
             msg_type = payload.get("type")
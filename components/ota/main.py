@@ -2,6 +2,7 @@ import asyncio
 import json
 import logging
 import os
+import sys
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, Response
@@ -12,35 +13,12 @@ import redis.asyncio as redis
 #    配置日志
 #######################################################################
 
-# 配置日志记录
+# 公共模块位于 components 目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from log import setup_logger
 
-logger = logging.getLogger("ota")
-logger.setLevel(logging.INFO)
-
-# 日志目录
-current_dir = os.getcwd()
-log_file_path = os.path.join(current_dir, "storage/logs")
-log_dir = os.path.expanduser(log_file_path)
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file_path = os.path.join(log_dir, "ota.log")
-
-# 创建文件处理器
-file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
-file_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
-
-# 创建控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
-
-# 添加处理器
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# 配置日志记录 (异步写入, 见 components/log.py)
+logger = setup_logger("ota")
 
 # 关闭日志（需要时取消注释）
 # logger.setLevel(logging.CRITICAL)
@@ -50,6 +28,9 @@ logger.addHandler(console_handler)
 #  模块配置
 #####################
 
+# 存储目录 (固件文件位于 storage/firmware)
+current_dir = os.getcwd()
+
 ## 定义最新的版本固件
 
 UVICORN_HOST = "192.168.0.111"  # FastAPI服务监听地址
@@ -559,8 +540,6 @@ async def firmware():
             media_type="application/octet-stream",
             headers={"Content-Disposition": f"attachment; filename=example.hex"},
         )
-
-        logging.info(f"Hex file {log_file_path} not found.")
     except FileNotFoundError:
         print(f"Firmware file not found at {firmware_file_path}")
         return {"error": "Firmware file not found"}
@@ -9,6 +9,7 @@ class SessionDataBase(BaseModel):
     udp_port: int = Field(..., description="UDP端口")
     audio_sample: int = Field(..., description="音频采样率")
     audio_channel: int = Field(..., description="音频通道数")
+    frame_duration: int = Field(..., description="音频帧时长")
 
 
 class TTSDataBase(BaseModel):
@@ -0,0 +1,607 @@
+"""
+TTS 容量压测工具
+
+
+在本进程中按 main.py 的配置启动 TTS 服务组件 (合成工作进程池, 合成结果缓存, 请求合并),
+使用内置的中英文回复语料 (或 --corpus 指定的文件) 调用 process_tts_task 压测, 输出:
+    - 首包延迟 (TTFA, 从提交到第一段音频写入音频流) 和总合成时间的 p50/p95/p99
+    - 实时率 (合成耗时 / 音频时长), 整体实时率和可支撑的实时播放路数
+    - 合成结果缓存命中率, 请求合并率, 音色路由命中率
+    - 峰值内存 (主进程和合成工作进程)
+
+Redis:
+    redis  : 连接本地 Redis, 使用独立的会话和队列键 (bench:{run_id}:*), 不影响线上任务
+    memory : 进程内的内存实现 (MemoryRedis), 只实现 TTS 服务用到的命令, 不需要 Redis
+
+缓存:
+    cold   : 使用临时目录作为磁盘缓存, 语料重复出现时命中 (请求数超过语料条数)
+    shared : 使用 main.py 配置的缓存目录 (已有的缓存条目直接命中)
+    off    : 关闭缓存, 每条请求都合成
+
+注意:
+    - TTFA 取音频流第一条音频消息的 ID (毫秒时间戳), 关闭分句流式合成 (--no-streaming) 时等于总合成时间
+    - 结果可输出为 JSON (--json), 通过 --label 区分不同引擎, 音色和配置后对比
+
+示例:
+    python benchmark.py --redis memory --concurrency 8 --requests 200
+    python benchmark.py --voice huayan --workers 4 --cache off --label piper-w4 --json piper-w4.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+import uuid
+
+import main
+from audio_format import is_pcm_record, pcm_duration_ms, unpack_opus_frames
+from utterance import (
+    STATE_FAILED,
+    TRANSITION_SCRIPT,
+    enqueue_utterance,
+    index_key,
+    record_key,
+    remove_utterance,
+    seq_key,
+)
+
+BENCH_PREFIX = "bench"
+
+# 内置语料: 设备对话中常见长度和句式的回复
+CORPUS = {
+    "zh": [
+        "好的，已经为你设置好明天早上七点的闹钟。",
+        "今天北京晴，气温十二到二十三度，适合出门散步。",
+        "抱歉，我没有听清楚，可以再说一遍吗？",
+        "没问题，马上为你播放一首轻松的音乐。",
+        "现在是下午三点二十五分。",
+        "好的，既然你没说话，那我先退下了哈。晚安哦～",
+        "我查了一下，从这里到火车站开车大约需要二十分钟，现在路况比较通畅。",
+        "番茄炒蛋的做法很简单：先把鸡蛋炒熟盛出，再炒番茄出汁，最后把鸡蛋倒回去翻炒均匀，加少许盐和糖调味就可以了。",
+        "客厅的灯已经关闭。",
+        "你好呀，今天过得怎么样？",
+        "已将音量调到百分之六十。",
+        "这个问题有点复杂，我们一步一步来看。首先需要确认设备已经连接到网络，然后重启一下路由器，再试一次。",
+        "明天有小雨，出门记得带伞。",
+        "好的，提醒已经取消。",
+        "我是你的语音助手，可以帮你查天气、设闹钟、讲故事，还可以陪你聊天。",
+        "网络好像出了点问题，请稍后再试。",
+    ],
+    "en": [
+        "Sure, I've set an alarm for seven tomorrow morning.",
+        "It's sunny in Beijing today, with a high of twenty-three degrees.",
+        "Sorry, I didn't catch that. Could you say it again?",
+        "Okay, playing some relaxing music now.",
+        "It's three twenty-five in the afternoon.",
+        "The living room lights are off.",
+        "Hi there! How has your day been so far?",
+        "I've turned the volume up to sixty percent.",
+        "Light rain is expected tomorrow, so remember to bring an umbrella.",
+        "Your reminder has been cancelled.",
+        "Driving to the train station should take about twenty minutes, and traffic looks light right now.",
+        "Let's take it step by step. First, make sure the device is connected to Wi-Fi, then restart your router and try again.",
+        "I'm your voice assistant. I can check the weather, set alarms, tell stories, or just chat.",
+        "Something went wrong with the network. Please try again in a moment.",
+        "Here's a quick tip: a short walk after lunch can really help you stay focused in the afternoon.",
+        "Good night, and sleep well!",
+    ],
+}
+
+
+def load_corpus(path: str, language: str) -> list:
+    """
+    读取压测语料
+
+    参数:
+        path (str): 语料文件, 每行一条回复; 为空时使用内置语料
+        language (str): 内置语料的语言, "zh", "en" 或 "mixed"
+    """
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    if language == "mixed":
+        return [text for pair in zip(CORPUS["zh"], CORPUS["en"]) for text in pair]
+    return list(CORPUS[language])
+
+
+def percentiles(samples, scale: float = 1000, digits: int = 2) -> dict:
+    """计算样本的 p50/p95/p99/max, 默认为耗时 (秒) 换算为毫秒"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale, digits)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": pick(1.0)}
+
+
+#######################################################################
+#    内存 Redis
+#######################################################################
+
+
+def encode(value) -> bytes:
+    """按 redis-py 的规则编码写入的值"""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+class MemoryPipeline:
+    """MemoryRedis 的管道, execute 时按顺序执行记录的命令"""
+
+    def __init__(self, redis_conn):
+        self.redis_conn = redis_conn
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis_conn, name)
+
+        def record(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+
+        return record
+
+    async def execute(self) -> list:
+        results = [await method(*args, **kwargs) for method, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+class MemoryRedis:
+    """
+    进程内的 Redis 替身 (decode_responses=False), 只实现 TTS 服务和压测用到的命令
+
+    注意:
+        - 不支持过期 (expire 只返回 True), 压测结束时按键清理
+        - eval 只支持 utterance.TRANSITION_SCRIPT
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.stream_seq = itertools.count()
+        self.changed = asyncio.Condition()
+
+    async def ping(self):
+        return True
+
+    async def aclose(self):
+        pass
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(encode(key), None) is not None for key in keys)
+
+    async def expire(self, key, seconds):
+        return encode(key) in self.data
+
+    async def incr(self, key):
+        value = int(self.data.get(encode(key), b"0")) + 1
+        self.data[encode(key)] = encode(value)
+        return value
+
+    # hash
+    async def hset(self, key, field=None, value=None, mapping=None):
+        fields = self.data.setdefault(encode(key), {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        added = sum(encode(k) not in fields for k in items)
+        fields.update({encode(k): encode(v) for k, v in items.items()})
+        return added
+
+    async def hgetall(self, key):
+        return dict(self.data.get(encode(key), {}))
+
+    # list
+    async def lpush(self, key, *values):
+        async with self.changed:
+            items = self.data.setdefault(encode(key), [])
+            for value in values:
+                items.insert(0, encode(value))
+            self.changed.notify_all()
+            return len(items)
+
+    async def brpop(self, keys, timeout=0):
+        keys = [encode(key) for key in ([keys] if isinstance(keys, (str, bytes)) else keys)]
+
+        def ready():
+            return any(self.data.get(key) for key in keys)
+
+        async with self.changed:
+            try:
+                await asyncio.wait_for(self.changed.wait_for(ready), timeout or None)
+            except asyncio.TimeoutError:
+                return None
+            key = next(key for key in keys if self.data.get(key))
+            return key, self.data[key].pop()
+
+    # sorted set
+    async def zadd(self, key, mapping):
+        scores = self.data.setdefault(encode(key), {})
+        added = sum(encode(m) not in scores for m in mapping)
+        scores.update({encode(m): float(s) for m, s in mapping.items()})
+        return added
+
+    async def zincrby(self, key, amount, member):
+        scores = self.data.setdefault(encode(key), {})
+        scores[encode(member)] = scores.get(encode(member), 0.0) + amount
+        return scores[encode(member)]
+
+    async def zrem(self, key, *members):
+        scores = self.data.get(encode(key), {})
+        return sum(scores.pop(encode(m), None) is not None for m in members)
+
+    async def zrange(self, key, start, end):
+        members = sorted(self.data.get(encode(key), {}).items(), key=lambda item: item[1])
+        return [m for m, _ in members[start : None if end == -1 else end + 1]]
+
+    async def zrevrange(self, key, start, end):
+        members = sorted(
+            self.data.get(encode(key), {}).items(), key=lambda item: item[1], reverse=True
+        )
+        return [m for m, _ in members[start : None if end == -1 else end + 1]]
+
+    # stream
+    async def xadd(self, key, fields):
+        entry_id = f"{int(time.time() * 1000)}-{next(self.stream_seq)}".encode()
+        entries = self.data.setdefault(encode(key), [])
+        entries.append((entry_id, {encode(k): encode(v) for k, v in fields.items()}))
+        return entry_id
+
+    async def xrange(self, key, min="-", max="+"):
+        return list(self.data.get(encode(key), []))
+
+    # script
+    async def eval(self, script, numkeys, *args):
+        if script != TRANSITION_SCRIPT:
+            raise NotImplementedError("MemoryRedis 只支持 TRANSITION_SCRIPT")
+        key, to_state, *from_states = args
+        fields = self.data.get(encode(key))
+        if not fields or fields.get(b"state") not in [encode(s) for s in from_states]:
+            return 0
+        fields[b"state"] = encode(to_state)
+        return 1
+
+
+#######################################################################
+#    压测
+#######################################################################
+
+
+def configure(args, run_id: str, cache_dir: str):
+    """按命令行参数覆盖 main.py 的配置, 压测使用独立的 Redis 键"""
+    main.REDIS_HOST = args.redis_host
+    main.REDIS_PORT = args.redis_port
+    if args.redis == "memory":
+        main.create_redis = MemoryRedis
+
+    main.TTS_INPUT_QUEUE_KEY = f"{BENCH_PREFIX}:{run_id}:tts_input_queue"
+    main.TTS_OUTPUT_QUEUE_KEY = f"{BENCH_PREFIX}:{run_id}:tts_output_queue"
+    main.TTS_VOICE_USAGE_KEY = f"{BENCH_PREFIX}:{run_id}:tts_voice_usage"
+    main.TTS_FORMAT_USAGE_KEY = f"{BENCH_PREFIX}:{run_id}:tts_format_usage"
+
+    # 后台预渲染会与压测请求争抢工作进程, 压测时不加载短语配置
+    main.TTS_PRERENDER_CONFIG = os.path.join(cache_dir, "prerender.json")
+
+    main.TTS_STREAMING_ENABLED = args.streaming
+    main.TTS_OPUS_ENABLED = args.format == "opus"
+    main.TTS_WORKERS = args.workers
+    main.TTS_DEFAULT_VOICE = args.voice
+
+    if args.cache == "off":
+        main.TTS_CACHE_MEMORY_BYTES = 0
+        main.TTS_CACHE_DIR = None
+    elif args.cache == "cold":
+        main.TTS_CACHE_DIR = cache_dir
+
+
+class Benchmark:
+    """
+    压测执行器
+
+    参数:
+        app (FastAPI): 已启动的 TTS 应用
+        corpus (list[str]): 压测语料
+        args: 命令行参数 (音色和会话音频参数)
+        run_id (str): 本次压测ID
+    """
+
+    def __init__(self, app, corpus, args, run_id):
+        self.app = app
+        self.corpus = corpus
+        self.args = args
+        self.run_id = run_id
+        self.records = []
+        self.errors = 0
+
+    def audio_ms(self, fields: dict) -> int:
+        """一条音频消息 (或语音记录) 的音频时长 (单位: 毫秒)"""
+        if fields.get(b"opus"):
+            return len(unpack_opus_frames(fields[b"opus"])) * self.args.frame_duration
+        audio = fields.get(b"audio")
+        if audio and is_pcm_record(audio):
+            return pcm_duration_ms(audio)
+        return 0
+
+    async def request(self, index: int):
+        """合成一条语料并记录耗时"""
+        text = self.corpus[index % len(self.corpus)]
+        session_id = f"{BENCH_PREFIX}-{self.run_id}-{index}"
+        redis_conn = self.app.state.redis
+        seq = None
+
+        try:
+            await redis_conn.hset(
+                f"session:{session_id}",
+                mapping={
+                    "audio_sample": self.args.sample_rate,
+                    "audio_channel": self.args.channels,
+                    "frame_duration": self.args.frame_duration,
+                    "tts_role": self.args.voice,
+                },
+            )
+            seq = await enqueue_utterance(
+                redis_conn, session_id, text, main.TTS_OUTPUT_QUEUE_KEY
+            )
+
+            start_time = time.time()
+            await main.process_tts_task(self.app, session_id, seq)
+            total = time.time() - start_time
+
+            record = await redis_conn.hgetall(record_key(session_id, seq))
+            if not record or record.get(b"state") == STATE_FAILED.encode():
+                self.errors += 1
+                return
+
+            if record.get(b"stream"):
+                entries = await redis_conn.xrange(record[b"stream"])
+                chunks = [fields for _, fields in entries if not fields.get(b"end")]
+                if not chunks or entries[-1][1].get(b"end") != b"ok":
+                    self.errors += 1
+                    return
+                first_ms = int(entries[0][0].split(b"-")[0])
+                ttfa = max(0.0, first_ms / 1000 - start_time)
+                audio_ms = sum(self.audio_ms(fields) for fields in chunks)
+            else:
+                ttfa = total
+                audio_ms = self.audio_ms(record)
+
+            self.records.append(
+                {
+                    "chars": len(text),
+                    "ttfa": ttfa,
+                    "total": total,
+                    "audio_seconds": audio_ms / 1000,
+                    "rtf": total / (audio_ms / 1000) if audio_ms else None,
+                }
+            )
+
+        except Exception as e:
+            self.errors += 1
+            print(f"请求失败 {session_id}: {e}")
+
+        finally:
+            if seq is not None:
+                await remove_utterance(redis_conn, session_id, seq)
+            await redis_conn.delete(
+                f"session:{session_id}", index_key(session_id), seq_key(session_id)
+            )
+
+    async def run_closed(self, requests: int, concurrency: int):
+        """闭环: 固定数量的客户端连续发送"""
+        counter = iter(range(requests))
+
+        async def client():
+            for index in counter:
+                await self.request(index)
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    async def run_poisson(self, requests: int, rate: float):
+        """开环: 指数分布间隔到达"""
+        tasks = []
+        for index in range(requests):
+            tasks.append(asyncio.create_task(self.request(index)))
+            await asyncio.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks)
+
+
+def cpu_seconds() -> tuple:
+    """返回 (主进程 CPU 秒数, 已退出子进程 CPU 秒数)"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def build_report(args, bench, wall_seconds, cpu_used, stats) -> dict:
+    """汇总压测结果"""
+    records = bench.records
+    audio_seconds = sum(r["audio_seconds"] for r in records)
+    synth_seconds = sum(r["total"] for r in records)
+    engine = main.TTS_VOICES.get(args.voice, {}).get("engine")
+
+    report = {
+        "label": args.label,
+        "config": {
+            "voice": args.voice,
+            "engine": engine,
+            "workers": args.workers,
+            "streaming": args.streaming,
+            "format": args.format,
+            "cache": args.cache,
+            "redis": args.redis,
+            "arrival": args.arrival,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "sample_rate": args.sample_rate,
+            "channels": args.channels,
+            "frame_duration": args.frame_duration,
+            "corpus": args.corpus or args.language,
+        },
+        "requests": len(records),
+        "errors": bench.errors,
+        "wall_seconds": round(wall_seconds, 2),
+        "audio_seconds": round(audio_seconds, 2),
+        "latency_ms": {
+            "ttfa": percentiles([r["ttfa"] for r in records]),
+            "total": percentiles([r["total"] for r in records]),
+        },
+        # 单条实时率: 合成耗时 (含排队) / 音频时长
+        "rtf": percentiles(
+            [r["rtf"] for r in records if r["rtf"] is not None], scale=1, digits=4
+        ),
+        "cache": stats["cache"],
+        "coalesce": stats["coalesce"],
+        "routing": stats["routing"],
+        "cpu_utilization": round(cpu_used / (wall_seconds * os.cpu_count()), 3),
+        "peak_rss_mb": {
+            "main": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "workers": round(
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1
+            ),
+        },
+    }
+
+    if audio_seconds and wall_seconds:
+        # 整体实时率 < 1 表示合成速度快于播放, realtime_streams 为可同时连续播放的路数
+        report["overall_rtf"] = round(wall_seconds / audio_seconds, 4)
+        report["mean_rtf"] = round(synth_seconds / audio_seconds, 4)
+        report["realtime_streams"] = round(audio_seconds / wall_seconds, 2)
+    return report
+
+
+def print_report(report: dict):
+    print(f"\n== {report['label'] or report['config']['voice']} ==")
+    print(
+        f"请求: {report['requests']} (失败 {report['errors']}), "
+        f"墙钟: {report['wall_seconds']}s, 音频: {report['audio_seconds']}s"
+    )
+    if "overall_rtf" in report:
+        print(
+            f"整体 RTF: {report['overall_rtf']}, 平均 RTF: {report['mean_rtf']}, "
+            f"实时路数: {report['realtime_streams']}"
+        )
+    print(f"单条 RTF: {report['rtf']}")
+    print(
+        f"缓存命中率: {report['cache'].get('hit_rate')}, "
+        f"合并率: {report['coalesce'].get('coalesce_rate')}, "
+        f"音色路由命中率: {report['routing'].get('warm_rate')}"
+    )
+    print(
+        f"CPU 利用率: {report['cpu_utilization']}, 峰值 RSS(MB): {report['peak_rss_mb']}"
+    )
+    print(f"{'延迟(ms)':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for stage, values in report["latency_ms"].items():
+        print(
+            f"{stage:<12}"
+            + "".join(f"{values.get(q, '-'):>10}" for q in ("p50", "p95", "p99", "max"))
+        )
+
+
+async def run(args):
+    corpus = load_corpus(args.corpus, args.language)
+    if not corpus:
+        raise SystemExit("语料为空")
+
+    run_id = uuid.uuid4().hex[:8]
+    with tempfile.TemporaryDirectory(prefix="tts-bench-") as cache_dir:
+        configure(args, run_id, cache_dir)
+        app = main.app
+
+        async with main.lifespan(app):
+            bench = Benchmark(app, corpus, args, run_id)
+
+            cpu_before = sum(cpu_seconds())
+            start_time = time.perf_counter()
+
+            if args.arrival == "closed":
+                await bench.run_closed(args.requests, args.concurrency)
+            else:
+                await bench.run_poisson(args.requests, args.rate)
+
+            wall_seconds = time.perf_counter() - start_time
+            stats = {
+                "cache": app.state.phrase_cache.stats(),
+                "coalesce": app.state.single_flight.stats(),
+                "routing": {
+                    key: value
+                    for key, value in app.state.synthesis_pool.stats().items()
+                    if key in ("warm", "cold", "warm_rate")
+                },
+            }
+
+            await app.state.redis.delete(
+                main.TTS_INPUT_QUEUE_KEY,
+                main.TTS_OUTPUT_QUEUE_KEY,
+                main.TTS_VOICE_USAGE_KEY,
+                main.TTS_FORMAT_USAGE_KEY,
+            )
+
+        # 合成工作进程在 lifespan 结束时退出, CPU 时间和内存计入 RUSAGE_CHILDREN
+        cpu_used = sum(cpu_seconds()) - cpu_before
+
+    return build_report(args, bench, wall_seconds, cpu_used, stats)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="TTS 容量压测")
+    parser.add_argument("--corpus", help="语料文件, 每行一条, 默认使用内置语料")
+    parser.add_argument(
+        "--language", choices=["zh", "en", "mixed"], default="mixed", help="内置语料语言"
+    )
+    parser.add_argument("--arrival", choices=["closed", "poisson"], default="closed")
+    parser.add_argument("--requests", type=int, default=100, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发客户端数")
+    parser.add_argument("--rate", type=float, default=5.0, help="poisson 每秒请求数")
+
+    parser.add_argument(
+        "--voice", choices=sorted(main.TTS_VOICES), default=main.TTS_DEFAULT_VOICE
+    )
+    parser.add_argument("--workers", type=int, default=main.TTS_WORKERS)
+    parser.add_argument(
+        "--no-streaming",
+        dest="streaming",
+        action="store_false",
+        help="关闭分句流式合成 (整段合成)",
+    )
+    parser.add_argument("--format", choices=["opus", "pcm"], default="opus")
+    parser.add_argument("--cache", choices=["cold", "shared", "off"], default="cold")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--frame-duration", type=int, default=60)
+
+    parser.add_argument("--redis", choices=["redis", "memory"], default="redis")
+    parser.add_argument("--redis-host", default=main.REDIS_HOST)
+    parser.add_argument("--redis-port", type=int, default=main.REDIS_PORT)
+    parser.add_argument("--label", default="", help="结果标签, 便于对比")
+    parser.add_argument("--json", help="结果输出为 JSON 文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,315 @@
+"""
+TTS 合成结果缓存 (内存 LRU + 磁盘)
+
+
+模块功能
+1. 缓存键: 规范化文本 + 音色 (tts_role) + 语速 + 采样率 + 通道数 + 输出格式
+2. 内存层: 按字节数限制容量的 LRU, 命中时直接返回, 不经过合成
+3. 磁盘层: 按内容寻址存储 (objects/{sha256[:2]}/{sha256}), 缓存键到内容摘要的索引在 keys/ 目录,
+   命中后提升到内存层; 超出容量时按最近访问时间淘汰
+4. 后台写入: 磁盘写入和淘汰在单独的写入线程中按顺序执行, 写入完成前的条目在内存中可查
+5. 统计各层命中次数和命中率
+
+磁盘目录结构:
+    {cache_dir}/keys/{缓存键摘要}      : 内容摘要
+    {cache_dir}/objects/{ab}/{内容摘要} : 音频数据
+
+示例:
+    >>> cache = PhraseCache(memory_bytes=64 << 20, cache_dir="storage/tts_cache", disk_bytes=1 << 30)
+    >>> key = cache_key("好的", "saike", 150, 16000, 1, "opus60")
+    >>> data = cache.get(key)
+    >>> if data is None:
+    ...     cache.put(key, synthesize(...))
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("tts_server.cache")
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本: 全角/半角统一 (NFKC), 合并空白, 去掉首尾空白"""
+    return WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(
+    text: str,
+    tts_role: str,
+    rate: int,
+    sample_rate: int,
+    channels: int,
+    audio_format: str,
+    engine: str = "pyttsx3",
+) -> str:
+    """
+    生成缓存键
+
+    参数:
+        text (str): 合成文本
+        tts_role (str): 音色
+        rate (int): 语速
+        sample_rate (int): 采样率
+        channels (int): 通道数
+        audio_format (str): 输出格式, 如 "pcm", "opus60" (Opus 帧时长 60ms)
+        engine (str): 合成引擎名称
+
+    返回:
+        str: 缓存键 (sha256 摘要)
+    """
+    return hashlib.sha256(
+        "|".join(
+            (
+                normalize_text(text),
+                tts_role,
+                str(rate),
+                str(sample_rate),
+                str(channels),
+                audio_format,
+                engine,
+            )
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+class PhraseCache:
+    """
+    两级合成结果缓存
+
+    参数:
+        memory_bytes (int): 内存层容量上限 (单位: 字节)
+        cache_dir (str): 磁盘层目录, 为 None 时只使用内存层
+        disk_bytes (int): 磁盘层容量上限 (单位: 字节)
+
+    注意:
+        - 读写均为同步调用, 可以在事件循环中直接调用: 读取磁盘层只读一个小文件 (单条音频),
+          写入磁盘层 (临时文件 + 重命名, 超出容量时遍历数据目录淘汰) 提交到写入线程, 不阻塞调用方
+        - 磁盘层的容量统计只在写入线程中修改
+        - 关闭服务时调用 close(), 等待排队的磁盘写入完成
+    """
+
+    def __init__(self, memory_bytes, cache_dir=None, disk_bytes=0):
+        self.memory_bytes = memory_bytes
+        self.cache_dir = cache_dir
+        self.disk_bytes = disk_bytes
+
+        self.memory = OrderedDict()  # {缓存键: 音频数据}
+        self.memory_used = 0
+        self.disk_used = 0
+        self.pending = {}  # {缓存键: 音频数据}, 已提交但尚未写入磁盘的条目
+        self.writer = None
+
+        # 统计信息
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+        if cache_dir:
+            os.makedirs(os.path.join(cache_dir, "keys"), exist_ok=True)
+            os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+            self.disk_used = sum(size for _, _, size in self.scan_objects())
+            self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-cache")
+
+    #######################################################################
+    #    读写
+    #######################################################################
+
+    def get(self, key: str):
+        """
+        查询缓存
+
+        返回:
+            bytes | None: 音频数据, 未命中时返回 None
+        """
+        data = self.memory.get(key)
+        if data is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+
+        data = self.pending.get(key)
+        if data is None:
+            data = self.read_disk(key)
+        if data is not None:
+            self.disk_hits += 1
+            self.put_memory(key, data)
+            return data
+
+        self.misses += 1
+        return None
+
+    def contains(self, key: str) -> bool:
+        """是否已缓存 (不计入命中统计, 不调整淘汰顺序)"""
+        if key in self.memory or key in self.pending:
+            return True
+        return bool(self.cache_dir) and os.path.exists(self.key_path(key))
+
+    def put(self, key: str, data: bytes):
+        """写入内存层, 磁盘层的写入提交到写入线程后立即返回"""
+        self.puts += 1
+        self.put_memory(key, data)
+        if self.writer:
+            self.pending[key] = data
+            self.writer.submit(self.write_pending, key, data)
+
+    def write_pending(self, key: str, data: bytes):
+        """写入线程: 写入磁盘层, 完成后从待写入条目中移除"""
+        try:
+            self.write_disk(key, data)
+        except OSError as e:
+            logger.error("写入 TTS 磁盘缓存失败: %s", e)
+        finally:
+            # 写入期间同一个键可能再次提交, 只移除本次提交的数据
+            if self.pending.get(key) is data:
+                del self.pending[key]
+
+    def flush(self):
+        """等待已提交的磁盘写入完成"""
+        if self.writer:
+            self.writer.submit(lambda: None).result()
+
+    def close(self):
+        """等待已提交的磁盘写入完成并停止写入线程"""
+        if self.writer:
+            self.writer.shutdown(wait=True)
+            self.writer = None
+
+    def put_memory(self, key: str, data: bytes):
+        """写入内存层, 超出容量时淘汰最久未使用的条目"""
+        if len(data) > self.memory_bytes:
+            return
+
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_used -= len(old)
+        self.memory[key] = data
+        self.memory_used += len(data)
+
+        while self.memory_used > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_used -= len(evicted)
+            self.memory_evictions += 1
+
+    #######################################################################
+    #    磁盘层
+    #######################################################################
+
+    def key_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "keys", key)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest)
+
+    def read_disk(self, key: str):
+        """读取磁盘层, 索引或数据文件缺失时视为未命中"""
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.key_path(key), "r") as f:
+                digest = f.read().strip()
+            path = self.object_path(digest)
+            with open(path, "rb") as f:
+                data = f.read()
+            # 更新访问时间, 用于淘汰
+            os.utime(path)
+            return data
+        except (OSError, ValueError):
+            return None
+
+    def write_disk(self, key: str, data: bytes):
+        """按内容摘要写入数据文件 (内容相同时复用), 再写入索引"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.write_atomic(path, data)
+            self.disk_used += len(data)
+        self.write_atomic(self.key_path(key), digest.encode())
+
+        if self.disk_used > self.disk_bytes:
+            self.prune_disk()
+
+    def write_atomic(self, path: str, data: bytes):
+        """写入临时文件后重命名, 读取方不会看到不完整的文件"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def scan_objects(self) -> list:
+        """返回所有数据文件 [(访问时间, 路径, 大小)]"""
+        objects = []
+        for root, _, names in os.walk(os.path.join(self.cache_dir, "objects")):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                objects.append((stat.st_mtime, path, stat.st_size))
+        return objects
+
+    def prune_disk(self):
+        """按最近访问时间淘汰数据文件, 直到低于容量上限的 90%; 失效的索引在读取时视为未命中"""
+        target = self.disk_bytes * 0.9
+        for _, path, size in sorted(self.scan_objects()):
+            if self.disk_used <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            self.disk_used -= size
+            self.disk_evictions += 1
+
+        # 清理指向已删除数据文件的索引
+        keys_dir = os.path.join(self.cache_dir, "keys")
+        for name in os.listdir(keys_dir):
+            path = os.path.join(keys_dir, name)
+            try:
+                with open(path, "r") as f:
+                    digest = f.read().strip()
+                if not os.path.exists(self.object_path(digest)):
+                    os.unlink(path)
+            except OSError:
+                continue
+
+    #######################################################################
+    #    统计
+    #######################################################################
+
+    def stats(self) -> dict:
+        """返回缓存统计信息"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory_used,
+            "memory_limit": self.memory_bytes,
+            "disk_bytes": self.disk_used,
+            "disk_limit": self.disk_bytes,
+            "disk_pending": len(self.pending),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "puts": self.puts,
+            "memory_evictions": self.memory_evictions,
+            "disk_evictions": self.disk_evictions,
+            "hit_rate": round(
+                (self.memory_hits + self.disk_hits) / lookups, 4
+            ) if lookups else 0.0,
+        }
@@ -0,0 +1,88 @@
+"""
+相同合成请求合并 (single-flight)
+
+
+模块功能
+1. 按合成键 (与缓存键相同) 记录正在执行的合成任务
+2. 相同键的后续请求不再合成, 等待同一个任务的结果, 完成后分发给所有等待方
+3. 合成任务独立于发起方运行, 发起方被取消时不影响其他等待方
+4. 统计合成次数, 合并次数和单次合成的最大等待方数量
+
+示例:
+    >>> single_flight = SingleFlight()
+    >>> data = await single_flight.run(key, lambda: synthesize(text))
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger("tts_server.coalesce")
+
+
+class SingleFlight:
+    """按键合并同时进行的异步任务"""
+
+    def __init__(self):
+        self.inflight = {}  # {键: asyncio.Task}
+        self.waiters = {}  # {键: 等待方数量}
+
+        # 统计信息
+        self.flights = 0
+        self.coalesced = 0
+        self.max_fanout = 0
+
+    async def run(self, key: str, factory):
+        """
+        执行或加入相同键的任务
+
+        参数:
+            key (str): 合并键
+            factory (callable): 无参数, 返回协程, 只有第一个请求会调用
+
+        返回:
+            任务结果, 任务失败时所有等待方收到相同的异常
+        """
+        return await asyncio.shield(self.start(key, factory))
+
+    def start(self, key: str, factory) -> asyncio.Task:
+        """
+        执行或加入相同键的任务, 不等待结果
+
+        返回:
+            asyncio.Task: 该键正在执行的任务, 调用方等待时应使用 asyncio.shield, 避免取消影响其他等待方
+
+        注意:
+            任务在返回前已登记, 之后相同键的请求都会加入该任务
+        """
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self.inflight[key] = task
+            self.waiters[key] = 0
+            self.flights += 1
+            task.add_done_callback(lambda done: self.finish(key, done))
+        else:
+            self.coalesced += 1
+
+        self.waiters[key] += 1
+        return task
+
+    def finish(self, key: str, task: asyncio.Task):
+        """任务完成, 移除记录"""
+        self.inflight.pop(key, None)
+        self.max_fanout = max(self.max_fanout, self.waiters.pop(key, 0))
+
+        # 所有等待方都已取消时没有人读取结果, 在此读取异常避免告警
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("合并任务失败: %s - %s", key, task.exception())
+
+    def stats(self) -> dict:
+        """返回合并统计信息"""
+        requests = self.flights + self.coalesced
+        return {
+            "inflight": len(self.inflight),
+            "flights": self.flights,
+            "coalesced": self.coalesced,
+            "coalesce_rate": round(self.coalesced / requests, 4) if requests else 0.0,
+            "max_fanout": self.max_fanout,
+        }
@@ -0,0 +1,251 @@
+"""
+TTS 合成引擎
+
+
+模块功能
+1. 合成引擎接口 (SpeechEngine):
+    - synthesize(text) 返回内存中的 16 位 PCM 数据, 以及引擎输出的采样率和通道数
+    - synthesize_stream(text) 逐块返回 PCM 数据, 支持增量输出的引擎 (streaming = True)
+      合成出第一块即可返回, 其余引擎一次返回整段
+    - sample_rate / channels 声明引擎的原生输出格式 (运行时才能确定的为 None)
+2. Pyttsx3Engine: 平台语音引擎 (pyttsx3), 只支持输出到文件,
+   临时文件写在内存文件系统 (/dev/shm) 中, 读取后立即删除, 不经过磁盘
+3. PiperEngine: CPU 神经网络语音合成 (Piper, VITS 结构的 ONNX 模型), 从本地文件加载模型,
+   按句增量输出, 结果确定 (相同文本和参数输出相同)
+4. convert_pcm: 向量化 (NumPy) 的通道数和采样率转换, 替代 pydub/ffmpeg
+5. create_engine: 按名称创建引擎, 引擎依赖在创建时才导入 (只需安装所用引擎的依赖)
+
+示例:
+    >>> engine = create_engine("piper", {"model_path": "models/zh_CN-huayan-medium.onnx"})
+    >>> for pcm_data, sample_rate, channels in engine.synthesize_stream("你好"):
+    ...     pcm_data = convert_pcm(pcm_data, sample_rate, channels, 16000, 1)
+"""
+
+import json
+import os
+import tempfile
+import wave
+
+import numpy as np
+
+# 临时文件目录, 优先使用内存文件系统
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+#######################################################################
+#    格式转换
+#######################################################################
+
+
+def to_int16(frames: bytes, sample_width: int) -> np.ndarray:
+    """将 8/16/32 位 PCM 数据转换为 int16 数组"""
+    if sample_width == 2:
+        return np.frombuffer(frames, dtype="<i2")
+    if sample_width == 1:
+        # 8 位 WAV 为无符号数
+        return ((np.frombuffer(frames, dtype=np.uint8).astype(np.int16) - 128) << 8).astype(
+            np.int16
+        )
+    if sample_width == 4:
+        return (np.frombuffer(frames, dtype="<i4") >> 16).astype(np.int16)
+    raise ValueError(f"不支持的采样位宽: {sample_width}")
+
+
+def convert_pcm(
+    pcm_data: bytes, src_rate: int, src_channels: int, dst_rate: int, dst_channels: int
+) -> bytes:
+    """
+    转换 16 位 PCM 数据的通道数和采样率
+
+    参数:
+        pcm_data (bytes): 16 位有符号 PCM 数据 (交错存储)
+        src_rate, src_channels: 原始采样率和通道数
+        dst_rate, dst_channels: 目标采样率和通道数
+
+    返回:
+        bytes: 转换后的 16 位 PCM 数据
+
+    注意:
+        - 通道转换: 先混合为单声道, 再复制到目标通道数
+        - 采样率转换: 线性插值 (与 pydub/audioop.ratecv 相当), 不做抗混叠滤波
+    """
+    if src_rate == dst_rate and src_channels == dst_channels:
+        return pcm_data
+
+    audio = np.frombuffer(pcm_data, dtype="<i2").reshape(-1, src_channels)
+    audio = audio.astype(np.float32)
+
+    if src_channels != dst_channels:
+        audio = np.repeat(audio.mean(axis=1, keepdims=True), dst_channels, axis=1)
+
+    if src_rate != dst_rate and len(audio):
+        out_frames = int(round(len(audio) * dst_rate / src_rate))
+        positions = np.arange(out_frames) * (src_rate / dst_rate)
+        index = np.arange(len(audio))
+        audio = np.stack(
+            [np.interp(positions, index, audio[:, c]) for c in range(audio.shape[1])],
+            axis=1,
+        )
+
+    return np.clip(np.rint(audio), -32768, 32767).astype("<i2").tobytes()
+
+
+#######################################################################
+#    合成引擎
+#######################################################################
+
+
+class SpeechEngine:
+    """
+    合成引擎接口
+
+    属性:
+        streaming (bool): 是否支持增量输出 (synthesize_stream 合成出第一块即返回)
+        sample_rate (int | None): 原生采样率, 由合成结果决定时为 None
+        channels (int | None): 原生通道数, 由合成结果决定时为 None
+    """
+
+    streaming = False
+    sample_rate = None
+    channels = None
+
+    def synthesize(self, text: str) -> tuple:
+        """
+        合成文本
+
+        返回:
+            tuple: (16 位 PCM 数据, 采样率, 通道数)
+        """
+        raise NotImplementedError
+
+    def synthesize_stream(self, text: str):
+        """
+        增量合成文本, 逐块返回 (16 位 PCM 数据, 采样率, 通道数)
+
+        注意:
+            默认实现一次返回整段, 支持增量输出的引擎需要重写
+        """
+        yield self.synthesize(text)
+
+
+class Pyttsx3Engine(SpeechEngine):
+    """
+    pyttsx3 合成引擎 (非线程安全)
+
+    参数:
+        rate (int): 语速
+        volume (float): 音量 (0~1)
+        voice (str): 平台语音ID, 默认使用系统默认语音
+
+    注意:
+        pyttsx3.init() 按驱动返回进程内共享的同一个引擎, 同一工作进程中的多个 pyttsx3 音色
+        共用该引擎, 因此每次合成前重新设置本音色的语速, 音量和语音
+    """
+
+    default_voice = None  # 系统默认语音ID
+
+    def __init__(self, rate=150, volume=0.9, voice=None):
+        import pyttsx3
+
+        self.engine = pyttsx3.init()
+        # 系统默认语音在第一个实例创建时记录 (此时还没有音色修改过共享引擎),
+        # 未指定语音的音色使用默认语音, 不沿用其他音色设置的语音
+        if Pyttsx3Engine.default_voice is None:
+            Pyttsx3Engine.default_voice = self.engine.getProperty("voice")
+        self.properties = {
+            "rate": rate,
+            "volume": volume,
+            "voice": voice or Pyttsx3Engine.default_voice,
+        }
+
+    def synthesize(self, text: str) -> tuple:
+        """
+        合成文本
+
+        返回:
+            tuple: (16 位 PCM 数据, 采样率, 通道数)
+        """
+        fd, tmp_path = tempfile.mkstemp(suffix=".wav", dir=SHM_DIR)
+        os.close(fd)
+
+        try:
+            for name, value in self.properties.items():
+                self.engine.setProperty(name, value)
+            self.engine.save_to_file(text, tmp_path)
+            self.engine.runAndWait()
+            with wave.open(tmp_path, "rb") as wav_file:
+                pcm_data = wav_file.readframes(wav_file.getnframes())
+                if wav_file.getsampwidth() != 2:
+                    pcm_data = to_int16(pcm_data, wav_file.getsampwidth()).tobytes()
+                return pcm_data, wav_file.getframerate(), wav_file.getnchannels()
+        finally:
+            os.unlink(tmp_path)
+
+
+class PiperEngine(SpeechEngine):
+    """
+    Piper 合成引擎 (VITS 结构的 ONNX 模型, CPU 推理)
+
+    参数:
+        model_path (str): 模型文件 (.onnx)
+        config_path (str): 模型配置文件, 默认为 model_path + ".json"
+        length_scale (float): 语速系数, 大于 1 变慢, None 时使用模型配置
+        threads (int): 每个引擎的推理线程数, 多个工作进程并行时保持为 1 避免争抢 CPU
+
+    注意:
+        模型按句推理, 每句完成后立即返回该句的音频, 句间不插入静音
+    """
+
+    streaming = True
+    channels = 1
+
+    def __init__(self, model_path, config_path=None, length_scale=None, threads=1):
+        import onnxruntime
+        from piper.config import PiperConfig
+        from piper.voice import PiperVoice
+
+        with open(config_path or f"{model_path}.json", encoding="utf-8") as f:
+            config = PiperConfig.from_dict(json.load(f))
+
+        # 自行创建推理会话以限制 onnxruntime 的线程池 (默认按 CPU 核数创建)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        session = onnxruntime.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.voice = PiperVoice(session=session, config=config)
+        self.sample_rate = self.voice.config.sample_rate
+        self.length_scale = length_scale
+
+    def synthesize_stream(self, text: str):
+        for pcm_data in self.voice.synthesize_stream_raw(
+            text, length_scale=self.length_scale, sentence_silence=0.0
+        ):
+            yield pcm_data, self.sample_rate, self.channels
+
+    def synthesize(self, text: str) -> tuple:
+        pcm_data = b"".join(chunk for chunk, _, _ in self.synthesize_stream(text))
+        return pcm_data, self.sample_rate, self.channels
+
+
+ENGINES = {
+    "pyttsx3": Pyttsx3Engine,
+    "piper": PiperEngine,
+}
+
+
+def create_engine(name: str, options: dict) -> SpeechEngine:
+    """
+    按名称创建合成引擎
+
+    参数:
+        name (str): 引擎名称, 见 ENGINES
+        options (dict): 引擎构造参数
+
+    异常:
+        ValueError: 未知的引擎名称
+    """
+    if name not in ENGINES:
+        raise ValueError(f"未知的 TTS 引擎: {name}")
+    return ENGINES[name](**options)
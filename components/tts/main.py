@@ -1,51 +1,43 @@
 import asyncio
 from contextlib import asynccontextmanager
 import os
-import tempfile
-import logging
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import pyttsx3
-from pydub import AudioSegment
-import io
+import sys
+from fastapi import FastAPI, HTTPException, Query
+from pydantic import BaseModel, Field
+import opuslib_next
 
 import redis.asyncio as redis
 
-import logging
+# 公共模块位于 components 目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_format import pack_opus_frames, pack_pcm
+
+from cache import PhraseCache, cache_key
+from coalesce import SingleFlight
+from prerender import Prerenderer, load_phrases
+from sentences import split_sentences
+from utterance import (
+    STATE_FAILED,
+    STATE_QUEUED,
+    STATE_READY,
+    STATE_SYNTHESIZING,
+    parse_utterance_id,
+    record_key,
+    remove_utterance,
+    stream_key,
+    transition,
+    utterance_id,
+)
+from workers import SynthesisPool
 
 #######################################################################
 #    配置日志
 #######################################################################
 
-# 配置日志记录
-
-logger = logging.getLogger("tts_server")
-logger.setLevel(logging.INFO)
-
-# 日志目录
-current_dir = os.getcwd()
-log_file_path = os.path.join(current_dir, "storage/logs")
-log_dir = os.path.expanduser(log_file_path)
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file_path = os.path.join(log_dir, "tts_server.log")
-
-# 创建文件处理器
-file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
-file_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
-
-# 创建控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-)
+from log import setup_logger
 
-# 添加处理器
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# 配置日志记录 (异步写入, 见 components/log.py)
+logger = setup_logger("tts_server")
 
 # 关闭日志（需要时取消注释）
 # logger.setLevel(logging.CRITICAL)
@@ -63,9 +55,55 @@ REDIS_PORT = 6379
 TTS_INPUT_QUEUE_KEY = "tts_input_queue"
 TTS_OUTPUT_QUEUE_KEY = "tts_output_queue"
 
-VOICE_ENGINE = pyttsx3.init()
-VOICE_ENGINE.setProperty("rate", 150)
-VOICE_ENGINE.setProperty("volume", 0.9)
+# 预编码 Opus 下行音频, audio_io 只需加密发送 (WAV 保留为回退)
+TTS_OPUS_ENABLED = True
+
+# 合成结果缓存 (内存 LRU + 磁盘), 相同文本和参数直接复用
+TTS_CACHE_MEMORY_BYTES = 64 * 1024 * 1024  # 内存层容量上限
+TTS_CACHE_DIR = os.path.join(os.getcwd(), "storage/tts_cache")  # 磁盘层目录
+TTS_CACHE_DISK_BYTES = 1024 * 1024 * 1024  # 磁盘层容量上限
+
+# 分句流式合成: 按句切分后依次发布到语音音频流 tts_stream:{session_id}:{seq}, audio_io 收到第一句即开始播放
+TTS_STREAMING_ENABLED = True
+TTS_STREAM_EXPIRE = 300  # 会话音频流过期时间, 防止 audio_io 未消费时残留 (单位: 秒)
+
+# 音色 (会话的 tts_role, 见 voices.py): 每个音色指定合成引擎 (见 engines.py) 和构造参数
+#   "pyttsx3" 平台语音引擎, "piper" CPU 神经网络模型 (增量输出, 首句边合成边发布)
+TTS_VOICE_RATE = 150  # 语速
+TTS_VOICE_VOLUME = 0.9  # 音量
+TTS_VOICES = {
+    "saike": {
+        "engine": "pyttsx3",
+        "options": {"rate": TTS_VOICE_RATE, "volume": TTS_VOICE_VOLUME},
+    },
+    "huayan": {
+        "engine": "piper",
+        "options": {
+            "model_path": os.path.join(os.getcwd(), "models/zh_CN-huayan-medium.onnx"),
+            "length_scale": None,
+            "threads": 1,
+        },
+    },
+}
+TTS_DEFAULT_VOICE = "saike"  # 会话音色未配置时使用的音色
+TTS_VOICE_MEMORY_BYTES = 512 * 1024 * 1024  # 每个工作进程已加载音色的内存预算, 超过时卸载最久未使用的音色
+TTS_PRELOAD_VOICES = 2  # 启动时按使用次数预加载的音色数量
+TTS_VOICE_USAGE_KEY = "tts_voice_usage"  # 音色使用次数 (有序集合)
+
+# 合成工作进程池 (每个进程持有独立的合成引擎, 按音色缓存)
+TTS_WORKERS = os.cpu_count() or 2  # 合成工作进程数量
+TTS_WORKER_QUEUE_SIZE = 32  # 等待合成的任务上限, 超过时暂停领取 TTS 输入队列
+TTS_JOB_TIMEOUT = 30  # 单个合成任务超时时间, 超时视为引擎卡死并重启工作进程 (单位: 秒)
+TTS_PING_INTERVAL = 10  # 工作进程空闲时的健康检查间隔 (单位: 秒)
+TTS_PING_TIMEOUT = 5  # 健康检查超时时间 (单位: 秒)
+
+# 固定提示语预渲染 (见 prerender.py): 启动时和配置变化时按所有启用的音色和会话音频参数写入合成结果缓存
+TTS_PRERENDER_CONFIG = os.path.join(os.getcwd(), "prerender.json")  # 短语配置文件
+TTS_PRERENDER_CHECK_INTERVAL = 30  # 检查短语配置, 启用的音色和音频参数变化的间隔 (单位: 秒)
+TTS_PRERENDER_CONCURRENCY = 2  # 预渲染同时合成的数量, 为在线请求保留工作进程
+TTS_PRERENDER_FORMATS = [(16000, 1, 60)]  # 始终预渲染的会话音频参数 (采样率, 通道数, 帧时长)
+TTS_PRERENDER_MAX_FORMATS = 4  # 预渲染的会话音频参数数量上限 (按使用次数)
+TTS_FORMAT_USAGE_KEY = "tts_format_usage"  # 会话音频参数使用次数 (有序集合, 成员为 "采样率:通道数:帧时长")
 
 #######################################################################
 #    Redis 数据库配置
@@ -73,6 +111,15 @@ VOICE_ENGINE.setProperty("volume", 0.9)
 redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
 
 
+def create_redis():
+    """创建服务使用的 Redis 连接 (压测时可替换为内存实现, 见 benchmark.py)"""
+    return redis.Redis(
+        connection_pool=redis.ConnectionPool(
+            host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=False
+        )
+    )
+
+
 #######################################################################
 #    Util 函数
 #######################################################################
@@ -92,149 +139,598 @@ def parse_tts_data(asr_data: dict) -> dict:
     return parsed
 
 
+class OpusStreamEncoder:
+    """
+    增量 Opus 编码, 不足一帧的数据保留到下一块
+
+    参数:
+        sample_rate (int): 采样率, 需与会话UDP通道一致
+        channels (int): 通道数
+        frame_duration (int): 帧时长 (单位: 毫秒)
+    """
+
+    def __init__(self, sample_rate: int, channels: int, frame_duration: int):
+        self.encoder = opuslib_next.Encoder(
+            sample_rate, channels, opuslib_next.APPLICATION_VOIP
+        )
+        self.frame_samples = int(sample_rate * frame_duration / 1000)
+        self.frame_bytes = self.frame_samples * channels * 2
+        self.buffer = b""
+
+    def encode(self, pcm_data: bytes, final: bool = False) -> list:
+        """
+        编码一块 16 位 PCM 数据
+
+        参数:
+            final (bool): 最后一块, 剩余数据补零编码为最后一帧
+
+        返回:
+            list[bytes]: 本块可以输出的 Opus 帧
+        """
+        self.buffer += pcm_data
+        if final and len(self.buffer) % self.frame_bytes:
+            self.buffer += b"\x00" * (self.frame_bytes - len(self.buffer) % self.frame_bytes)
+
+        end = len(self.buffer) - len(self.buffer) % self.frame_bytes
+        opus_frames = [
+            self.encoder.encode(self.buffer[i : i + self.frame_bytes], self.frame_samples)
+            for i in range(0, end, self.frame_bytes)
+        ]
+        self.buffer = self.buffer[end:]
+        return opus_frames
+
+
+def encode_opus_frames(
+    pcm_data: bytes, sample_rate: int, channels: int, frame_duration: int
+) -> list:
+    """
+    将 16 位 PCM 数据按会话帧时长编码为 Opus 帧
+
+    参数:
+        pcm_data (bytes): 16位有符号 PCM 数据
+        sample_rate (int): 采样率, 需与会话UDP通道一致
+        channels (int): 通道数
+        frame_duration (int): 帧时长 (单位: 毫秒)
+
+    返回:
+        list[bytes]: Opus 帧列表, 最后一帧不足时补零
+    """
+    return OpusStreamEncoder(sample_rate, channels, frame_duration).encode(
+        pcm_data, final=True
+    )
+
+
 #######################################################################
 #    TTS 异步任务
 #######################################################################
 
 
+async def render_pcm(
+    app: FastAPI, text: str, voice: str, sample_rate: int, channels: int
+) -> bytes:
+    """使用合成工作进程池合成文本, 返回会话采样率和通道数的 16 位 PCM 数据 (格式转换在工作进程中完成)"""
+    return await app.state.synthesis_pool.synthesize(
+        text, sample_rate, channels, voice=voice
+    )
+
+
+async def encode_chunk(
+    app: FastAPI,
+    key: str,
+    text: str,
+    voice: str,
+    sample_rate: int,
+    channels: int,
+    frame_duration: int,
+) -> bytes:
+    """合成一段文本, 按输出格式编码后写入缓存"""
+    pcm_data = await render_pcm(app, text, voice, sample_rate, channels)
+    if TTS_OPUS_ENABLED:
+        opus_frames = await asyncio.get_event_loop().run_in_executor(
+            None,
+            encode_opus_frames,
+            pcm_data,
+            sample_rate,
+            channels,
+            frame_duration,
+        )
+        data = pack_opus_frames(opus_frames)
+    else:
+        data = pack_pcm(pcm_data, sample_rate, channels)
+    app.state.phrase_cache.put(key, data)
+    return data
+
+
+def chunk_key(
+    text: str, voice: str, sample_rate: int, channels: int, frame_duration: int
+) -> str:
+    """按会话参数和音色的引擎生成合成结果的缓存键"""
+    audio_format = f"opus{frame_duration}" if TTS_OPUS_ENABLED else "pcm"
+    return cache_key(
+        text,
+        voice,
+        TTS_VOICE_RATE,
+        sample_rate,
+        channels,
+        audio_format,
+        engine=TTS_VOICES[voice]["engine"],
+    )
+
+
+async def render_chunk(
+    app: FastAPI,
+    text: str,
+    voice: str,
+    sample_rate: int,
+    channels: int,
+    frame_duration: int,
+) -> dict:
+    """
+    合成一段文本并按会话参数编码
+
+    返回:
+        dict: {"opus": 预编码 Opus 帧} (TTS_OPUS_ENABLED) 或 {"audio": PCM 记录}
+
+    注意:
+        - 缓存命中时跳过合成
+        - 相同缓存键的合成正在进行时, 等待该合成的结果, 不重复合成 (如广播, 固定提示语)
+    """
+    key = chunk_key(text, voice, sample_rate, channels, frame_duration)
+    data = app.state.phrase_cache.get(key)
+    if data is None:
+        data = await app.state.single_flight.run(
+            key,
+            lambda: encode_chunk(
+                app, key, text, voice, sample_rate, channels, frame_duration
+            ),
+        )
+
+    return {"opus": data} if TTS_OPUS_ENABLED else {"audio": data}
+
+
+async def stream_chunk(
+    app: FastAPI,
+    text: str,
+    voice: str,
+    sample_rate: int,
+    channels: int,
+    frame_duration: int,
+):
+    """
+    增量合成一段文本, 引擎每输出一块音频即编码返回
+
+    返回:
+        异步迭代 dict: 与 render_chunk 相同, 每块一个
+
+    注意:
+        - 缓存命中, 引擎不支持增量输出, 或相同文本正在合成时, 退化为 render_chunk (只返回一块)
+        - 增量合成同样登记在 single_flight 中, 相同文本的后续请求等待完整结果, 不重复合成
+        - 合成完成后完整结果写入缓存
+    """
+    key = chunk_key(text, voice, sample_rate, channels, frame_duration)
+    data = app.state.phrase_cache.get(key)
+    if data is None and (
+        not app.state.synthesis_pool.streaming(voice)
+        or key in app.state.single_flight.inflight
+    ):
+        data = await app.state.single_flight.run(
+            key,
+            lambda: encode_chunk(
+                app, key, text, voice, sample_rate, channels, frame_duration
+            ),
+        )
+    if data is not None:
+        yield {"opus": data} if TTS_OPUS_ENABLED else {"audio": data}
+        return
+
+    chunks = asyncio.Queue()
+    task = app.state.single_flight.start(
+        key,
+        lambda: encode_stream_chunk(
+            app, key, text, voice, sample_rate, channels, frame_duration, chunks
+        ),
+    )
+    while (chunk := await chunks.get()) is not None:
+        yield chunk
+    # 合成失败时抛出异常
+    await asyncio.shield(task)
+
+
+async def encode_stream_chunk(
+    app: FastAPI,
+    key: str,
+    text: str,
+    voice: str,
+    sample_rate: int,
+    channels: int,
+    frame_duration: int,
+    chunks: asyncio.Queue,
+) -> bytes:
+    """
+    增量合成一段文本, 每块编码后放入 chunks (结束时放入 None), 完整结果写入缓存
+
+    注意:
+        在 single_flight 任务中运行, 发起方被取消时合成继续, 结果仍写入缓存
+    """
+    loop = asyncio.get_event_loop()
+    encoder = OpusStreamEncoder(sample_rate, channels, frame_duration)
+    opus_frames = []
+    pcm_chunks = []
+
+    try:
+        async for pcm_data in app.state.synthesis_pool.synthesize_stream(
+            text, sample_rate, channels, voice=voice
+        ):
+            if TTS_OPUS_ENABLED:
+                frames = await loop.run_in_executor(None, encoder.encode, pcm_data)
+                opus_frames.extend(frames)
+                if frames:
+                    chunks.put_nowait({"opus": pack_opus_frames(frames)})
+            else:
+                pcm_chunks.append(pcm_data)
+                chunks.put_nowait({"audio": pack_pcm(pcm_data, sample_rate, channels)})
+
+        if TTS_OPUS_ENABLED:
+            frames = encoder.encode(b"", final=True)
+            opus_frames.extend(frames)
+            if frames:
+                chunks.put_nowait({"opus": pack_opus_frames(frames)})
+            data = pack_opus_frames(opus_frames)
+        else:
+            data = pack_pcm(b"".join(pcm_chunks), sample_rate, channels)
+    finally:
+        chunks.put_nowait(None)
+
+    app.state.phrase_cache.put(key, data)
+    return data
+
+
+async def stream_tts_task(
+    app: FastAPI,
+    session_id: str,
+    seq: int,
+    text: str,
+    voice: str,
+    sample_rate: int,
+    channels: int,
+    frame_duration: int,
+):
+    """
+    分句流式合成
+
+    参数:
+        app: FastAPI 应用实例
+        session_id: 会话唯一ID
+        seq: 语音序号
+        text: 待合成文本
+        voice: 音色 (已解析的音色名称, 见 SynthesisPool.resolve)
+        sample_rate, channels, frame_duration: 会话音频参数
+
+    处理流程:
+        1. 按句切分文本
+        2. 在语音记录中写入音频流的键, 立即推送到输出队列, audio_io 轮到该语音时即可开始播放
+        3. 所有分句同时提交合成 (缓存命中的分句直接返回), 按顺序等待结果, 每句完成后立即发布到音频流
+            - 引擎支持增量输出时, 第一句边合成边发布 (见 stream_chunk), 不等整句合成完成
+        4. 发布结束标记
+
+    音频流消息格式:
+        index : 分句序号
+        chunk : 分句内的块序号 (增量输出的分句有多块, 其余分句只有一块)
+        text  : 分句文本 (对应设备协议的 sentence_start / sentence_end)
+        opus  : 预编码 Opus 帧 (TTS_OPUS_ENABLED), 否则为 audio: PCM 记录
+        end   : 结束标记, "ok" 或 "error" (仅最后一条消息)
+    """
+    redis_conn = app.state.redis
+    audio_stream = stream_key(session_id, seq)
+    sentences = split_sentences(text)
+
+    await redis_conn.delete(audio_stream)
+    await redis_conn.hset(
+        record_key(session_id, seq),
+        mapping={
+            "stream": audio_stream,
+            "opus_sample_rate": sample_rate,
+            "opus_channels": channels,
+            "opus_frame_duration": frame_duration,
+        },
+    )
+    await redis_conn.lpush(TTS_OUTPUT_QUEUE_KEY, utterance_id(session_id, seq))
+
+    # 后续分句的任务在首句开始合成后才运行, 首句先进入合成队列
+    renders = [
+        asyncio.create_task(
+            render_chunk(app, sentence, voice, sample_rate, channels, frame_duration)
+        )
+        for sentence in sentences[1:]
+    ]
+
+    try:
+        for sentence in sentences[:1]:
+            chunk = 0
+            async for data in stream_chunk(
+                app, sentence, voice, sample_rate, channels, frame_duration
+            ):
+                entry = {"index": 0, "chunk": chunk, "text": sentence, **data}
+                await redis_conn.xadd(audio_stream, entry)
+                await redis_conn.expire(audio_stream, TTS_STREAM_EXPIRE)
+                chunk += 1
+            logger.info("TTS 分句已发布: %s:%s [1/%d]", session_id, seq, len(sentences))
+
+        for index, (sentence, render) in enumerate(zip(sentences[1:], renders), 1):
+            entry = {"index": index, "chunk": 0, "text": sentence, **(await render)}
+            await redis_conn.xadd(audio_stream, entry)
+            await redis_conn.expire(audio_stream, TTS_STREAM_EXPIRE)
+            logger.info(
+                "TTS 分句已发布: %s:%s [%d/%d]", session_id, seq, index + 1, len(sentences)
+            )
+
+    except Exception as e:
+        for render in renders:
+            render.cancel()
+        await asyncio.gather(*renders, return_exceptions=True)
+        await redis_conn.xadd(audio_stream, {"end": "error", "error": str(e)})
+        await redis_conn.expire(audio_stream, TTS_STREAM_EXPIRE)
+        raise
+
+    await redis_conn.xadd(audio_stream, {"end": "ok"})
+    await redis_conn.expire(audio_stream, TTS_STREAM_EXPIRE)
+
+
 # 异步任务处理函数 将文本转为语音
-async def process_tts_task(app: FastAPI, session_id: str):
+async def process_tts_task(app: FastAPI, session_id: str, seq: int):
     """
     处理文本转语音任务
 
     参数:
         app: FastAPI 应用实例, 用于获取Redis连接
         session_id: 会话唯一ID, 用于关联配置和生成结果
+        seq: 语音序号 (会话语音队列, 见 components/utterance.py)
 
     处理流程:
-        1. 从Redis 获取会陪配置和TTS数据
-        2. 检查数据有效性 (状态, 文本)
-        3. 创建临时文本文件保存生成的语音
-        4. 调用TTS引擎进行语音合成
-        5. 调整音频格式并更新结果到Redis
-        6. 推送任务完成通知
-        7. 清理临时资源
+        1. 从Redis 获取会陪配置和语音记录
+        2. 检查数据有效性 (状态, 文本), 状态改为 synthesizing
+        3. 提交到合成工作进程池进行语音合成
+        4. 按会话参数编码 (预编码 Opus 帧, 或原始PCM记录) 并更新结果到Redis, 状态改为 ready
+        5. 推送任务完成通知
+
+    注意:
+        - 合成结果按 (文本, 音色, 语速, 音频参数, 输出格式, 引擎) 缓存在内存和磁盘中 (见 cache.py), 命中时跳过合成
+        - 开启 TTS_STREAMING_ENABLED 时改为分句流式合成, 见 stream_tts_task
+        - 只处理 queued 状态的语音, 重复投递的任务直接忽略
+        - 失败时状态改为 failed 并通知 audio_io, 跳过该语音继续播放后续语音
     """
-    logger.info("开始处理 TTS 任务, session_id: %s", session_id)
+    logger.info("开始处理 TTS 任务, 语音: %s:%s", session_id, seq)
+    redis_conn = app.state.redis
 
     try:
-        redis_conn = app.state.redis
-
         # 获取会话配置
         session_data = await redis_conn.hgetall(f"session:{session_id}")
 
-        # 获取 TTS 条目数据
-        tts_data = await redis_conn.hgetall(f"tts:{session_id}")
+        # 获取语音记录
+        tts_data = await redis_conn.hgetall(record_key(session_id, seq))
 
         if not tts_data or not session_data:
-            logger.error("TTS 条目数据或会话数据不存在, session_id: %s", session_id)
+            logger.error("语音记录或会话数据不存在: %s:%s", session_id, seq)
+            await remove_utterance(redis_conn, session_id, seq)
             return
 
         # 状态检查
-        if tts_data.get(b"status") == b"True":
-            audio_bytes = tts_data.get(b"audio")
-            if not audio_bytes:
-                logger.error(
-                    "状态为True但audio为空, 删除无效数据: %s 数据: %s",
-                    session_id,
-                    parse_tts_data,
-                )
-                await redis_conn.delete(f"tts:{session_id}")
-                return
-
-            logger.info("TTS 状态已为 True, 直接推送到输出队列 %s", session_id)
-            await redis_conn.lpush(TTS_OUTPUT_QUEUE_KEY, session_id)
+        if not await transition(
+            redis_conn, session_id, seq, (STATE_QUEUED,), STATE_SYNTHESIZING
+        ):
+            logger.info(
+                "语音状态不是 queued, 忽略: %s:%s, 状态: %s",
+                session_id,
+                seq,
+                tts_data.get(b"state", b"").decode(),
+            )
+            return
 
         # 获取待合成文本
         text = tts_data.get(b"text", b"").decode()
         if not text:
-            logger.error(
-                "TTS 文本数据为空, 无法进行语音合成, 删除无效数据: %s, 完整数据 : %s",
-                session_id,
-                parse_tts_data(tts_data),
-            )
-            await redis_conn.delete(f"tts:{session_id}")
+            raise ValueError(f"TTS 文本数据为空, 完整数据 : {parse_tts_data(tts_data)}")
 
         # 获取音频配置参数
         sample_rate = int(session_data.get(b"audio_sample", b"16000").decode())
         channels = int(session_data.get(b"audio_channel", b"1").decode())
+        frame_duration = int(session_data.get(b"frame_duration", b"60").decode())
+        tts_role = session_data.get(b"tts_role", b"").decode()
+        voice = app.state.synthesis_pool.resolve(tts_role)
+        await redis_conn.zincrby(TTS_VOICE_USAGE_KEY, 1, voice)
+        await redis_conn.zincrby(
+            TTS_FORMAT_USAGE_KEY, 1, f"{sample_rate}:{channels}:{frame_duration}"
+        )
+
+        # 分句流式合成
+        if TTS_STREAMING_ENABLED:
+            await stream_tts_task(
+                app, session_id, seq, text, voice, sample_rate, channels, frame_duration
+            )
+            # audio_io 可能已开始播放 (playing), 此时不修改状态
+            await transition(
+                redis_conn, session_id, seq, (STATE_SYNTHESIZING,), STATE_READY
+            )
+            logger.info(f"TTS 任务完成: {session_id}:{seq}")
+            return
 
-        # 执行 TTS 转换 (再异步线程中运行同步的 pyttsx3)
-        loop = asyncio.get_event_loop()
+        # 整段合成
+        tts_mapping = await render_chunk(
+            app, text, voice, sample_rate, channels, frame_duration
+        )
+        tts_mapping.update(
+            {
+                "opus_sample_rate": sample_rate,
+                "opus_channels": channels,
+                "opus_frame_duration": frame_duration,
+            }
+        )
 
-        global VOICE_ENGINE
-        engine = VOICE_ENGINE
-        # engine = pyttsx3.init()
+        # 更新Redis中的音频数据
+        await redis_conn.hset(record_key(session_id, seq), mapping=tts_mapping)
+        await transition(redis_conn, session_id, seq, (STATE_SYNTHESIZING,), STATE_READY)
 
-        # # 配置语音参数
-        # engine.setProperty("rate", 150)  # 语速
-        # engine.setProperty("volume", 0.9)  # 音量
+        # 将完成的任务推送到输出队列
+        await redis_conn.lpush(TTS_OUTPUT_QUEUE_KEY, utterance_id(session_id, seq))
+        logger.info(f"TTS 任务完成: {session_id}:{seq}")
 
-        # 创建临时文件
-        tmp_path = None
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-            tmp_path = temp_file.name
-            temp_file.close()  # 关闭文件， 方便其他进程访问
+    except Exception as e:
+        logger.error("TTS 任务失败: %s:%s - %s", session_id, seq, str(e), exc_info=True)
+        await transition(
+            redis_conn,
+            session_id,
+            seq,
+            (STATE_QUEUED, STATE_SYNTHESIZING, STATE_READY),
+            STATE_FAILED,
+        )
+        await redis_conn.lpush(TTS_OUTPUT_QUEUE_KEY, utterance_id(session_id, seq))
 
-        # 异步执行TTS合成
-        await loop.run_in_executor(None, lambda: engine.save_to_file(text, tmp_path))
-        await loop.run_in_executor(None, engine.runAndWait)
 
-        # 读取生成的音频文件
-        audio = AudioSegment.from_wav(tmp_path)
-        # 调整音频格式参数
-        audio = audio.set_frame_rate(sample_rate).set_channels(channels)
+async def prerender_phrase(
+    app: FastAPI,
+    text: str,
+    voice: str,
+    sample_rate: int,
+    channels: int,
+    frame_duration: int,
+) -> bool:
+    """
+    预渲染一条短语, 写入合成结果缓存
 
-        # 转换为字节流
-        wav_buffer = io.BytesIO()
-        audio.export(wav_buffer, format="wav")
-        wav_data = wav_buffer.getvalue()
+    返回:
+        bool: 有片段需要合成时返回 True, 全部已在缓存中时返回 False
 
-        # 更新Redis中的音频数据
-        await redis_conn.hset(
-            f"tts:{session_id}",
-            mapping={"audio": wav_data, "status": "True"},
+    注意:
+        按播放时的方式切分 (分句流式合成时按句缓存), 缓存键与播放时相同
+    """
+    chunks = split_sentences(text) if TTS_STREAMING_ENABLED else [text]
+    rendered = False
+    for chunk in chunks:
+        key = chunk_key(chunk, voice, sample_rate, channels, frame_duration)
+        if app.state.phrase_cache.contains(key):
+            continue
+        await app.state.single_flight.run(
+            key,
+            lambda: encode_chunk(
+                app, key, chunk, voice, sample_rate, channels, frame_duration
+            ),
         )
+        rendered = True
+    return rendered
 
-        # 将完成的任务推送到输出队列
-        await redis_conn.lpush(TTS_OUTPUT_QUEUE_KEY, session_id)
-        logger.info(f"生成完成， 将session_id推送到 TTS 输出队列")
 
-        # 清理临时文件
-        os.unlink(tmp_path)
+#######################################################################
+#    fastapi 接口
+#######################################################################
+
 
-        logger.info(f"TTS 任务完成: {session_id}")
+async def popular_voices(app: FastAPI, limit: int = TTS_PRELOAD_VOICES) -> list:
+    """
+    按使用次数从高到低返回需要预加载的音色 (最多 limit 个)
 
+    注意:
+        没有使用记录或 Redis 不可用时只返回默认音色
+    """
+    try:
+        voices = [
+            voice.decode()
+            for voice in await app.state.redis.zrevrange(TTS_VOICE_USAGE_KEY, 0, -1)
+        ]
     except Exception as e:
-        logger.error("TTS 任务失败: %s - %s", session_id, str(e), exc_info=True)
-        await redis_conn.delete(f"tts:{session_id}")
+        logger.warning("读取音色使用次数失败, 只预加载默认音色: %s", e)
+        voices = []
 
-    finally:
-        # 清理临时文件
-        if tmp_path:
-            os.unlink(tmp_path)
+    voices = [voice for voice in voices if voice in TTS_VOICES][:limit]
+    return voices or [TTS_DEFAULT_VOICE]
 
 
-#######################################################################
-#    fastapi 接口
-#######################################################################
+async def active_formats(app: FastAPI) -> list:
+    """
+    返回需要预渲染的会话音频参数: TTS_PRERENDER_FORMATS 和使用次数最多的参数
+
+    返回:
+        list[tuple]: [(采样率, 通道数, 帧时长)]
+    """
+    formats = list(TTS_PRERENDER_FORMATS)
+    try:
+        for member in await app.state.redis.zrevrange(TTS_FORMAT_USAGE_KEY, 0, -1):
+            audio_format = tuple(int(value) for value in member.decode().split(":"))
+            if audio_format not in formats:
+                formats.append(audio_format)
+    except Exception as e:
+        logger.warning("读取会话音频参数使用次数失败: %s", e)
+    return formats[:TTS_PRERENDER_MAX_FORMATS]
+
+
+async def prerender_watcher(app: FastAPI):
+    """
+    后台检查预渲染配置
+
+    注意:
+        启动时, 短语配置文件修改后, 或启用的音色和音频参数变化时提交预渲染任务,
+        已在缓存中的短语直接跳过, 只合成新增的组合
+    """
+    signature = None
+    while True:
+        try:
+            mtime = (
+                os.path.getmtime(TTS_PRERENDER_CONFIG)
+                if os.path.exists(TTS_PRERENDER_CONFIG)
+                else None
+            )
+            voices = await popular_voices(app, limit=len(TTS_VOICES))
+            formats = await active_formats(app)
+
+            if (mtime, voices, formats) != signature:
+                signature = (mtime, voices, formats)
+                phrases = load_phrases(TTS_PRERENDER_CONFIG)
+                if phrases:
+                    job_id = app.state.prerenderer.submit(
+                        phrases, voices, formats, source="config"
+                    )
+                    logger.info(
+                        "提交预渲染任务: %s, 短语: %d, 音色: %s, 音频参数: %s",
+                        job_id,
+                        len(phrases),
+                        voices,
+                        formats,
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("预渲染配置检查失败: %s", e)
+
+        await asyncio.sleep(TTS_PRERENDER_CHECK_INTERVAL)
 
 
 # 新增 Redis 监听任务
 async def redis_listener(app: FastAPI):
-    """后台监听 Reids 任务队列"""
+    """
+    后台监听 Reids 任务队列
+
+    注意:
+        同时处理的任务数不超过工作进程数与等待队列长度之和,
+        工作进程池繁忙时暂停领取, 任务留在 Redis 输入队列中
+    """
+    slots = asyncio.Semaphore(TTS_WORKERS + TTS_WORKER_QUEUE_SIZE)
+
     while True:
+        await slots.acquire()
         try:
             result = await app.state.redis.brpop(TTS_INPUT_QUEUE_KEY)
             if result:
-                _, session_id = result
-                str_session_id = session_id.decode()
+                _, value = result
+                session_id, seq = parse_utterance_id(value)
                 logger.info(
-                    f"监听 TTS 输入队列 , 收到新的 TTS 任务, session_id: {str_session_id}"
+                    f"监听 TTS 输入队列 , 收到新的 TTS 任务, 语音: {session_id}:{seq}"
                 )
-                asyncio.create_task(process_tts_task(app, str_session_id))
+                task = asyncio.create_task(process_tts_task(app, session_id, seq))
+                task.add_done_callback(lambda _: slots.release())
+            else:
+                slots.release()
 
         except Exception as e:
+            slots.release()
             logger.error(f"Redis listener error: {str(e)}")
             await asyncio.sleep(1)
 
@@ -243,10 +739,37 @@ async def redis_listener(app: FastAPI):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 初始化 Redis 连接
-    app.state.redis = redis.Redis(
-        connection_pool=redis.ConnectionPool(
-            host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=False
-        )
+    app.state.redis = create_redis()
+
+    # 合成结果缓存
+    app.state.phrase_cache = PhraseCache(
+        memory_bytes=TTS_CACHE_MEMORY_BYTES,
+        cache_dir=TTS_CACHE_DIR,
+        disk_bytes=TTS_CACHE_DISK_BYTES,
+    )
+    app.state.single_flight = SingleFlight()
+    app.state.prerenderer = Prerenderer(
+        lambda *args: prerender_phrase(app, *args), TTS_PRERENDER_CONCURRENCY
+    )
+
+    # 启动合成工作进程池
+    app.state.synthesis_pool = SynthesisPool(
+        workers=TTS_WORKERS,
+        queue_size=TTS_WORKER_QUEUE_SIZE,
+        job_timeout=TTS_JOB_TIMEOUT,
+        ping_interval=TTS_PING_INTERVAL,
+        ping_timeout=TTS_PING_TIMEOUT,
+        voices=TTS_VOICES,
+        default_voice=TTS_DEFAULT_VOICE,
+        memory_bytes=TTS_VOICE_MEMORY_BYTES,
+    )
+    preload = await popular_voices(app)
+    await asyncio.get_running_loop().run_in_executor(
+        None, app.state.synthesis_pool.start, preload
+    )
+    app.state.synthesis_pool.run()
+    logger.info(
+        "TTS 合成工作进程池已启动, 工作进程数: %s, 预加载音色: %s", TTS_WORKERS, preload
     )
 
     try:
@@ -255,6 +778,7 @@ async def lifespan(app: FastAPI):
 
         # 创建后台任务
         app.state.redis_listener = asyncio.create_task(redis_listener(app))
+        app.state.prerender_watcher = asyncio.create_task(prerender_watcher(app))
 
     except Exception as e:
         logger.error("无法连接到 Redis 服务器: %s", e)
@@ -271,6 +795,12 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error("Redis listener 异常终止: %s", e)
 
+    app.state.prerender_watcher.cancel()
+    await asyncio.gather(app.state.prerender_watcher, return_exceptions=True)
+    await app.state.prerenderer.shutdown()
+    await app.state.synthesis_pool.shutdown()
+    await asyncio.get_running_loop().run_in_executor(None, app.state.phrase_cache.close)
+
 
 # 初始化APP
 app = FastAPI(lifespan=lifespan)
@@ -281,6 +811,70 @@ async def create_tts_item(session_id: str, text: str):
     pass
 
 
+class PrerenderBase(BaseModel):
+    phrases: list[str] = Field(..., description="待预渲染的短语")
+    voices: list[str] | None = Field(None, description="音色, 为空时使用所有启用的音色")
+    formats: list[tuple[int, int, int]] | None = Field(
+        None, description="会话音频参数 (采样率, 通道数, 帧时长), 为空时使用所有启用的参数"
+    )
+
+
+@app.post("/prerender")
+async def create_prerender_job(prerender_base: PrerenderBase):
+    """
+    提交批量预渲染任务, 立即返回任务ID, 合成在后台进行
+
+    返回:
+        dict: 任务状态, 可通过 GET /prerender?job_id= 查询进度
+    """
+    try:
+        phrases = list(dict.fromkeys(p.strip() for p in prerender_base.phrases if p.strip()))
+        if not phrases:
+            raise ValueError("短语为空")
+
+        voices = prerender_base.voices or await popular_voices(app, limit=len(TTS_VOICES))
+        unknown = [voice for voice in voices if voice not in TTS_VOICES]
+        if unknown:
+            raise ValueError(f"未配置的音色: {unknown}")
+
+        formats = prerender_base.formats or await active_formats(app)
+        job_id = app.state.prerenderer.submit(
+            phrases, list(dict.fromkeys(voices)), list(dict.fromkeys(formats)), source="api"
+        )
+        return app.state.prerenderer.status(job_id)
+
+    except ValueError as e:
+        logger.warning(f"无效的预渲染请求: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        logger.error(f"提交预渲染任务失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/prerender")
+async def get_prerender_job(job_id: str = Query(..., description="预渲染任务ID")):
+    """查询预渲染任务进度"""
+    job = app.state.prerenderer.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="预渲染任务不存在")
+    return job
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """合成工作进程池, 合成结果缓存, 请求合并和预渲染统计信息"""
+    try:
+        return {
+            "synthesis_pool": app.state.synthesis_pool.stats(),
+            "phrase_cache": app.state.phrase_cache.stats(),
+            "single_flight": app.state.single_flight.stats(),
+            "prerender": app.state.prerenderer.stats(),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 if __name__ == "__main__":
     import uvicorn
 
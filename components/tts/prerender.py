@@ -0,0 +1,161 @@
+"""
+固定提示语预渲染
+
+
+模块功能
+1. 预渲染任务: 一组短语按 (音色, 采样率, 通道数, 帧时长) 的所有组合合成并写入合成结果缓存,
+   会话播放这些短语时直接命中缓存, 不需要等待合成
+2. 后台执行: 任务提交后立即返回任务ID, 合成在后台按并发上限进行, 不占满合成工作进程, 不影响在线请求
+3. 任务状态: 记录每个任务的进度 (完成, 跳过, 失败数量), 只保留最近的任务
+4. 短语配置文件 (JSON): 读取失败时返回空列表, 格式:
+    {"phrases": ["请使用以下激活码激活设备", ...]} 或 ["...", ...]
+
+示例:
+    >>> prerenderer = Prerenderer(render, concurrency=2)
+    >>> job_id = prerenderer.submit(["你好"], ["saike"], [(16000, 1, 60)], source="api")
+    >>> prerenderer.status(job_id)
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger("tts_server.prerender")
+
+# 保留的任务状态数量, 超过时删除最早的已结束任务
+PRERENDER_JOB_HISTORY = 100
+
+
+def load_phrases(path: str) -> list:
+    """
+    读取短语配置文件
+
+    返回:
+        list[str]: 去重后的短语 (保持顺序), 文件不存在或格式错误时返回空列表
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.error("预渲染短语配置读取失败: %s - %s", path, e)
+        return []
+
+    phrases = config.get("phrases", []) if isinstance(config, dict) else config
+    return list(dict.fromkeys(p.strip() for p in phrases if isinstance(p, str) and p.strip()))
+
+
+class Prerenderer:
+    """
+    预渲染任务执行器
+
+    参数:
+        render (callable): 异步函数 render(text, voice, sample_rate, channels, frame_duration) -> bool,
+            合成一条短语并写入缓存, 已在缓存中时返回 False (跳过)
+        concurrency (int): 所有任务合计同时合成的数量上限
+    """
+
+    def __init__(self, render, concurrency: int):
+        self.render = render
+        self.slots = asyncio.Semaphore(concurrency)
+        self.jobs = OrderedDict()  # {任务ID: 任务状态}
+        self.tasks = {}  # {任务ID: asyncio.Task}
+
+    def submit(self, phrases: list, voices: list, formats: list, source: str) -> str:
+        """
+        提交预渲染任务
+
+        参数:
+            phrases (list[str]): 短语
+            voices (list[str]): 音色
+            formats (list[tuple]): 会话音频参数 [(采样率, 通道数, 帧时长)]
+            source (str): 任务来源, 如 "config", "api"
+
+        返回:
+            str: 任务ID
+        """
+        job_id = uuid.uuid4().hex[:12]
+        self.jobs[job_id] = {
+            "job_id": job_id,
+            "source": source,
+            "state": "running",
+            "total": len(phrases) * len(voices) * len(formats),
+            "rendered": 0,
+            "skipped": 0,
+            "failed": 0,
+            "created": time.time(),
+            "finished": None,
+        }
+        self.tasks[job_id] = asyncio.create_task(
+            self.run(job_id, phrases, voices, formats)
+        )
+        self.trim()
+        return job_id
+
+    async def run(self, job_id: str, phrases: list, voices: list, formats: list):
+        """执行预渲染任务, 所有组合同时提交, 按并发上限合成"""
+        job = self.jobs[job_id]
+
+        async def render_one(text, voice, sample_rate, channels, frame_duration):
+            async with self.slots:
+                try:
+                    rendered = await self.render(
+                        text, voice, sample_rate, channels, frame_duration
+                    )
+                    job["rendered" if rendered else "skipped"] += 1
+                except Exception as e:
+                    job["failed"] += 1
+                    logger.error("预渲染失败: %s (%s, %s) - %s", text, voice, sample_rate, e)
+
+        try:
+            await asyncio.gather(
+                *(
+                    render_one(text, voice, *audio_format)
+                    for voice in voices
+                    for audio_format in formats
+                    for text in phrases
+                )
+            )
+            job["state"] = "done"
+        except asyncio.CancelledError:
+            job["state"] = "cancelled"
+            raise
+        finally:
+            job["finished"] = time.time()
+            self.tasks.pop(job_id, None)
+            logger.info(
+                "预渲染任务结束: %s, 来源: %s, 合成: %d, 跳过: %d, 失败: %d",
+                job_id,
+                job["source"],
+                job["rendered"],
+                job["skipped"],
+                job["failed"],
+            )
+
+    def trim(self):
+        """删除超出保留数量的已结束任务"""
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= PRERENDER_JOB_HISTORY:
+                break
+            if job_id not in self.tasks:
+                del self.jobs[job_id]
+
+    def status(self, job_id: str) -> dict | None:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self.tasks),
+            "jobs": list(self.jobs.values())[-10:],
+        }
+
+    async def shutdown(self):
+        """取消正在执行的任务"""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,95 @@
+"""
+TTS 文本分句
+
+
+模块功能
+1. 在句末标点 (。！？；… 换行, 以及后跟空白的英文句点) 处切分文本
+2. 超过最大长度的句子在分句标点 (，、：) 处继续切分, 仍然过长时按最大长度直接切分
+3. 只包含标点或空白的片段并入前一句, 不单独合成
+
+示例:
+    >>> split_sentences("好的，既然你没说话，那我先退下了哈。晚安哦～")
+    ['好的，既然你没说话，那我先退下了哈。', '晚安哦～']
+"""
+
+SENTENCE_PUNCT = "。！？!?；;…\n"
+CLAUSE_PUNCT = "，,、：:"
+TRAILING_PUNCT = "。！？!?；;…，,、：:”’\"')）》」』～~ \t\r\n"
+
+SENTENCE_MAX_CHARS = 40  # 单句最大长度, 超过时在分句标点处继续切分
+SENTENCE_MIN_CHARS = 2  # 短于该长度 (不含标点) 的片段并入前一句
+
+
+def split_at(text: str, punct: str) -> list:
+    """在指定标点处切分, 标点及其后的引号, 括号等保留在前一段末尾"""
+    pieces = []
+    start = 0
+    i = 0
+    while i < len(text):
+        char = text[i]
+        is_break = char in punct or (
+            char == "." and (i + 1 == len(text) or text[i + 1].isspace())
+        )
+        if is_break:
+            i += 1
+            while i < len(text) and text[i] in TRAILING_PUNCT:
+                i += 1
+            pieces.append(text[start:i])
+            start = i
+            continue
+        i += 1
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def pack_clauses(clauses: list, max_chars: int) -> list:
+    """把分句合并为不超过最大长度的片段, 单个分句过长时直接切分"""
+    pieces = []
+    current = ""
+    for clause in clauses:
+        while len(clause) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(clause[:max_chars])
+            clause = clause[max_chars:]
+        if current and len(current) + len(clause) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += clause
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def content_length(text: str) -> int:
+    """不含标点和空白的字符数"""
+    return sum(1 for char in text if char not in TRAILING_PUNCT)
+
+
+def split_sentences(text: str, max_chars: int = SENTENCE_MAX_CHARS) -> list:
+    """
+    将待合成文本切分为按顺序合成的片段
+
+    参数:
+        text (str): 待合成文本
+        max_chars (int): 单个片段最大长度
+
+    返回:
+        list[str]: 片段列表, 拼接后与原文一致 (首尾空白除外)
+    """
+    pieces = []
+    for sentence in split_at(text.strip(), SENTENCE_PUNCT):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+        else:
+            pieces.extend(pack_clauses(split_at(sentence, CLAUSE_PUNCT), max_chars))
+
+    merged = []
+    for piece in pieces:
+        if merged and content_length(piece) < SENTENCE_MIN_CHARS:
+            merged[-1] += piece
+        else:
+            merged.append(piece)
+    return [piece for piece in merged if piece.strip()]
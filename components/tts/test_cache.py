@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+from cache import PhraseCache, cache_key, normalize_text
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_normalized_text_shares_key(self):
+        self.assertEqual(normalize_text("  好的，\n 收到  "), "好的, 收到")
+        self.assertEqual(
+            cache_key("好的！", "saike", 150, 16000, 1, "opus60"),
+            cache_key(" 好的! ", "saike", 150, 16000, 1, "opus60"),
+        )
+
+    def test_params_change_key(self):
+        base = cache_key("好的", "saike", 150, 16000, 1, "opus60")
+        self.assertNotEqual(base, cache_key("好的", "other", 150, 16000, 1, "opus60"))
+        self.assertNotEqual(base, cache_key("好的", "saike", 150, 24000, 1, "opus60"))
+        self.assertNotEqual(base, cache_key("好的", "saike", 150, 16000, 1, "pcm"))
+        self.assertNotEqual(
+            base, cache_key("好的", "saike", 150, 16000, 1, "opus60", engine="piper")
+        )
+
+
+class TestPhraseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_memory_lru_budget(self):
+        cache = PhraseCache(memory_bytes=250)
+        cache.put("a", b"a" * 100)
+        cache.put("b", b"b" * 100)
+        cache.get("a")
+        cache.put("c", b"c" * 100)
+
+        # b 最久未使用, 被淘汰
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"a" * 100)
+        self.assertEqual(cache.memory_used, 200)
+        self.assertEqual(cache.stats()["memory_evictions"], 1)
+
+    def test_contains_skips_stats(self):
+        cache = PhraseCache(memory_bytes=0, cache_dir=self.tmp_dir.name, disk_bytes=4096)
+        cache.put("k", b"x" * 10)
+
+        self.assertTrue(cache.contains("k"))
+        self.assertFalse(cache.contains("other"))
+        self.assertEqual(cache.stats()["misses"], 0)
+
+        # 写入磁盘后不再依赖待写入条目
+        cache.flush()
+        self.assertEqual(cache.stats()["disk_pending"], 0)
+        self.assertTrue(cache.contains("k"))
+
+    def test_disk_tier_survives_restart(self):
+        cache = PhraseCache(memory_bytes=1024, cache_dir=self.tmp_dir.name, disk_bytes=4096)
+        cache.put("k1", b"x" * 100)
+        cache.put("k2", b"x" * 100)
+        cache.close()
+
+        # 内容相同的条目共用一个数据文件
+        self.assertEqual(cache.disk_used, 100)
+
+        reopened = PhraseCache(memory_bytes=1024, cache_dir=self.tmp_dir.name, disk_bytes=4096)
+        self.assertEqual(reopened.disk_used, 100)
+        self.assertEqual(reopened.get("k1"), b"x" * 100)
+        self.assertEqual(reopened.get("k1"), b"x" * 100)
+        self.assertIsNone(reopened.get("missing"))
+
+        stats = reopened.stats()
+        self.assertEqual((stats["disk_hits"], stats["memory_hits"], stats["misses"]), (1, 1, 1))
+
+    def test_disk_prune(self):
+        cache = PhraseCache(memory_bytes=0, cache_dir=self.tmp_dir.name, disk_bytes=250)
+        for i in range(3):
+            cache.put(f"k{i}", bytes([i]) * 100)
+            cache.flush()
+            # 保证访问时间有先后
+            path = cache.object_path(open(cache.key_path(f"k{i}")).read())
+            os.utime(path, (i, i))
+
+        self.assertLessEqual(cache.disk_used, 250)
+        self.assertIsNone(cache.get("k0"))
+        self.assertEqual(cache.get("k2"), b"\x02" * 100)
+        self.assertFalse(os.path.exists(cache.key_path("k0")))
+
+
+if __name__ == "__main__":
+    unittest.main()
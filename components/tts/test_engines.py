@@ -0,0 +1,61 @@
+import sys
+import types
+import unittest
+import wave
+from unittest import mock
+
+import engines
+from engines import Pyttsx3Engine
+
+
+class FakeDriverEngine:
+    """模拟 pyttsx3 共享引擎, 合成结果的采样率取当前语速, 通道数取当前语音"""
+
+    def __init__(self):
+        self.properties = {"rate": 200, "volume": 1.0, "voice": 1}
+        self.pending = None
+
+    def getProperty(self, name):
+        return self.properties[name]
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def save_to_file(self, text, path):
+        self.pending = path
+
+    def runAndWait(self):
+        with wave.open(self.pending, "wb") as wav_file:
+            wav_file.setnchannels(self.properties["voice"])
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.properties["rate"])
+            wav_file.writeframes(b"\x00\x00" * self.properties["voice"])
+
+
+class TestPyttsx3Engine(unittest.TestCase):
+    def setUp(self):
+        shared = FakeDriverEngine()
+        fake_pyttsx3 = types.SimpleNamespace(init=lambda: shared)
+        patches = [
+            mock.patch.dict(sys.modules, {"pyttsx3": fake_pyttsx3}),
+            mock.patch.object(Pyttsx3Engine, "default_voice", None),
+            mock.patch.object(engines, "SHM_DIR", None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_voices_sharing_driver_keep_own_properties(self):
+        slow = Pyttsx3Engine(rate=8000)
+        fast = Pyttsx3Engine(rate=16000, voice=2)
+        # pyttsx3.init() 返回同一个引擎
+        self.assertIs(slow.engine, fast.engine)
+
+        self.assertEqual(slow.synthesize("好的")[1:], (8000, 1))
+        self.assertEqual(fast.synthesize("好的")[1:], (16000, 2))
+        # 未指定语音的音色使用默认语音, 不沿用上一个音色的语音
+        self.assertEqual(slow.synthesize("好的")[1:], (8000, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from prerender import Prerenderer, load_phrases
+
+
+class TestLoadPhrases(unittest.TestCase):
+    def test_dedup_and_missing_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "prerender.json")
+            self.assertEqual(load_phrases(path), [])
+
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"phrases": ["你好", " 你好 ", "", "再见"]}, f)
+            self.assertEqual(load_phrases(path), ["你好", "再见"])
+
+
+class TestPrerenderer(unittest.TestCase):
+    def test_job_counts(self):
+        async def render(text, voice, sample_rate, channels, frame_duration):
+            if text == "bad":
+                raise RuntimeError("合成失败")
+            return text != "cached"
+
+        async def run():
+            prerenderer = Prerenderer(render, concurrency=2)
+            job_id = prerenderer.submit(
+                ["a", "cached", "bad"], ["saike"], [(16000, 1, 60), (24000, 1, 60)], "api"
+            )
+            await asyncio.gather(*prerenderer.tasks.values())
+            return prerenderer.status(job_id)
+
+        job = asyncio.run(run())
+        self.assertEqual(job["state"], "done")
+        self.assertEqual(
+            (job["total"], job["rendered"], job["skipped"], job["failed"]), (6, 2, 2, 2)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
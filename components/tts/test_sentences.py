@@ -0,0 +1,56 @@
+import unittest
+
+from sentences import SENTENCE_MAX_CHARS, split_sentences
+
+
+class TestSplitSentences(unittest.TestCase):
+    def test_period_followed_by_space_splits(self):
+        self.assertEqual(
+            split_sentences("Hello world. How are you?"),
+            ["Hello world. ", "How are you?"],
+        )
+
+    def test_period_inside_token_does_not_split(self):
+        # 小数点, 缩写和域名中的句点后面没有空白
+        self.assertEqual(
+            split_sentences("温度是 3.5 度, 比昨天高。"), ["温度是 3.5 度, 比昨天高。"]
+        )
+        self.assertEqual(
+            split_sentences("他在 U.S.A 工作, 访问 www.example.com 查看。"),
+            ["他在 U.S.A 工作, 访问 www.example.com 查看。"],
+        )
+
+    def test_long_sentence_packs_clauses(self):
+        clause = "一二三四五六七八，"
+        text = clause * 2 + "一二三四五六七八。"
+        self.assertGreater(len(text), 20)
+        self.assertEqual(
+            split_sentences(text, max_chars=20),
+            [clause * 2, "一二三四五六七八。"],
+        )
+
+    def test_clause_longer_than_limit_is_cut(self):
+        text = "一二三四五六七八九十" * (SENTENCE_MAX_CHARS // 10) + "一二三"
+        pieces = split_sentences(text)
+        self.assertEqual(pieces, [text[:SENTENCE_MAX_CHARS], "一二三"])
+        self.assertEqual("".join(pieces), text)
+
+    def test_punctuation_only_fragment_merges_into_previous(self):
+        # 按最大长度切分后只剩句号, 并入前一段
+        self.assertEqual(
+            split_sentences("一二三四五六七八九十。", max_chars=10),
+            ["一二三四五六七八九十。"],
+        )
+        # 过短的片段同样并入前一句
+        self.assertEqual(split_sentences("好的。嗯。"), ["好的。嗯。"])
+
+    def test_trailing_punctuation_stays_with_sentence(self):
+        self.assertEqual(split_sentences("好的。！？”\n你好"), ["好的。！？”\n", "你好"])
+
+    def test_empty_input(self):
+        self.assertEqual(split_sentences(""), [])
+        self.assertEqual(split_sentences("   \n\t "), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+import engines
+import voices
+from voices import VoiceCache
+
+MB = 1024 * 1024
+
+
+class FakeEngine(engines.SpeechEngine):
+    def __init__(self, size):
+        self.size = size
+
+
+VOICES = {
+    name: {"engine": "fake", "options": {"size": 100 * MB}} for name in ("a", "b", "c")
+}
+
+
+class TestVoiceCache(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.dict(engines.ENGINES, {"fake": FakeEngine}),
+            mock.patch.object(voices, "rss_bytes", return_value=0),
+            mock.patch.object(voices, "model_bytes", side_effect=lambda o: o["size"]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_reuses_loaded_voice(self):
+        cache = VoiceCache(VOICES, 250 * MB)
+        engine = cache.get("a")
+        self.assertIs(cache.get("a"), engine)
+        self.assertEqual(cache.loads, 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = VoiceCache(VOICES, 250 * MB)
+        cache.get("a")
+        cache.get("b")
+        cache.get("a")
+        cache.get("c")
+
+        self.assertEqual(cache.loaded(), ["c", "a"])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_preload_stops_at_budget(self):
+        cache = VoiceCache(VOICES, 250 * MB)
+        cache.preload(["b", "a", "c"])
+
+        self.assertEqual(cache.loaded(), ["b", "a"])
+        # 预加载顺序靠后的音色先淘汰
+        cache.get("c")
+        self.assertEqual(cache.loaded(), ["c", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
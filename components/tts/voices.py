@@ -0,0 +1,149 @@
+"""
+工作进程内的音色引擎缓存
+
+
+模块功能
+1. 按音色 (会话的 tts_role) 保存已加载的合成引擎, 同一音色的后续任务直接复用
+2. 内存预算: 加载新音色后已加载引擎的内存估算超过预算时, 按最久未使用 (LRU) 顺序卸载,
+   当前使用的音色不卸载
+3. 预加载: 工作进程启动时按使用频率加载常用音色 (不超过内存预算), 请求路径上不需要加载
+
+音色配置 (见 main.py TTS_VOICES):
+    {音色名称: {"engine": 引擎名称, "options": 引擎构造参数}}
+
+示例:
+    >>> voices = VoiceCache({"saike": {"engine": "piper", "options": {...}}}, 512 * 1024 * 1024)
+    >>> voices.preload(["saike"])
+    >>> engine = voices.get("saike")
+"""
+
+import logging
+import os
+from collections import OrderedDict
+
+from engines import create_engine
+
+logger = logging.getLogger("tts_server.voices")
+
+# 无法通过 RSS 或模型文件估算内存时使用的默认值 (如平台语音引擎)
+DEFAULT_VOICE_BYTES = 16 * 1024 * 1024
+
+
+def rss_bytes() -> int:
+    """当前进程的常驻内存 (Linux), 不支持时返回 0"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def model_bytes(options: dict) -> int:
+    """音色配置中模型文件的大小之和"""
+    size = 0
+    for name in ("model_path", "config_path"):
+        path = options.get(name)
+        if path and os.path.isfile(path):
+            size += os.path.getsize(path)
+    return size
+
+
+class VoiceCache:
+    """
+    音色引擎 LRU 缓存 (每个工作进程一个)
+
+    参数:
+        voices (dict): 音色配置 {音色名称: {"engine": 引擎名称, "options": 引擎构造参数}}
+        memory_bytes (int): 已加载引擎的内存预算
+
+    注意:
+        引擎的内存占用取加载前后 RSS 的差值与模型文件大小中的较大值, 只作为淘汰依据的估算
+    """
+
+    def __init__(self, voices: dict, memory_bytes: int):
+        self.voices = voices
+        self.memory_bytes = memory_bytes
+        self.engines = OrderedDict()  # {音色名称: (引擎, 内存估算)}, 按使用时间排序
+
+        # 统计信息
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(size for _, size in self.engines.values())
+
+    def loaded(self) -> list:
+        """已加载的音色, 按最近使用排序"""
+        return list(reversed(self.engines))
+
+    def get(self, voice: str):
+        """
+        返回音色的引擎, 未加载时加载 (并按预算卸载其他音色)
+
+        异常:
+            KeyError: 未配置的音色
+        """
+        if voice in self.engines:
+            self.engines.move_to_end(voice)
+            return self.engines[voice][0]
+
+        engine = self.load(voice)
+        self.evict(keep=voice)
+        return engine
+
+    def load(self, voice: str):
+        """加载音色的引擎并记录内存估算 (不检查预算)"""
+        config = self.voices[voice]
+        options = config.get("options", {})
+        before = rss_bytes()
+        engine = create_engine(config["engine"], options)
+        size = max(rss_bytes() - before, model_bytes(options)) or DEFAULT_VOICE_BYTES
+        self.engines[voice] = (engine, size)
+        self.loads += 1
+        logger.info("音色已加载: %s, 内存估算: %.1f MB", voice, size / 1024 / 1024)
+        return engine
+
+    def evict(self, keep: str):
+        """超过内存预算时卸载最久未使用的音色 (keep 除外)"""
+        while self.used_bytes > self.memory_bytes and len(self.engines) > 1:
+            voice = next(iter(self.engines))
+            if voice == keep:
+                self.engines.move_to_end(voice)
+                continue
+            del self.engines[voice]
+            self.evictions += 1
+            logger.info("音色已卸载: %s", voice)
+
+    def preload(self, voices: list):
+        """
+        按顺序 (使用频率从高到低) 预加载音色, 超出内存预算时停止
+
+        注意:
+            - 至少加载一个音色, 即使超出预算
+            - 预加载失败的音色跳过, 不影响工作进程启动
+        """
+        for voice in voices:
+            if voice not in self.voices or voice in self.engines:
+                continue
+            try:
+                self.load(voice)
+            except Exception as e:
+                logger.error("音色预加载失败: %s - %s", voice, e)
+                continue
+            if self.used_bytes > self.memory_bytes and len(self.engines) > 1:
+                del self.engines[voice]
+                break
+
+        # 越常用的音色越晚淘汰
+        for voice in reversed(voices):
+            if voice in self.engines:
+                self.engines.move_to_end(voice)
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded(),
+            "used_bytes": self.used_bytes,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
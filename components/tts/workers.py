@@ -0,0 +1,568 @@
+"""
+TTS 合成工作进程池
+
+
+模块功能
+1. 启动多个合成工作进程, 每个进程持有独立的合成引擎 (见 engines.py, 引擎不是线程安全的, 不能跨任务共享)
+2. 每个工作进程按音色缓存已加载的引擎 (见 voices.py), 启动时预加载常用音色
+3. 合成任务进入有界队列, 由空闲的工作进程领取, 优先领取已加载音色的任务 (见 VoiceQueue),
+   吞吐量随工作进程数 (CPU 核数) 增长
+4. 健康检查: 工作进程空闲时定期 ping, 超时无响应或进程退出时重启 (重启后重新加载之前的音色)
+5. 合成超时 (引擎卡死) 时强制结束并重启工作进程, 当前任务返回失败
+
+工作进程通信 (multiprocessing.Pipe):
+    ("synthesize", (音色, text, 采样率, 通道数)) -> ("ok", 16 位 PCM 数据) / ("error", 错误信息)
+    ("stream", (音色, text, 采样率, 通道数))     -> ("chunk", 16 位 PCM 数据) ... ("ok", None) / ("error", 错误信息)
+    ("ping", None)       -> ("pong", None)
+    ("stop", None)       -> 进程退出
+    已加载的音色变化时, 工作进程在响应前先发送 ("voices", 音色缓存统计)
+
+示例:
+    >>> pool = SynthesisPool(workers=4, queue_size=32, job_timeout=30,
+    ...                      ping_interval=10, ping_timeout=5,
+    ...                      voices={"saike": {"engine": "piper", "options": {...}}},
+    ...                      default_voice="saike", memory_bytes=512 * 1024 * 1024)
+    >>> pool.start(preload=["saike"])
+    >>> pcm_data = await pool.synthesize("你好", 16000, 1, voice="saike")
+    >>> async for pcm_chunk in pool.synthesize_stream("你好", 16000, 1, voice="saike"):
+    ...     pass
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from engines import ENGINES, convert_pcm
+from voices import VoiceCache
+
+logger = logging.getLogger("tts_server.workers")
+
+# 工作进程启动 (每个预加载音色的引擎初始化) 的最长等待时间 (单位: 秒)
+WORKER_START_TIMEOUT = 30
+
+# 队首任务等待超过该时间后, 工作进程不再优先领取已加载音色的任务, 避免冷门音色的任务饿死 (单位: 秒)
+ROUTE_MAX_WAIT = 0.5
+
+
+#######################################################################
+#    工作进程
+#######################################################################
+
+
+def synthesis_worker(conn, voices: dict, memory_bytes: int, preload: list):
+    """
+    工作进程入口, 预加载音色后循环处理主进程发来的命令
+
+    参数:
+        conn (Connection): 与主进程通信的管道
+        voices (dict): 音色配置, 见 voices.py
+        memory_bytes (int): 已加载引擎的内存预算
+        preload (list[str]): 预加载的音色, 按优先级排序
+    """
+    voice_cache = VoiceCache(voices, memory_bytes)
+    voice_cache.preload(preload)
+    conn.send(("ready", {"pid": os.getpid(), **voice_cache.stats()}))
+
+    while True:
+        try:
+            command, payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if command == "stop":
+            break
+        if command == "ping":
+            conn.send(("pong", None))
+            continue
+
+        try:
+            voice, text, sample_rate, channels = payload
+            loaded = voice_cache.loaded()
+            engine = voice_cache.get(voice)
+            if set(voice_cache.loaded()) != set(loaded):
+                conn.send(("voices", voice_cache.stats()))
+
+            if command == "stream":
+                # 每块合成后立即转换为会话格式发送
+                for pcm_data, src_rate, src_channels in engine.synthesize_stream(text):
+                    conn.send(
+                        (
+                            "chunk",
+                            convert_pcm(pcm_data, src_rate, src_channels, sample_rate, channels),
+                        )
+                    )
+                conn.send(("ok", None))
+            else:
+                pcm_data, src_rate, src_channels = engine.synthesize(text)
+                conn.send(
+                    ("ok", convert_pcm(pcm_data, src_rate, src_channels, sample_rate, channels))
+                )
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class SynthesisWorker:
+    """
+    单个合成工作进程的句柄 (阻塞调用, 在线程池中执行)
+
+    参数:
+        index (int): 工作进程编号
+        voices (dict): 音色配置
+        memory_bytes (int): 已加载引擎的内存预算
+    """
+
+    def __init__(self, index, voices, memory_bytes):
+        self.index = index
+        self.voices = voices
+        self.memory_bytes = memory_bytes
+        self.preload = []  # 启动时预加载的音色
+        self.process = None
+        self.conn = None
+        self.voice_stats = {}  # 工作进程上报的音色缓存统计 (已加载的音色, 内存估算等)
+
+        # 统计信息
+        self.jobs = 0
+        self.failures = 0
+        self.restarts = 0
+        self.last_ok = 0.0
+
+    def start(self):
+        """启动工作进程并等待引擎初始化完成"""
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=synthesis_worker,
+            args=(child_conn, self.voices, self.memory_bytes, self.preload),
+            name=f"tts-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+        if not self.conn.poll(WORKER_START_TIMEOUT * max(1, len(self.preload))):
+            raise TimeoutError(f"TTS 工作进程 {self.index} 启动超时")
+        _, self.voice_stats = self.conn.recv()
+        self.last_ok = time.time()
+        logger.info(
+            "TTS 工作进程 %s 已启动, pid: %s, 已加载音色: %s",
+            self.index,
+            self.process.pid,
+            self.voice_stats.get("loaded"),
+        )
+
+    def stop(self, timeout: float = 1.0):
+        """结束工作进程 (先请求退出, 超时后强制结束)"""
+        if self.process is None:
+            return
+        try:
+            self.conn.send(("stop", None))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.process = None
+
+    def restart(self):
+        """强制结束并重新启动工作进程, 重新加载重启前已加载的音色"""
+        self.preload = self.loaded_voices() or self.preload
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+            self.process = None
+        self.restarts += 1
+        self.start()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def loaded_voices(self) -> list:
+        """已加载的音色, 按最近使用排序"""
+        return self.voice_stats.get("loaded", [])
+
+    def call(self, command: str, payload, timeout: float, on_chunk=None):
+        """
+        发送命令并等待响应
+
+        参数:
+            on_chunk (callable): 流式合成时每收到一块 PCM 数据调用一次
+
+        返回:
+            tuple: (状态, 数据)
+
+        异常:
+            TimeoutError: 超时未响应 (工作进程卡死), 流式合成时为两块之间的间隔超时
+            EOFError / BrokenPipeError: 工作进程已退出
+        """
+        self.conn.send((command, payload))
+        while True:
+            if not self.conn.poll(timeout):
+                raise TimeoutError(f"TTS 工作进程 {self.index} 响应超时: {command}")
+            status, data = self.conn.recv()
+            self.last_ok = time.time()
+            if status == "voices":
+                self.voice_stats = data
+            elif status != "chunk":
+                return status, data
+            elif on_chunk is not None:
+                on_chunk(data)
+
+
+#######################################################################
+#    任务队列
+#######################################################################
+
+
+class VoiceQueue:
+    """
+    按音色路由的有界任务队列
+
+    参数:
+        maxsize (int): 等待任务数上限, 队列满时 put 等待
+        max_wait (float): 见 ROUTE_MAX_WAIT
+
+    注意:
+        - 任务格式: (命令, (音色, text, 采样率, 通道数), future, 数据块队列, 入队时间)
+        - 工作进程领取时优先选择已加载音色的最早任务, 没有时领取队首任务 (按需加载音色)
+    """
+
+    def __init__(self, maxsize: int, max_wait: float = ROUTE_MAX_WAIT):
+        self.maxsize = maxsize
+        self.max_wait = max_wait
+        self.jobs = deque()
+        self.slots = asyncio.Semaphore(maxsize)
+        self.changed = asyncio.Event()
+
+        # 统计信息
+        self.warm = 0
+        self.cold = 0
+
+    def qsize(self) -> int:
+        return len(self.jobs)
+
+    async def put(self, job: tuple):
+        await self.slots.acquire()
+        self.jobs.append(job)
+        self.changed.set()
+
+    async def get(self, voices) -> tuple:
+        """
+        领取任务
+
+        参数:
+            voices (list[str]): 领取方已加载的音色
+        """
+        while True:
+            job = self.take(voices)
+            if job is not None:
+                self.slots.release()
+                if job[1][0] in voices:
+                    self.warm += 1
+                else:
+                    self.cold += 1
+                return job
+            self.changed.clear()
+            await self.changed.wait()
+
+    def take(self, voices):
+        """取出优先的任务, 队列为空时返回 None"""
+        if not self.jobs:
+            return None
+
+        head = self.jobs[0]
+        if head[1][0] in voices or time.monotonic() - head[4] > self.max_wait:
+            return self.jobs.popleft()
+
+        for index, job in enumerate(self.jobs):
+            if job[1][0] in voices:
+                del self.jobs[index]
+                return job
+        return self.jobs.popleft()
+
+    def stats(self) -> dict:
+        routed = self.warm + self.cold
+        return {
+            "queued": self.qsize(),
+            "queue_size": self.maxsize,
+            "warm": self.warm,
+            "cold": self.cold,
+            "warm_rate": round(self.warm / routed, 4) if routed else 0.0,
+        }
+
+
+#######################################################################
+#    工作进程池
+#######################################################################
+
+
+class SynthesisPool:
+    """
+    合成工作进程池
+
+    参数:
+        workers (int): 工作进程数量
+        queue_size (int): 等待队列长度上限, 队列满时 synthesize 等待
+        job_timeout (float): 单个合成任务的超时时间 (单位: 秒)
+        ping_interval (float): 工作进程空闲时的健康检查间隔 (单位: 秒)
+        ping_timeout (float): 健康检查超时时间 (单位: 秒)
+        voices (dict): 音色配置 {音色名称: {"engine": 引擎名称, "options": 引擎构造参数}}
+        default_voice (str): 会话音色未配置时使用的音色
+        memory_bytes (int): 每个工作进程已加载引擎的内存预算
+    """
+
+    def __init__(
+        self,
+        workers,
+        queue_size,
+        job_timeout,
+        ping_interval,
+        ping_timeout,
+        voices,
+        default_voice,
+        memory_bytes,
+    ):
+        self.job_timeout = job_timeout
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.voices = voices
+        self.default_voice = default_voice
+
+        self.workers = [
+            SynthesisWorker(i, voices, memory_bytes) for i in range(workers)
+        ]
+        self.queue = VoiceQueue(maxsize=queue_size)
+        self.executor = None
+        self.tasks = []
+
+    def start(self, preload: list = None):
+        """
+        启动所有工作进程 (阻塞, 在线程池中调用)
+
+        参数:
+            preload (list[str]): 预加载的音色, 按使用频率从高到低排序, 默认只加载默认音色
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=len(self.workers), thread_name_prefix="tts-worker"
+        )
+        for worker in self.workers:
+            worker.preload = list(preload or [self.default_voice])
+            worker.start()
+
+    def resolve(self, tts_role: str) -> str:
+        """会话音色对应的音色名称, 未配置的音色使用默认音色"""
+        return tts_role if tts_role in self.voices else self.default_voice
+
+    def streaming(self, voice: str) -> bool:
+        """音色的引擎是否支持增量输出"""
+        return ENGINES[self.voices[self.resolve(voice)]["engine"]].streaming
+
+    def run(self):
+        """启动各工作进程的任务分发协程 (需在事件循环中调用)"""
+        self.tasks = [
+            asyncio.create_task(self.worker_loop(worker)) for worker in self.workers
+        ]
+
+    async def synthesize(
+        self, text: str, sample_rate: int, channels: int, voice: str = None
+    ) -> bytes:
+        """
+        提交合成任务并等待结果
+
+        参数:
+            text (str): 待合成文本
+            sample_rate (int): 输出采样率
+            channels (int): 输出通道数
+            voice (str): 音色, 默认为默认音色
+
+        返回:
+            bytes: 16 位 PCM 数据 (工作进程内完成格式转换)
+
+        异常:
+            RuntimeError: 合成失败或工作进程超时
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(
+            (
+                "synthesize",
+                (self.resolve(voice), text, sample_rate, channels),
+                future,
+                None,
+                time.monotonic(),
+            )
+        )
+        return await future
+
+    async def synthesize_stream(
+        self, text: str, sample_rate: int, channels: int, voice: str = None
+    ):
+        """
+        提交流式合成任务, 逐块返回 16 位 PCM 数据
+
+        参数与 synthesize 相同
+
+        异常:
+            RuntimeError: 合成失败或工作进程超时 (已返回的数据块仍然有效)
+
+        注意:
+            不支持增量输出的引擎只返回一块 (整段)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        chunks = asyncio.Queue()
+        await self.queue.put(
+            (
+                "stream",
+                (self.resolve(voice), text, sample_rate, channels),
+                future,
+                chunks,
+                time.monotonic(),
+            )
+        )
+
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+            await future
+        finally:
+            # 调用方提前停止读取时, 工作进程继续完成当前任务, 结果丢弃
+            if not future.done():
+                future.cancel()
+
+    async def worker_loop(self, worker: SynthesisWorker):
+        """从队列领取任务交给指定工作进程, 空闲时执行健康检查"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                command, job, future, chunks, _ = await asyncio.wait_for(
+                    self.queue.get(worker.loaded_voices()), timeout=self.ping_interval
+                )
+            except asyncio.TimeoutError:
+                await self.health_check(worker)
+                continue
+
+            if future.cancelled():
+                continue
+
+            # 工作进程结果在线程池中接收, 数据块按接收顺序投递回事件循环
+            on_chunk = (
+                functools.partial(loop.call_soon_threadsafe, chunks.put_nowait)
+                if chunks is not None
+                else None
+            )
+
+            try:
+                status, result = await self.dispatch(worker, command, job, on_chunk)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                status, result = None, None
+            finally:
+                if chunks is not None:
+                    chunks.put_nowait(None)
+
+            if status is None or future.done():
+                continue
+            if status == "ok":
+                future.set_result(result)
+            else:
+                worker.failures += 1
+                future.set_exception(RuntimeError(f"TTS 合成失败: {result}"))
+
+    async def dispatch(self, worker: SynthesisWorker, command: str, job, on_chunk):
+        """
+        将任务交给工作进程执行
+
+        返回:
+            tuple: 工作进程的响应 (状态, 数据)
+
+        异常:
+            RuntimeError: 工作进程不可用, 超时或异常退出 (已重启)
+        """
+        if not worker.is_alive():
+            logger.warning("TTS 工作进程 %s 已退出, 重启", worker.index)
+            await self.restart(worker)
+            if not worker.is_alive():
+                raise RuntimeError("TTS 工作进程不可用")
+
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(
+                self.executor, worker.call, command, job, self.job_timeout, on_chunk
+            )
+        except Exception as e:
+            # 超时或进程异常退出, 重启后继续服务
+            worker.failures += 1
+            logger.error("TTS 工作进程 %s 异常, 重启: %s", worker.index, e)
+            await self.restart(worker)
+            raise RuntimeError(f"TTS 合成失败: {e}")
+
+        worker.jobs += 1
+        return response
+
+    async def health_check(self, worker: SynthesisWorker):
+        """ping 工作进程, 无响应时重启"""
+        loop = asyncio.get_running_loop()
+        try:
+            if not worker.is_alive():
+                raise EOFError("进程已退出")
+            await loop.run_in_executor(
+                self.executor, worker.call, "ping", None, self.ping_timeout
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("TTS 工作进程 %s 健康检查失败, 重启: %s", worker.index, e)
+            await self.restart(worker)
+
+    async def restart(self, worker: SynthesisWorker):
+        """重启工作进程, 失败时等待下一次健康检查重试"""
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, worker.restart
+            )
+        except Exception as e:
+            logger.error("TTS 工作进程 %s 重启失败: %s", worker.index, e)
+
+    def stats(self) -> dict:
+        """返回工作进程池统计信息"""
+        return {
+            **self.queue.stats(),
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid if worker.process else None,
+                    "alive": worker.is_alive(),
+                    "jobs": worker.jobs,
+                    "failures": worker.failures,
+                    "restarts": worker.restarts,
+                    "voices": worker.voice_stats,
+                    "idle_seconds": round(time.time() - worker.last_ok, 1),
+                }
+                for worker in self.workers
+            ],
+        }
+
+    async def shutdown(self):
+        """停止分发协程和所有工作进程"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self.executor, worker.stop) for worker in self.workers)
+        )
+        self.executor.shutdown(wait=False)
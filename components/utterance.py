@@ -0,0 +1,179 @@
+"""
+TTS 会话语音队列 (DAO, TTS, audio_io 共用)
+
+每个会话的回复按顺序排队, 每条语音 (utterance) 有独立的序号和记录, 互不覆盖:
+    tts_seq:{session_id}          : 序号计数器 (INCR, 从 1 开始)
+    tts_utterances:{session_id}   : 有序集合, 分数为序号, audio_io 按序号从小到大播放
+    tts:{session_id}:{seq}        : 语音记录 (hash), 字段见下
+    tts_stream:{session_id}:{seq} : 分句音频流 (TTS 分句流式合成时)
+
+语音记录字段:
+    seq, state, text, created (入队时间戳)
+    audio / opus             : 整段合成的音频 (PCM 记录 / 预编码 Opus 帧)
+    stream                   : 分句音频流的键
+    opus_sample_rate, opus_channels, opus_frame_duration : 预编码参数
+
+队列消息 (tts_input_queue / tts_output_queue): 语音ID "{session_id}:{seq}"
+
+状态流转:
+    queued -> synthesizing -> ready -> playing -> done
+    - 分句流式合成时, synthesizing 状态下音频流已可播放 (audio_io 可直接进入 playing)
+    - 合成失败或等待超时为 failed, audio_io 跳过
+    - 状态只通过 transition 按预期的原状态修改, 多个服务并发修改时不会互相覆盖
+    - 外部接口 (DAO PUT /tts) 只能设置 EXTERNAL_TRANSITIONS 中的状态
+"""
+
+import time
+
+STATE_QUEUED = "queued"
+STATE_SYNTHESIZING = "synthesizing"
+STATE_READY = "ready"
+STATE_PLAYING = "playing"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+# 外部接口可以设置的状态: {新状态: 允许的原状态}, 不允许回到 queued 或修改播放中的语音
+EXTERNAL_TRANSITIONS = {
+    STATE_READY: (STATE_QUEUED, STATE_SYNTHESIZING),  # 外部提供合成好的音频
+    STATE_FAILED: (STATE_QUEUED, STATE_SYNTHESIZING, STATE_READY),
+}
+
+UTTERANCE_EXPIRE = 600  # 语音记录和队列过期时间, 防止异常时残留 (单位: 秒)
+
+# 原状态在允许列表中时修改状态 (同时写入其余字段), 返回 1; 否则返回 0
+# ARGV: 新状态, 原状态数量 n, n 个原状态, 字段名和值交替
+TRANSITION_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state')
+if not state then
+    return 0
+end
+local count = tonumber(ARGV[2])
+for i = 3, 2 + count do
+    if state == ARGV[i] then
+        for j = 3 + count, #ARGV, 2 do
+            redis.call('HSET', KEYS[1], ARGV[j], ARGV[j + 1])
+        end
+        redis.call('HSET', KEYS[1], 'state', ARGV[1])
+        return 1
+    end
+end
+return 0
+"""
+
+
+#######################################################################
+#    键
+#######################################################################
+
+
+def utterance_id(session_id: str, seq: int) -> str:
+    return f"{session_id}:{seq}"
+
+
+def parse_utterance_id(value) -> tuple:
+    """解析语音ID, 返回 (session_id, seq)"""
+    if isinstance(value, bytes):
+        value = value.decode()
+    session_id, seq = value.rsplit(":", 1)
+    return session_id, int(seq)
+
+
+def record_key(session_id: str, seq: int) -> str:
+    return f"tts:{session_id}:{seq}"
+
+
+def index_key(session_id: str) -> str:
+    return f"tts_utterances:{session_id}"
+
+
+def seq_key(session_id: str) -> str:
+    return f"tts_seq:{session_id}"
+
+
+def stream_key(session_id: str, seq: int) -> str:
+    return f"tts_stream:{session_id}:{seq}"
+
+
+#######################################################################
+#    操作
+#######################################################################
+
+
+async def enqueue_utterance(
+    redis_conn,
+    session_id: str,
+    text: str,
+    queue_key: str,
+    state: str = STATE_QUEUED,
+    audio: bytes = b"",
+) -> int:
+    """
+    新建语音记录并加入会话队列
+
+    参数:
+        redis_conn: Redis 连接
+        session_id (str): 会话ID
+        text (str): 待合成文本
+        queue_key (str): 通知队列 (queued 状态为 TTS 输入队列, ready 状态为 TTS 输出队列)
+        state (str): 初始状态
+        audio (bytes): 已有的音频 (ready 状态)
+
+    返回:
+        int: 语音序号
+    """
+    seq = await redis_conn.incr(seq_key(session_id))
+    key = record_key(session_id, seq)
+
+    async with redis_conn.pipeline(transaction=True) as pipe:
+        pipe.hset(
+            key,
+            mapping={
+                "seq": seq,
+                "state": state,
+                "text": text,
+                "audio": audio,
+                "created": time.time(),
+            },
+        )
+        pipe.expire(key, UTTERANCE_EXPIRE)
+        pipe.zadd(index_key(session_id), {seq: seq})
+        pipe.expire(index_key(session_id), UTTERANCE_EXPIRE)
+        pipe.expire(seq_key(session_id), UTTERANCE_EXPIRE)
+        pipe.lpush(queue_key, utterance_id(session_id, seq))
+        await pipe.execute()
+
+    return seq
+
+
+async def transition(
+    redis_conn, session_id: str, seq: int, from_states, to_state: str, fields: dict = None
+) -> bool:
+    """
+    修改语音状态
+
+    参数:
+        from_states (tuple[str]): 允许的原状态
+        to_state (str): 新状态
+        fields (dict): 可选, 与状态一起原子写入的其他字段 (如音频)
+
+    返回:
+        bool: 原状态不在允许列表中 (或记录不存在) 时返回 False, 不修改
+    """
+    args = [to_state, len(from_states), *from_states]
+    for name, value in (fields or {}).items():
+        args.extend((name, value))
+    result = await redis_conn.eval(TRANSITION_SCRIPT, 1, record_key(session_id, seq), *args)
+    return result == 1
+
+
+async def remove_utterance(redis_conn, session_id: str, seq: int):
+    """删除语音记录和音频流, 并移出会话队列"""
+    async with redis_conn.pipeline(transaction=True) as pipe:
+        pipe.delete(record_key(session_id, seq), stream_key(session_id, seq))
+        pipe.zrem(index_key(session_id), seq)
+        await pipe.execute()
+
+
+async def list_utterances(redis_conn, session_id: str) -> list:
+    """按顺序返回会话队列中的语音序号"""
+    return [int(seq) for seq in await redis_conn.zrange(index_key(session_id), 0, -1)]